@@ -1,24 +1,143 @@
 import hashlib as hasher
 import datetime as date
+import calendar
+import time
+import struct
+import binascii
+import json
+
+# a block is a fixed size header and a body (the data). the header carries
+# the index, the timestamp (integer seconds since the epoch), the hash of
+# the previous block, the digest of the body and a nonce, as raw bytes, in
+# a fixed layout. the hash of a block is the sha256 of its header, so it
+# takes a single, small sha256 call, no matter how big the data is : the
+# body is hashed once, into the header's data digest.
+#
+# the nonce goes last, so that the hash of headers which differ only in
+# their nonce (i.e. while mining) can start from the same sha256 state, w/
+# the rest of the header already in it.
+HEADER = struct.Struct('!QQ32s32sQ')
+HEADER_SIZE = HEADER.size
+# the header up to the nonce
+NONCE_OFFSET = HEADER_SIZE - 8
+NONCE = struct.Struct('!Q')
+MAX_NONCE = 2**64 - 1
+HASH_SIZE = 32
+
+# a serialized block is its header, the length of its body, and the body
+BODY_LENGTH = struct.Struct('!I')
+
+# integer seconds since the epoch, of a datetime (naive ones are taken as
+# local time) or of a nr. of seconds
+def to_timestamp(timestamp):
+
+  if isinstance(timestamp, date.datetime):
+    if timestamp.utcoffset() is not None:
+      return calendar.timegm(timestamp.utctimetuple())
+    return int(time.mktime(timestamp.timetuple()))
+
+  return int(timestamp)
+
+# raw bytes of a hex hash. shorter hashes are padded w/ leading zeros, so
+# that e.g. the genesis block's previous hash can be "0".
+def hash_bytes(hex_hash):
+
+  if len(hex_hash) > 2 * HASH_SIZE:
+    raise ValueError('invalid hash : %s' % (hex_hash))
+
+  return binascii.unhexlify(hex_hash.rjust(2 * HASH_SIZE, '0'))
+
+# bytes of a block's data : strings as they are (unicode in utf-8),
+# anything else as canonical json
+def serialize_data(data):
+
+  if isinstance(data, str):
+    return data
+  if isinstance(data, unicode):
+    return data.encode('utf-8')
+
+  return json.dumps(data, sort_keys = True, separators = (',', ':'))
+
+def hash_header(header):
+  return hasher.sha256(header).hexdigest()
+
+# proof-of-work : a block of difficulty d has a hash w/ (at least) d leading
+# zero bits, i.e. a hash < 2^(256 - d). the target is the raw bytes of
+# 2^(256 - d), so that raw hashes can be checked against it w/ a plain
+# (byte string) comparison.
+MAX_DIFFICULTY = 8 * HASH_SIZE - 1
+
+def target(difficulty):
+
+  if difficulty < 1 or difficulty > MAX_DIFFICULTY:
+    raise ValueError('difficulty must be within [1, %d] : %d' % (MAX_DIFFICULTY, difficulty))
+
+  return binascii.unhexlify('%064x' % (2 ** (8 * HASH_SIZE - difficulty)))
 
 # define what a iot accountability block is
 class Block:
 
-  def __init__(self, index, timestamp, data, previous_hash):
+  def __init__(self, index, timestamp, data, previous_hash, nonce = 0):
 
     self.index = index
-    self.timestamp = timestamp
-    
-    # FIXME: it's important to define what this will be, 
-    # but essentially i'm thinking of it as something 
+    self.timestamp = to_timestamp(timestamp)
+
+    # FIXME: it's important to define what this will be,
+    # but essentially i'm thinking of it as something
     # which represents an iot transaction
     self.data = data
+    # the body is hashed once, here
+    self.body = serialize_data(data)
+    self.data_digest = hasher.sha256(self.body).digest()
 
     self.previous_hash = previous_hash
+    self.nonce = nonce
     self.hash = self.hash_block()
-  
+
+  # the header up to (but w/o) the nonce
+  def header_prefix(self):
+    return self.header()[:NONCE_OFFSET]
+
+  def header(self):
+    return HEADER.pack(self.index, self.timestamp, hash_bytes(self.previous_hash),
+      self.data_digest, self.nonce)
+
   def hash_block(self):
-    sha = hasher.sha256()
-    sha.update(str(self.index) + str(self.timestamp) + str(self.data) + str(self.previous_hash))
+    return hash_header(self.header())
+
+  # does the block's hash meet a target (see target())?
+  def meets_target(self, block_target):
+    return binascii.unhexlify(self.hash) < block_target
+
+  # sets the nonce, and updates the hash
+  def set_nonce(self, nonce):
+    self.nonce = nonce
+    self.hash = self.hash_block()
+
+  def serialize(self):
+    return self.header() + BODY_LENGTH.pack(len(self.body)) + self.body
+
+  # the block serialized in buffer (at offset), and the offset of whatever
+  # follows it. the data of the block is the body, as bytes. raises a
+  # ValueError if the buffer is too short, or the body doesn't match the
+  # header's data digest.
+  @classmethod
+  def deserialize(cls, buffer, offset = 0):
+
+    if len(buffer) - offset < HEADER_SIZE + BODY_LENGTH.size:
+      raise ValueError('incomplete block header')
+
+    index, timestamp, previous_hash, data_digest, nonce = HEADER.unpack_from(buffer, offset)
+    body_length = BODY_LENGTH.unpack_from(buffer, offset + HEADER_SIZE)[0]
+
+    body_start = offset + HEADER_SIZE + BODY_LENGTH.size
+    if len(buffer) - body_start < body_length:
+      raise ValueError('incomplete block body')
+
+    block = cls(index, timestamp, str(buffer[body_start:body_start + body_length]),
+      binascii.hexlify(previous_hash), nonce)
+
+    if block.data_digest != data_digest:
+      raise ValueError('block %d : body doesn\'t match the data digest' % (index))
 
-    return sha.hexdigest()
+    return block, body_start + body_length
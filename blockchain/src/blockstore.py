@@ -0,0 +1,514 @@
+import os
+import sys
+import argparse
+import struct
+import mmap
+import zlib
+import time
+import binascii
+import hashlib as hasher
+
+# custom imports
+import blockchain as bc
+
+# persistent, append-only block store : a directory w/ 3 files
+#
+#   blocks.dat  : the segment, i.e. a header (SEGMENT_MAGIC and the
+#                 difficulty of the blocks in the store), followed by a
+#                 record per block : the length and crc32 of the serialized
+#                 block (see Block.serialize()), and the serialized block
+#   heights.idx : offset of each block's record in the segment, by height
+#                 (i.e. the block's index), as a flat array of '!Q'
+#   hashes.idx  : hash -> height index, as an open addressing hash table
+#                 (linear probing) of (raw block hash, height + 1) slots,
+#                 twice as large as the nr. of entries, at least
+#
+# all 3 are read through mmap(), so that opening a store doesn't read (or
+# keep in memory) any of it, however long the chain : blocks are read
+# from the segment as they're asked for, and blocks() streams them.
+#
+# blocks are appended to the segment first, then to the indexes. the
+# segment is the reference : after a crash, a torn record at the end of
+# the segment is truncated, index entries pointing past the end of the
+# segment are dropped, and complete records w/o an index entry are indexed.
+# only the tail of the segment is checked, so recovery doesn't depend on
+# the length of the chain. stale entries left in the hash table point to
+# heights which no longer hold a block w/ that hash, and are ignored.
+#
+# a store opened read-only (e.g. by validator.py) is never modified : all 3
+# files are mapped read-only, and recovery only changes its view of them,
+# i.e. heights.idx is trusted up to the last verified record, complete
+# records w/o an index entry are indexed in memory, and a torn record is
+# left in place (and ignored).
+#
+# the difficulty is set when the store is created (0, i.e. no proof-of-work,
+# by default), and every block but the genesis block must meet it : a store
+# can't be opened w/ a different difficulty, nor take blocks which don't
+# meet it, so that all its blocks can be validated against the same target.
+
+SEGMENT_FILE = 'blocks.dat'
+HEIGHTS_FILE = 'heights.idx'
+HASHES_FILE = 'hashes.idx'
+
+SEGMENT_MAGIC = 'BLKSTOR2'
+SEGMENT_HEADER = struct.Struct('!8sB')
+RECORD = struct.Struct('!II')
+OFFSET = struct.Struct('!Q')
+
+# hash table header : magic, nr. of slots, nr. of used slots and nr. of
+# heights indexed (i.e. heights [0, nr. of heights) are in the table)
+HASHES_MAGIC = 'BLKHASH1'
+HASHES_HEADER = struct.Struct('!8sQQQ')
+SLOT = struct.Struct('!32sQ')
+MIN_SLOTS = 1024
+
+def checksum(data):
+  return zlib.crc32(data) & 0xffffffff
+
+# an append-only file, read through mmap(). the map is extended (i.e.
+# re-created) when reading past its end.
+class MappedFile:
+
+  def __init__(self, path, magic = '', read_only = False):
+
+    self.path = path
+    self.read_only = read_only
+    self.file = open(path, 'rb' if read_only else 'a+b')
+    self.file.seek(0, os.SEEK_END)
+    self.size = self.file.tell()
+    self.mm = None
+    self.mapped = 0
+
+    if self.size == 0 and magic and not read_only:
+      self.append(magic)
+
+  def append(self, data):
+
+    offset = self.size
+    self.file.write(data)
+    self.size += len(data)
+
+    return offset
+
+  def flush(self, sync = False):
+
+    self.file.flush()
+    if sync:
+      os.fsync(self.file.fileno())
+
+  def read(self, offset, length):
+
+    if offset + length > self.mapped:
+
+      self.file.flush()
+      if self.mm is not None:
+        self.mm.close()
+
+      self.mm = mmap.mmap(self.file.fileno(), self.size, access = mmap.ACCESS_READ)
+      self.mapped = self.size
+
+    return self.mm[offset:offset + length]
+
+  # a read-only file is only cut short in memory, i.e. whatever is past
+  # size is ignored
+  def truncate(self, size):
+
+    if self.mm is not None:
+      self.mm.close()
+      self.mm = None
+      self.mapped = 0
+
+    if not self.read_only:
+      self.file.flush()
+      self.file.truncate(size)
+    self.size = size
+
+  def close(self):
+
+    if self.mm is not None:
+      self.mm.close()
+    self.file.close()
+
+# hash -> height index, in a hash table mapped in memory (see above). the
+# table doubles (i.e. is re-built) once it's half full.
+class HashIndex:
+
+  def __init__(self, path, read_only = False):
+
+    self.path = path
+    self.read_only = read_only
+
+    if not os.path.exists(path):
+      if read_only:
+        raise ValueError('no hash index at %s' % (path))
+      self.create(path, MIN_SLOTS)
+
+    self.open()
+
+  @staticmethod
+  def create(path, nr_slots):
+
+    with open(path, 'wb') as f:
+      f.write(HASHES_HEADER.pack(HASHES_MAGIC, nr_slots, 0, 0))
+      f.truncate(HASHES_HEADER.size + nr_slots * SLOT.size)
+
+  def open(self):
+
+    if self.read_only:
+      self.file = open(self.path, 'rb')
+      self.mm = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+    else:
+      self.file = open(self.path, 'r+b')
+      self.mm = mmap.mmap(self.file.fileno(), 0)
+
+    magic, self.nr_slots, self.nr_used, self.nr_heights = HASHES_HEADER.unpack_from(self.mm, 0)
+    if magic != HASHES_MAGIC or len(self.mm) != HASHES_HEADER.size + self.nr_slots * SLOT.size:
+      raise ValueError('%s is not a hash index' % (self.path))
+
+  def save_header(self):
+    HASHES_HEADER.pack_into(self.mm, 0, HASHES_MAGIC, self.nr_slots, self.nr_used, self.nr_heights)
+
+  # the 1st slot of a hash is picked by its last 8 bytes (the first ones are
+  # zeros, in mined blocks)
+  def slot_offset(self, raw_hash, i):
+    start = (OFFSET.unpack_from(raw_hash, bc.HASH_SIZE - OFFSET.size)[0] + i) % self.nr_slots
+    return HASHES_HEADER.size + start * SLOT.size
+
+  # the height of raw_hash, if in the table (but possibly stale)
+  def get(self, raw_hash):
+
+    for i in xrange(self.nr_slots):
+
+      offset = self.slot_offset(raw_hash, i)
+      slot_hash, height = SLOT.unpack_from(self.mm, offset)
+
+      if slot_hash == raw_hash:
+        return height - 1
+      if height == 0:
+        return None
+
+    return None
+
+  def put(self, raw_hash, height):
+
+    if 2 * (self.nr_used + 1) > self.nr_slots:
+      self.resize(2 * self.nr_slots)
+
+    for i in xrange(self.nr_slots):
+
+      offset = self.slot_offset(raw_hash, i)
+      slot_hash, slot_height = SLOT.unpack_from(self.mm, offset)
+
+      if slot_height == 0 or slot_hash == raw_hash:
+        if slot_height == 0:
+          self.nr_used += 1
+        SLOT.pack_into(self.mm, offset, raw_hash, height + 1)
+        return
+
+  def resize(self, nr_slots):
+
+    entries = []
+    for i in xrange(self.nr_slots):
+      slot_hash, height = SLOT.unpack_from(self.mm, HASHES_HEADER.size + i * SLOT.size)
+      if height > 0:
+        entries.append((slot_hash, height - 1))
+
+    nr_heights = self.nr_heights
+    self.close()
+
+    # the new table replaces the old one once it's complete
+    path = self.path + '.tmp'
+    self.create(path, nr_slots)
+    os.rename(path, self.path)
+    self.open()
+
+    for raw_hash, height in entries:
+      self.put(raw_hash, height)
+
+    self.nr_heights = nr_heights
+    self.save_header()
+
+  def flush(self, sync = False):
+
+    self.save_header()
+    if sync:
+      self.mm.flush()
+
+  def close(self):
+
+    self.mm.close()
+    self.file.close()
+
+class BlockStore:
+
+  # w/ read_only, the store must exist, and is never modified (see above).
+  # w/ difficulty, the store's blocks must be of that difficulty (or it's
+  # created w/ it).
+  def __init__(self, path, read_only = False, difficulty = None):
+
+    self.path = path
+    self.read_only = read_only
+
+    if not os.path.isdir(path):
+      if read_only:
+        raise ValueError('no block store at %s' % (path))
+      os.makedirs(path)
+
+    for name in [SEGMENT_FILE, HEIGHTS_FILE]:
+      if read_only and not os.path.exists(os.path.join(path, name)):
+        raise ValueError('%s is not a block store' % (path))
+
+    # out of range difficulties raise a ValueError
+    if difficulty:
+      bc.target(difficulty)
+
+    self.segment = MappedFile(os.path.join(path, SEGMENT_FILE),
+      SEGMENT_HEADER.pack(SEGMENT_MAGIC, difficulty if difficulty else 0), read_only)
+    if self.segment.size < SEGMENT_HEADER.size:
+      raise ValueError('%s is not a block store' % (path))
+
+    magic, self.difficulty = SEGMENT_HEADER.unpack(self.segment.read(0, SEGMENT_HEADER.size))
+    if magic != SEGMENT_MAGIC:
+      raise ValueError('%s is not a block store' % (path))
+
+    if difficulty is not None and difficulty != self.difficulty:
+      raise ValueError('%s holds blocks of difficulty %d, not %d' % (path, self.difficulty, difficulty))
+
+    self.target = bc.target(self.difficulty) if self.difficulty else None
+
+    self.heights = MappedFile(os.path.join(path, HEIGHTS_FILE), read_only = read_only)
+    self.hashes = HashIndex(os.path.join(path, HASHES_FILE), read_only)
+
+    # offsets of complete records past the end of heights.idx (read-only
+    # stores only : others index them)
+    self.unindexed = []
+    # nr. of bytes of a torn record at the end of the segment, if any
+    # (truncated, unless the store is read-only)
+    self.torn = 0
+    self.recover()
+
+  def __len__(self):
+    return self.heights.size // OFFSET.size + len(self.unindexed)
+
+  # the serialized block at offset in the segment, if its record is
+  # complete, has the right checksum, and holds the block of height
+  def read_record(self, offset, height):
+
+    if offset + RECORD.size > self.segment.size:
+      return None
+
+    length, crc = RECORD.unpack(self.segment.read(offset, RECORD.size))
+    if offset + RECORD.size + length > self.segment.size or length < bc.HEADER_SIZE:
+      return None
+
+    data = self.segment.read(offset + RECORD.size, length)
+    if checksum(data) != crc or OFFSET.unpack_from(data)[0] != height:
+      return None
+
+    return data
+
+  def recover(self):
+
+    # a partially written index entry
+    nr_blocks = len(self)
+    if self.heights.size != nr_blocks * OFFSET.size:
+      self.heights.truncate(nr_blocks * OFFSET.size)
+
+    # index entries of blocks which didn't make it to the segment
+    end = SEGMENT_HEADER.size
+    while nr_blocks > 0:
+
+      offset = self.offset(nr_blocks - 1)
+      data = self.read_record(offset, nr_blocks - 1)
+      if data is not None:
+        end = offset + RECORD.size + len(data)
+        break
+
+      nr_blocks -= 1
+
+    if nr_blocks < len(self):
+      self.heights.truncate(nr_blocks * OFFSET.size)
+
+    # blocks which made it to the segment, but not to the index
+    while True:
+
+      data = self.read_record(end, nr_blocks)
+      if data is None:
+        break
+
+      if self.read_only:
+        self.unindexed.append(end)
+      else:
+        self.heights.append(OFFSET.pack(end))
+      end += RECORD.size + len(data)
+      nr_blocks += 1
+
+    # a torn record
+    if end < self.segment.size:
+      self.torn = self.segment.size - end
+      self.segment.truncate(end)
+
+    if self.read_only:
+      return
+
+    # heights missing from the hash index
+    self.hashes.nr_heights = min(self.hashes.nr_heights, nr_blocks)
+    for height in xrange(self.hashes.nr_heights, nr_blocks):
+      self.hashes.put(self.raw_hash(height), height)
+
+    self.hashes.nr_heights = nr_blocks
+    self.flush()
+
+  def offset(self, height):
+
+    nr_indexed = self.heights.size // OFFSET.size
+    if height >= nr_indexed:
+      return self.unindexed[height - nr_indexed]
+
+    return OFFSET.unpack(self.heights.read(height * OFFSET.size, OFFSET.size))[0]
+
+  # the serialized block at height
+  def read(self, height):
+
+    if height < 0:
+      height += len(self)
+    if height < 0 or height >= len(self):
+      raise IndexError('no block at height %d' % (height))
+
+    offset = self.offset(height)
+    length = RECORD.unpack(self.segment.read(offset, RECORD.size))[0]
+
+    return self.segment.read(offset + RECORD.size, length)
+
+  def raw_hash(self, height):
+
+    offset = self.offset(height)
+    return hasher.sha256(self.segment.read(offset + RECORD.size, bc.HEADER_SIZE)).digest()
+
+  def __getitem__(self, height):
+    return bc.Block.deserialize(self.read(height))[0]
+
+  # the height of the block w/ a given (hex) hash, or None
+  def height(self, block_hash):
+
+    raw_hash = bc.hash_bytes(block_hash)
+    height = self.hashes.get(raw_hash)
+
+    if height is not None and height < len(self) and self.raw_hash(height) == raw_hash:
+      return height
+
+    # a read-only store can't add the heights missing from the hash index,
+    # so these are checked one by one
+    if self.read_only:
+      for height in xrange(min(self.hashes.nr_heights, len(self)), len(self)):
+        if self.raw_hash(height) == raw_hash:
+          return height
+
+    return None
+
+  def get(self, block_hash):
+
+    height = self.height(block_hash)
+    return self[height] if height is not None else None
+
+  # appends a block, whose index must be the next height. w/ sync, the
+  # block is on disk once this returns.
+  def append(self, block, sync = False):
+
+    if self.read_only:
+      raise ValueError('%s is read-only' % (self.path))
+
+    if block.index != len(self):
+      raise ValueError('block %d can\'t be appended at height %d' % (block.index, len(self)))
+
+    # the genesis block isn't mined
+    if self.target is not None and block.index > 0 and not block.meets_target(self.target):
+      raise ValueError('block %d doesn\'t meet the store\'s difficulty (%d)' % (block.index, self.difficulty))
+
+    data = block.serialize()
+    offset = self.segment.append(RECORD.pack(len(data), checksum(data)) + data)
+    self.segment.flush(sync)
+
+    self.heights.append(OFFSET.pack(offset))
+    self.heights.flush(sync)
+
+    self.hashes.put(binascii.unhexlify(block.hash), block.index)
+    self.hashes.nr_heights = len(self)
+    self.hashes.flush(sync)
+
+  # streams blocks, from height start on
+  def blocks(self, start = 0):
+
+    for height in xrange(start, len(self)):
+      yield self[height]
+
+  def flush(self, sync = False):
+
+    if self.read_only:
+      return
+
+    self.segment.flush(sync)
+    self.heights.flush(sync)
+    self.hashes.flush(sync)
+
+  def close(self):
+
+    self.flush()
+    self.segment.close()
+    self.heights.close()
+    self.hashes.close()
+
+if __name__ == "__main__":
+
+    # use an ArgumentParser for a nice CLI
+    parser = argparse.ArgumentParser()
+
+    # options (self-explanatory)
+    parser.add_argument(
+        "store",
+         help = """directory of the block store""")
+
+    parser.add_argument(
+        "--lookup",
+         help = """look up the block w/ (hex) hash <lookup>""")
+
+    parser.add_argument(
+        "--scan",
+         help = """read (and check the data digest of) every block in the store""",
+         action = "store_true")
+
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.store):
+      sys.stderr.write("""%s: [ERROR] no block store at %s\n""" % (sys.argv[0], args.store))
+      sys.exit(1)
+
+    start_time = time.time()
+    store = BlockStore(args.store)
+    print('opened %s in %.3f ms : %d blocks, %d bytes, difficulty %d' % (args.store, (time.time() - start_time) * 1000.0,
+      len(store), store.segment.size, store.difficulty))
+
+    if store.torn:
+      print('[WARNING] truncated a torn record of %d bytes' % (store.torn))
+
+    if len(store):
+      print('tip : block %d, hash %s' % (len(store) - 1, store[-1].hash))
+
+    if args.lookup:
+      start_time = time.time()
+      block = store.get(args.lookup)
+      if block is None:
+        print('no block w/ hash %s (%.3f ms)' % (args.lookup, (time.time() - start_time) * 1000.0))
+      else:
+        print('block %d : %s (%.3f ms)' % (block.index, block.data, (time.time() - start_time) * 1000.0))
+
+    if args.scan:
+      start_time = time.time()
+      nr_blocks = 0
+      for block in store.blocks():
+        nr_blocks += 1
+      duration = time.time() - start_time
+      print('scanned %d blocks in %.3f sec (%.1f blocks/sec)' % (nr_blocks, duration,
+        nr_blocks / duration if duration > 0.0 else 0.0))
+
+    store.close()
@@ -0,0 +1,218 @@
+import sys
+import argparse
+import multiprocessing
+import hashlib as hasher
+import time
+import datetime as date
+
+# custom imports
+import blockchain as bc
+
+# proof-of-work miner : looks for a nonce which gives a block a hash below
+# the target of a given difficulty (see blockchain.target()), on a pool of
+# worker processes, each searching its own share of the nonce space.
+#
+# the header up to the nonce doesn't change while mining, so it's hashed
+# once per block (the sha256 'midstate'), and each attempt copies that
+# state and only hashes the 8 bytes of the nonce. as soon as a worker finds
+# a nonce, it tells the others to stop (w/ a shared event), which they
+# check every CHECK_INTERVAL attempts.
+
+CHECK_INTERVAL = 4096
+# nonces searched : xrange() only takes C longs
+NONCE_SPACE = min(bc.MAX_NONCE + 1, sys.maxint)
+
+# tries nonces in [start, end) until one meets the target, or cancel is
+# set. returns the nonce (or None), and the nr. of attempts.
+def search(prefix, start, end, block_target, cancel):
+
+  midstate = hasher.sha256(prefix)
+  pack = bc.NONCE.pack
+  attempts = 0
+
+  for chunk_start in xrange(start, end, CHECK_INTERVAL):
+
+    if cancel.is_set():
+      break
+
+    chunk_end = min(chunk_start + CHECK_INTERVAL, end)
+    for nonce in xrange(chunk_start, chunk_end):
+
+      sha = midstate.copy()
+      sha.update(pack(nonce))
+
+      if sha.digest() < block_target:
+        cancel.set()
+        return nonce, attempts + nonce - chunk_start + 1
+
+    attempts += chunk_end - chunk_start
+
+  return None, attempts
+
+# a worker process : takes (job id, header prefix, start, end, target) jobs
+# from its own queue, until it gets None, and puts (job id, worker, nonce,
+# nr. of attempts, duration) results in the shared queue
+def run_worker(index, jobs, results, cancel):
+
+  while True:
+
+    job = jobs.get()
+    if job is None:
+      return
+
+    job_id, prefix, start, end, block_target = job
+
+    start_time = time.time()
+    nonce, attempts = search(prefix, start, end, block_target, cancel)
+    results.put((job_id, index, nonce, attempts, time.time() - start_time))
+
+class Miner:
+
+  # a worker per core, by default
+  def __init__(self, difficulty, nr_workers = None):
+
+    if nr_workers is None:
+      nr_workers = multiprocessing.cpu_count()
+
+    self.difficulty = difficulty
+    self.target = bc.target(difficulty)
+    self.nr_workers = nr_workers
+
+    self.cancel = multiprocessing.Event()
+    self.results = multiprocessing.Queue()
+    self.jobs = []
+    self.workers = []
+    self.job_id = 0
+
+    for i in xrange(nr_workers):
+
+      jobs = multiprocessing.Queue()
+      worker = multiprocessing.Process(target = run_worker, args = (i, jobs, self.results, self.cancel))
+      worker.daemon = True
+      worker.start()
+
+      self.jobs.append(jobs)
+      self.workers.append(worker)
+
+  # finds a nonce for block (and sets it). returns the mining stats : nr.
+  # of attempts, duration, and hashes/sec, overall and per worker (i.e.
+  # per core). raises a ValueError if no nonce meets the target.
+  def mine(self, block):
+
+    prefix = block.header_prefix()
+
+    # all workers are done w/ the previous job by now
+    self.cancel.clear()
+    self.job_id += 1
+
+    span = NONCE_SPACE // self.nr_workers
+    for i, jobs in enumerate(self.jobs):
+      end = (i + 1) * span if i < self.nr_workers - 1 else NONCE_SPACE
+      jobs.put((self.job_id, prefix, i * span, end, self.target))
+
+    start_time = time.time()
+
+    nonce = None
+    attempts = 0
+    worker_rates = [0.0] * self.nr_workers
+
+    for i in xrange(self.nr_workers):
+
+      job_id, worker, found, worker_attempts, duration = self.results.get()
+
+      if found is not None and nonce is None:
+        nonce = found
+
+      attempts += worker_attempts
+      worker_rates[worker] = worker_attempts / duration if duration > 0.0 else 0.0
+
+    duration = time.time() - start_time
+
+    if nonce is None:
+      raise ValueError('block %d : no nonce meets difficulty %d' % (block.index, self.difficulty))
+
+    block.set_nonce(nonce)
+
+    stats = {}
+    stats['nonce'] = nonce
+    stats['attempts'] = attempts
+    stats['duration'] = duration
+    stats['hashes_per_sec'] = attempts / duration if duration > 0.0 else 0.0
+    stats['worker_hashes_per_sec'] = worker_rates
+
+    return stats
+
+  def close(self):
+
+    self.cancel.set()
+    for jobs in self.jobs:
+      jobs.put(None)
+    for worker in self.workers:
+      worker.join()
+
+if __name__ == "__main__":
+
+    # use an ArgumentParser for a nice CLI
+    parser = argparse.ArgumentParser()
+
+    # options (self-explanatory)
+    parser.add_argument(
+        "--difficulty",
+         help = """nr. of leading zero bits of block hashes (default : 20)""")
+
+    parser.add_argument(
+        "--workers",
+         help = """comma-separated list of nr. of worker processes to mine w/ (default : 1,2,...,<nr. of cores>)""")
+
+    parser.add_argument(
+        "--num-blocks",
+         help = """nr. of blocks to mine w/ each nr. of workers (default : 4)""")
+
+    args = parser.parse_args()
+
+    difficulty = int(args.difficulty) if args.difficulty else 20
+    nr_blocks = int(args.num_blocks) if args.num_blocks else 4
+
+    if args.workers:
+      worker_counts = [ int(w) for w in args.workers.split(',') ]
+    else:
+      worker_counts = range(1, multiprocessing.cpu_count() + 1)
+
+    try:
+      bc.target(difficulty)
+    except ValueError, e:
+      sys.stderr.write("""%s: [ERROR] %s\n""" % (sys.argv[0], e.args[0]))
+      parser.print_help()
+      sys.exit(1)
+
+    # mines the same blocks w/ each nr. of workers, and compares hashes/sec
+    print('%8s %12s %14s %14s %8s' % ('workers', 'avg. time (s)', 'hashes/sec', 'per core', 'speedup'))
+
+    base_rate = None
+    for nr_workers in worker_counts:
+
+      miner = Miner(difficulty, nr_workers)
+
+      attempts = 0
+      duration = 0.0
+      worker_rates = []
+
+      previous_hash = '0'
+      for index in xrange(nr_blocks):
+
+        block = bc.Block(index, date.datetime.now(), 'block %d' % (index), previous_hash)
+        stats = miner.mine(block)
+
+        attempts += stats['attempts']
+        duration += stats['duration']
+        worker_rates.extend(stats['worker_hashes_per_sec'])
+        previous_hash = block.hash
+
+      miner.close()
+
+      rate = attempts / duration
+      if base_rate is None:
+        base_rate = rate / worker_counts[0]
+
+      print('%8d %12.3f %14.1f %14.1f %7.2fx' % (nr_workers, duration / nr_blocks, rate,
+        sum(worker_rates) / len(worker_rates), rate / base_rate))
@@ -4,6 +4,9 @@ import datetime as date
 
 # custom imports
 import blockchain as bc
+import miner as mn
+import blockstore as bs
+import validator as vd
 
 # generate genesis block of accountability blockchain
 def create_genesis_block():
@@ -33,6 +36,23 @@ if __name__ == "__main__":
         "--num-blocks", 
          help = """add <num-blocks> blocks to account_chain""")
 
+    parser.add_argument(
+        "--difficulty", 
+         help = """mine blocks w/ <difficulty> leading zero bits in their hash (default : 0, i.e. no proof-of-work)""")
+
+    parser.add_argument(
+        "--store", 
+         help = """keep the blockchain in block store <store> (a directory), and add blocks to the chain in it, if any (default : in memory)""")
+
+    parser.add_argument(
+        "--validate", 
+         help = """validate the whole chain in the block store once blocks are added (w/ '--store')""",
+         action = "store_true")
+
+    parser.add_argument(
+        "--workers", 
+         help = """nr. of processes to mine blocks w/ (default : nr. of cores)""")
+
     args = parser.parse_args()
 
     if not args.num_blocks:
@@ -40,14 +60,34 @@ if __name__ == "__main__":
         parser.print_help()
         sys.exit(1)
 
-    # create the accountability blockchain and add the genesis block
-    account_chain = [create_genesis_block()]
-    previous_block = account_chain[0]
+    miner = None
+    if args.difficulty and int(args.difficulty) > 0:
+      miner = mn.Miner(int(args.difficulty), int(args.workers) if args.workers else None)
+
+    # create the accountability blockchain and add the genesis block. a 
+    # block store only takes blocks of the difficulty it was created w/
+    if args.store:
+      try:
+        account_chain = bs.BlockStore(args.store, difficulty = int(args.difficulty) if args.difficulty else 0)
+      except ValueError, e:
+        sys.stderr.write("""%s: [ERROR] %s\n""" % (sys.argv[0], e))
+        sys.exit(1)
+      if account_chain.torn:
+        print("[WARNING] truncated a torn block of %d bytes from %s" % (account_chain.torn, args.store))
+      if len(account_chain) == 0:
+        account_chain.append(create_genesis_block())
+    else:
+      account_chain = [create_genesis_block()]
+
+    previous_block = account_chain[-1]
 
     # Add blocks to the chain
     for i in range(0, int(args.num_blocks)):
 
       new_block = next_block(previous_block)
+      if miner is not None:
+        stats = miner.mine(new_block)
+        print("block %d mined in %.3f sec (nonce : %d, %.1f hashes/sec)" % (new_block.index, stats['duration'], stats['nonce'], stats['hashes_per_sec']))
       # FIXME: if we were on a distributed setting, someone 
       # could add another new block before 'new_block' is added, 
       # which would make 'new_block' break the integrity of the 
@@ -56,4 +96,17 @@ if __name__ == "__main__":
       previous_block = new_block
 
       print("block %d has been added to the accountability blockchain" % (new_block.index))
-      print("Hash: %s\n" % (new_block.hash))
\ No newline at end of file
+      print("Hash: %s\n" % (new_block.hash))
+
+    if miner is not None:
+      miner.close()
+
+    if args.store:
+      account_chain.close()
+
+      if args.validate:
+        checked, duration, invalid = vd.validate(args.store, int(args.workers) if args.workers else None)
+        print("validated %d blocks in %.3f sec (%.1f blocks/sec)" % (checked, duration, checked / duration if duration > 0.0 else 0.0))
+        if invalid is not None:
+          print("[ERROR] block %d is invalid : %s" % invalid)
+          sys.exit(2)
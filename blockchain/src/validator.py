@@ -0,0 +1,205 @@
+import sys
+import os
+import argparse
+import multiprocessing
+import hashlib as hasher
+import time
+
+# custom imports
+import blockchain as bc
+import blockstore as bs
+
+# validates a whole chain in a block store (see blockstore.py) : each
+# block's index must be its height, its body must match the header's data
+# digest, its hash (i.e. the hash of its header) must meet the target of
+# the difficulty the store was created w/, if any, and its previous hash
+# must be the hash of the block before it (zeros for the genesis block).
+#
+# the chain is split in chunks of consecutive blocks, validated in
+# parallel by a pool of processes, each w/ its own (memory mapped) view of
+# the store. blocks are checked from their raw bytes, w/o building Block
+# objects. within a chunk, a block's previous hash is checked against the
+# hash of the block before it. across chunks, the previous hash of a
+# chunk's 1st block is checked against the hash of the previous chunk's
+# last block, once both chunks are done (i.e. the chunks are stitched).
+#
+# the lowest invalid height found so far is shared by all processes :
+# chunks past it are skipped, and chunks stop at it, so that validation
+# stops soon after the first invalid block is found.
+#
+# the store is opened read-only (see blockstore.py), so that validating it
+# never modifies it. a torn record at the end of the segment is reported
+# as an invalid block, at the height past the last complete one.
+
+CHUNK_SIZE = 10000
+# nr. of blocks between checks of the lowest invalid height
+CHECK_INTERVAL = 1024
+NULL_HASH = '\x00' * bc.HASH_SIZE
+
+# worker state, set by init_worker()
+store = None
+difficulty_target = None
+first_invalid = None
+
+def init_worker(path, invalid_height):
+
+  global store, difficulty_target, first_invalid
+
+  store = bs.BlockStore(path, read_only = True)
+  difficulty_target = store.target
+  first_invalid = invalid_height
+
+def report_invalid(height):
+
+  with first_invalid.get_lock():
+    if first_invalid.value < 0 or height < first_invalid.value:
+      first_invalid.value = height
+
+# validates blocks [start, end). returns (start, nr. of blocks checked,
+# height and reason of the 1st invalid block (or None), previous hash of
+# the 1st block, hash of the last block checked)
+def validate_chunk(chunk):
+
+  start, end = chunk
+
+  first_previous_hash = None
+  last_hash = None
+
+  for height in xrange(start, end):
+
+    if (height - start) % CHECK_INTERVAL == 0 and 0 <= first_invalid.value < height:
+      return start, height - start, None, first_previous_hash, last_hash
+
+    data = store.read(height)
+    index, timestamp, previous_hash, data_digest, nonce = bc.HEADER.unpack_from(data)
+    block_hash = hasher.sha256(data[:bc.HEADER_SIZE]).digest()
+
+    reason = None
+    if index != height:
+      reason = 'index %d at height %d' % (index, height)
+    elif hasher.sha256(data[bc.HEADER_SIZE + bc.BODY_LENGTH.size:]).digest() != data_digest:
+      reason = 'body doesn\'t match the data digest'
+    # the genesis block isn't mined
+    elif difficulty_target is not None and height > 0 and block_hash >= difficulty_target:
+      reason = 'hash doesn\'t meet the difficulty target'
+    elif height == 0 and previous_hash != NULL_HASH:
+      reason = 'genesis block w/ a previous hash'
+    elif height > start and previous_hash != last_hash:
+      reason = 'previous hash doesn\'t match block %d' % (height - 1)
+
+    if height == start:
+      first_previous_hash = previous_hash
+
+    if reason is not None:
+      report_invalid(height)
+      return start, height - start, (height, reason), first_previous_hash, last_hash
+
+    last_hash = block_hash
+
+  return start, end - start, None, first_previous_hash, last_hash
+
+# validates the chain in the block store at path, w/ nr_workers processes.
+# returns the nr. of blocks checked, the duration, and the height and
+# reason of the 1st invalid block (or None, if the chain is valid). w/
+# difficulty, raises a ValueError if the store's difficulty differs.
+def validate(path, nr_workers = None, chunk_size = CHUNK_SIZE, difficulty = None):
+
+  if nr_workers is None:
+    nr_workers = multiprocessing.cpu_count()
+
+  chain = bs.BlockStore(path, read_only = True, difficulty = difficulty)
+  nr_blocks = len(chain)
+  torn = chain.torn
+  chain.close()
+
+  chunks = [ (start, min(start + chunk_size, nr_blocks)) for start in xrange(0, nr_blocks, chunk_size) ]
+  invalid_height = multiprocessing.Value('l', -1)
+
+  start_time = time.time()
+
+  if nr_workers > 1:
+    pool = multiprocessing.Pool(nr_workers, init_worker, (path, invalid_height))
+    results = pool.map(validate_chunk, chunks, 1)
+    pool.close()
+    pool.join()
+
+  else:
+    init_worker(path, invalid_height)
+    results = map(validate_chunk, chunks)
+    store.close()
+
+  duration = time.time() - start_time
+
+  # the lowest invalid height, within a chunk or at a boundary between
+  # chunks (checked only where both chunks are complete up to it)
+  invalid = None
+  checked = 0
+  results.sort()
+
+  for i, (start, count, chunk_invalid, first_previous_hash, last_hash) in enumerate(results):
+
+    checked += count
+
+    if chunk_invalid is not None and (invalid is None or chunk_invalid[0] < invalid[0]):
+      invalid = chunk_invalid
+
+    if i == 0 or start == 0 or count == 0:
+      continue
+
+    previous_start, previous_count, previous_invalid, unused, previous_last_hash = results[i - 1]
+    if previous_start + previous_count != start:
+      continue
+
+    if first_previous_hash != previous_last_hash and (invalid is None or start < invalid[0]):
+      invalid = (start, 'previous hash doesn\'t match block %d' % (start - 1))
+
+  if invalid is None and torn:
+    invalid = (nr_blocks, 'torn record of %d bytes at the end of the segment' % (torn))
+
+  return checked, duration, invalid
+
+if __name__ == "__main__":
+
+    # use an ArgumentParser for a nice CLI
+    parser = argparse.ArgumentParser()
+
+    # options (self-explanatory)
+    parser.add_argument(
+        "store",
+         help = """directory of the block store to validate""")
+
+    parser.add_argument(
+        "--workers",
+         help = """nr. of processes to validate blocks w/ (default : nr. of cores)""")
+
+    parser.add_argument(
+        "--chunk-size",
+         help = """nr. of consecutive blocks validated at once by a process (default : %d)""" % (CHUNK_SIZE))
+
+    parser.add_argument(
+        "--difficulty",
+         help = """check that the store holds blocks of <difficulty> (default : the difficulty it was created w/)""")
+
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.store):
+      sys.stderr.write("""%s: [ERROR] no block store at %s\n""" % (sys.argv[0], args.store))
+      sys.exit(1)
+
+    try:
+      checked, duration, invalid = validate(args.store,
+        int(args.workers) if args.workers else None,
+        int(args.chunk_size) if args.chunk_size else CHUNK_SIZE,
+        int(args.difficulty) if args.difficulty else None)
+    except ValueError, e:
+      sys.stderr.write("""%s: [ERROR] %s\n""" % (sys.argv[0], e))
+      sys.exit(1)
+
+    print('checked %d blocks in %.3f sec (%.1f blocks/sec)' % (checked, duration,
+      checked / duration if duration > 0.0 else 0.0))
+
+    if invalid is not None:
+      print('[ERROR] block %d is invalid : %s' % invalid)
+      sys.exit(2)
+
+    print('chain is valid')
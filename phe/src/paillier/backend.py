@@ -0,0 +1,93 @@
+import phe.util
+import phe.paillier
+
+# big integer arithmetic backend of phe : paillier encryption, decryption
+# and (most) homomorphic operations boil down to modular arithmetic on
+# integers of 2 x key size bits, which phe does w/ gmpy2 if it's installed,
+# or w/ python's own long integers otherwise, an order of magnitude slower.
+#
+# phe checks phe.util.HAVE_GMP on every call, so the backend can be
+# switched at any time, for the whole process. processes forked afterwards
+# (e.g. worker, decryptor and obfuscator processes) inherit it. note that
+# w/o gmpy2, phe can only generate keys if pycrypto is installed : keys can
+# still be taken from the key store (see keystore.py).
+#
+#   'gmpy2'  : gmpy2 (GMP), if available
+#   'python' : python long integers
+BACKENDS = ['gmpy2', 'python']
+
+try:
+    import gmpy2
+    HAVE_GMPY2 = True
+except ImportError:
+    HAVE_GMPY2 = False
+
+def available():
+    return [ b for b in BACKENDS if b != 'gmpy2' or HAVE_GMPY2 ]
+
+# the fastest backend available
+def default():
+    return 'gmpy2' if HAVE_GMPY2 else 'python'
+
+# switches to backend 'name' ('auto' or None for the default). raises a
+# ValueError if the backend is unknown or not available.
+def select(name = None):
+
+    if name is None or name == 'auto':
+        name = default()
+
+    if name not in BACKENDS:
+        raise ValueError('unknown arithmetic backend : %s' % (name))
+
+    if name not in available():
+        raise ValueError('arithmetic backend %s is not available (is it installed?)' % (name))
+
+    phe.util.HAVE_GMP = (name == 'gmpy2')
+    # phe's own invert() w/o gmpy2 is a linear search, which never returns 
+    # for keys of any useful size (phe uses it for private keys, and for 
+    # negative plaintexts and multipliers)
+    phe.paillier.invert = invert
+
+    return name
+
+def active():
+    return 'gmpy2' if phe.util.HAVE_GMP else 'python'
+
+# active backend, w/ versions, for logs and benchmark results
+def describe():
+
+    if active() == 'gmpy2':
+        return 'gmpy2 %s (%s)' % (gmpy2.version(), gmpy2.mp_version())
+
+    return 'python (gmpy2 %s)' % ('available' if HAVE_GMPY2 else 'not installed')
+
+# modular arithmetic w/ the active backend (phe.util has no mulmod, and
+# uses python ints for small values)
+
+def powmod(a, b, c):
+    return phe.util.powmod(a, b, c)
+
+def invert(a, b):
+
+    if phe.util.HAVE_GMP:
+        return int(gmpy2.invert(a, b))
+
+    # extended euclidean algorithm
+    r0, r1 = a % b, b
+    x0, x1 = 1, 0
+    while r1:
+        q = r0 // r1
+        r0, r1 = r1, r0 - q * r1
+        x0, x1 = x1, x0 - q * x1
+
+    if r0 != 1:
+        raise ValueError('%d has no inverse mod %d' % (a, b))
+
+    return x0 % b
+
+def mulmod(a, b, c):
+
+    if phe.util.HAVE_GMP:
+        return int(gmpy2.mpz(a) * b % c)
+
+    return a * b % c
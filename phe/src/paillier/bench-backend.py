@@ -0,0 +1,131 @@
+import sys
+import argparse
+import random
+import time
+import json
+
+# custom imports
+import backend
+
+# compares the big integer arithmetic backends (see backend.py) on the
+# modular arithmetic paillier spends its time on, for keys of a given size
+# (n of <key size> bits, operations mod n^2) :
+#
+#   'powmod' : r^n mod n^2, i.e. an encryption obfuscator, or 'x*'
+#   'invert' : a^-1 mod n^2, i.e. a negative multiplier in 'x*'
+#   'mulmod' : a * b mod n^2, i.e. '+'
+#
+# operands are random (the modulus is an odd number of the key size, rather
+# than a product of 2 primes), drawn from a seeded generator, so that all
+# backends get the same operands.
+
+OPERATIONS = ['powmod', 'invert', 'mulmod']
+
+def generate_operands(rng, key_size, nr_ops):
+
+    n = rng.getrandbits(key_size) | (1 << (key_size - 1)) | 1
+    nsquare = n * n
+
+    operands = []
+    while len(operands) < nr_ops:
+
+        a = rng.getrandbits(2 * key_size) % nsquare
+        # a random a is almost always invertible mod n^2
+        if gcd(a, nsquare) == 1:
+            operands.append((a, rng.getrandbits(2 * key_size) % nsquare))
+
+    return n, nsquare, operands
+
+def gcd(a, b):
+
+    while b:
+        a, b = b, a % b
+
+    return a
+
+def bench(operation, n, nsquare, operands):
+
+    start_time = time.time()
+
+    if operation == 'powmod':
+        for a, b in operands:
+            backend.powmod(a, n, nsquare)
+
+    elif operation == 'invert':
+        for a, b in operands:
+            backend.invert(a, nsquare)
+
+    else:
+        for a, b in operands:
+            backend.mulmod(a, b, nsquare)
+
+    return len(operands) / (time.time() - start_time)
+
+if __name__ == "__main__":
+
+    # use an ArgumentParser for a nice CLI
+    parser = argparse.ArgumentParser()
+
+    # options (self-explanatory)
+    parser.add_argument(
+        "--key-sizes",
+         help = """comma-separated list of key sizes, in bits (default : 1024,2048,3072)""")
+
+    parser.add_argument(
+        "--nr-ops",
+         help = """nr. of operations per operation type, backend and key size (default : 200)""")
+
+    parser.add_argument(
+        "--backends",
+         help = """comma-separated list of backends, out of %s (default : all available)""" % (', '.join(backend.BACKENDS)))
+
+    parser.add_argument(
+        "--seed",
+         help = """seed for operands (default : 0)""")
+
+    parser.add_argument(
+        "--output",
+         help = """file to write results to, in json""")
+
+    args = parser.parse_args()
+
+    key_sizes = [ int(k) for k in args.key_sizes.split(',') ] if args.key_sizes else [1024, 2048, 3072]
+    backends = args.backends.split(',') if args.backends else backend.available()
+    nr_ops = int(args.nr_ops) if args.nr_ops else 200
+    seed = int(args.seed) if args.seed else 0
+
+    for name in backends:
+        if name not in backend.available():
+            sys.stderr.write("""%s: [ERROR] arithmetic backend not available : %s\n""" % (sys.argv[0], name))
+            parser.print_help()
+            sys.exit(1)
+
+    rows = []
+
+    print('%-6s %-8s %-8s %12s %10s' % ('key', 'op', 'backend', 'ops/sec', 'speedup'))
+
+    for key_size in key_sizes:
+
+        n, nsquare, operands = generate_operands(random.Random(seed), key_size, nr_ops)
+
+        for operation in OPERATIONS:
+
+            results = {}
+            for name in backends:
+                backend.select(name)
+                results[name] = bench(operation, n, nsquare, operands)
+
+            # speedups are relative to python ints (or to the 1st backend)
+            base = results['python'] if 'python' in results else results[backends[0]]
+
+            for name in backends:
+                print('%-6d %-8s %-8s %12.1f %9.1fx' % (key_size, operation, name, results[name], results[name] / base))
+                rows.append({'key_size' : key_size, 'operation' : operation, 'backend' : name,
+                    'ops_per_sec' : results[name]})
+
+    backend.select()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'backend' : backend.describe(), 'nr_ops' : nr_ops, 'results' : rows}, f, indent = 2, sort_keys = True)
+        print('results written to %s' % (args.output))
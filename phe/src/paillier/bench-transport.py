@@ -0,0 +1,115 @@
+import sys
+import argparse
+import socket
+import threading
+import time
+
+# custom imports
+import transport
+
+# compares the framing in transport.py w/ the one it replaced (a str grown
+# w/ recv(4096), split on '\r\n' for every chunk) : frames/sec and MB/sec
+# for a stream of back-to-back frames of a given size, sent over a unix
+# socket pair.
+
+def legacy_send_frame(sock, body):
+    sock.sendall(str(len(body)) + '\r\n' + body)
+
+def legacy_recv_frame(sock, buffer = ''):
+
+    while True:
+
+        if '\r\n' in buffer:
+            frame_size_str = buffer.split('\r\n', 1)[0]
+            frame_size = len(frame_size_str) + 2 + int(frame_size_str)
+
+            if len(buffer) >= frame_size:
+                return buffer[len(frame_size_str) + 2:frame_size], buffer[frame_size:]
+
+        data = sock.recv(4096)
+        if not data:
+            raise socket.error('connection closed by peer')
+
+        buffer += data
+
+def send_legacy(sock, body, nr_frames, batch_size):
+
+    for i in xrange(nr_frames):
+        legacy_send_frame(sock, body)
+
+def send_transport(sock, body, nr_frames, batch_size):
+
+    for i in xrange(0, nr_frames, batch_size):
+        transport.send_frames(sock, [body] * min(batch_size, nr_frames - i))
+
+def recv_legacy(sock, nr_frames):
+
+    buffer = ''
+    for i in xrange(nr_frames):
+        body, buffer = legacy_recv_frame(sock, buffer)
+
+def recv_transport(sock, nr_frames):
+
+    reader = transport.FrameReader()
+    for i in xrange(nr_frames):
+        reader.recv_frame(sock)
+
+def bench(send, recv, frame_size, nr_frames, batch_size):
+
+    body = 'x' * frame_size
+    sender, receiver = socket.socketpair()
+
+    thread = threading.Thread(target = send, args = (sender, body, nr_frames, batch_size))
+
+    start_time = time.time()
+    thread.start()
+    recv(receiver, nr_frames)
+    duration = time.time() - start_time
+
+    thread.join()
+    sender.close()
+    receiver.close()
+
+    return nr_frames / duration, (nr_frames * frame_size) / (duration * 1024.0 * 1024.0)
+
+if __name__ == "__main__":
+
+    # use an ArgumentParser for a nice CLI
+    parser = argparse.ArgumentParser()
+
+    # options (self-explanatory)
+    parser.add_argument(
+        "--frame-sizes",
+         help = """comma-separated list of frame body sizes, in bytes (default : 64,512,4096,65536,1048576)""")
+
+    parser.add_argument(
+        "--nr-bytes",
+         help = """nr. of body bytes sent per run, in MB (default : 64)""")
+
+    parser.add_argument(
+        "--batch-size",
+         help = """nr. of frames per send_frames() call (default : 16)""")
+
+    args = parser.parse_args()
+
+    if args.frame_sizes:
+        frame_sizes = [ int(s) for s in args.frame_sizes.split(',') ]
+    else:
+        frame_sizes = [64, 512, 4096, 65536, 1048576]
+
+    nr_bytes = int(float(args.nr_bytes) * 1024 * 1024) if args.nr_bytes else 64 * 1024 * 1024
+    batch_size = int(args.batch_size) if args.batch_size else 16
+
+    print('vectored sends : %s' % ('sendmsg()' if transport.HAVE_SENDMSG else 'no (coalesced send())'))
+    print('%-10s %-10s %10s %14s %10s' % ('frame (B)', 'transport', 'frames', 'frames/sec', 'MB/sec'))
+
+    for frame_size in frame_sizes:
+
+        # at least a few frames, even for large frame sizes
+        nr_frames = max(nr_bytes // frame_size, 16)
+
+        for name, send, recv in [('legacy', send_legacy, recv_legacy), ('transport', send_transport, recv_transport)]:
+            frame_rate, throughput = bench(send, recv, frame_size, nr_frames, batch_size)
+            print('%-10d %-10s %10d %14.1f %10.1f' % (frame_size, name, nr_frames, frame_rate, throughput))
+
+    sys.exit(0)
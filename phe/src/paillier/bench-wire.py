@@ -0,0 +1,130 @@
+import sys
+import argparse
+import random
+import time
+
+from phe import paillier # for hpe operations
+
+# custom imports
+import wire
+
+# compares the json and binary wire formats : nr. of bytes per operation,
+# and the time it takes to encode and parse (i.e. decode, and convert
+# ciphertexts back to ints) requests and responses.
+
+def random_ciphertext(public_key):
+    # the formats don't care about what's in the ciphertext, so we skip the
+    # (expensive) encryption, and just pick a random int < n^2
+    return (random.randrange(public_key.nsquare), random.randint(-16, -12))
+
+def generate_batch(public_key, key_id, nr_ops):
+
+    message = {}
+    message['type'] = 'batch'
+    message['mode'] = 'encrypted'
+    message['key_id'] = key_id
+    message['ops'] = []
+
+    for i in xrange(nr_ops):
+
+        op = {}
+        op['operation'] = random.choice(wire.OPERATIONS)
+        op['operand_1'] = random_ciphertext(public_key)
+
+        if op['operation'] == '+':
+            op['operand_2'] = random_ciphertext(public_key)
+        else:
+            op['operand_2'] = random.uniform(0.0, 100.0)
+
+        message['ops'].append(op)
+
+    return message
+
+def generate_response(public_key, key_id, nr_ops):
+
+    message = {}
+    message['type'] = 'response'
+    message['mode'] = 'encrypted'
+    message['key_id'] = key_id
+    message['results'] = [ random_ciphertext(public_key) for i in xrange(nr_ops) ]
+
+    return message
+
+# what the server does w/ a request (and the client w/ a response) after
+# decoding it : convert ciphertexts to ints
+def parse(body):
+
+    message = wire.decode(body)
+
+    if message['type'] == 'batch':
+        for op in message['ops']:
+            int(op['operand_1'][0])
+            if op['operation'] == '+':
+                int(op['operand_2'][0])
+    else:
+        for result in message['results']:
+            int(result[0])
+
+    return message
+
+def bench(message, fmt, width, nr_ops, nr_rounds):
+
+    start_time = time.time()
+    for i in xrange(nr_rounds):
+        body = wire.encode(message, fmt, width)
+    encode_time = (time.time() - start_time) / (nr_rounds * nr_ops)
+
+    start_time = time.time()
+    for i in xrange(nr_rounds):
+        parse(body)
+    parse_time = (time.time() - start_time) / (nr_rounds * nr_ops)
+
+    # account for the '<length>\r\n' frame header as well
+    frame_size = len(str(len(body))) + 2 + len(body)
+
+    return float(frame_size) / nr_ops, encode_time, parse_time
+
+if __name__ == "__main__":
+
+    # use an ArgumentParser for a nice CLI
+    parser = argparse.ArgumentParser()
+
+    # options (self-explanatory)
+    parser.add_argument(
+        "--key-size",
+         help = """size of paillier key, in bits (default : 2048)""")
+
+    parser.add_argument(
+        "--nr-ops",
+         help = """nr. of operations per message (default : 100)""")
+
+    parser.add_argument(
+        "--nr-rounds",
+         help = """nr. of times each message is encoded and parsed (default : 10)""")
+
+    args = parser.parse_args()
+
+    key_size = int(args.key_size) if args.key_size else 2048
+    nr_ops = int(args.nr_ops) if args.nr_ops else 100
+    nr_rounds = int(args.nr_rounds) if args.nr_rounds else 10
+
+    random.seed(0)
+
+    public_key, private_key = paillier.generate_paillier_keypair(n_length = key_size)
+    width = wire.ciphertext_width(public_key)
+    key_id = '0123456789abcdef'
+
+    print('key size : %d bit (ciphertext width : %d byte)' % (key_size, width))
+    print('%-10s %-8s %14s %14s %14s' % ('message', 'format', 'bytes/op', 'encode (us/op)', 'parse (us/op)'))
+
+    messages = [
+        ('request', generate_batch(public_key, key_id, nr_ops)),
+        ('response', generate_response(public_key, key_id, nr_ops))
+    ]
+
+    for name, message in messages:
+        for fmt in wire.FORMATS:
+            size, encode_time, parse_time = bench(message, fmt, width, nr_ops, nr_rounds)
+            print('%-10s %-8s %14.1f %14.2f %14.2f' % (name, fmt, size, encode_time * 1e6, parse_time * 1e6))
+
+    sys.exit(0)
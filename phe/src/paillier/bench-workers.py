@@ -0,0 +1,88 @@
+import sys
+import argparse
+import random
+import time
+import multiprocessing
+
+from phe import paillier # for hpe operations
+
+# custom imports
+import operations
+import workers
+
+# throughput of encrypted operations (x* by default) evaluated on the 
+# server process, and on worker pools of increasing size
+
+if __name__ == "__main__":
+
+    # use an ArgumentParser for a nice CLI
+    parser = argparse.ArgumentParser()
+
+    # options (self-explanatory)
+    parser.add_argument(
+        "--key-size",
+         help = """size of paillier key, in bits (default : 2048)""")
+
+    parser.add_argument(
+        "--nr-ops",
+         help = """nr. of operations to evaluate per run (default : 512)""")
+
+    parser.add_argument(
+        "--operation",
+         help = """operation to evaluate : 'x*', '+' or '+*' (default : x*)""")
+
+    parser.add_argument(
+        "--max-workers",
+         help = """max. nr. of worker processes (default : nr. of cores)""")
+
+    parser.add_argument(
+        "--chunk-size",
+         help = """nr. of operations handed to a worker at once (default : 8)""")
+
+    args = parser.parse_args()
+
+    key_size = int(args.key_size) if args.key_size else 2048
+    nr_ops = int(args.nr_ops) if args.nr_ops else 512
+    operation = args.operation if args.operation else 'x*'
+    max_workers = int(args.max_workers) if args.max_workers else multiprocessing.cpu_count()
+    chunk_size = int(args.chunk_size) if args.chunk_size else 8
+
+    random.seed(0)
+
+    public_key, private_key = paillier.generate_paillier_keypair(n_length = key_size)
+
+    # encrypt a handful of operands, and re-use them
+    operands = []
+    for i in xrange(16):
+        encrypted = public_key.encrypt(random.uniform(0.0, 100.0))
+        operands.append((encrypted.ciphertext(), encrypted.exponent))
+
+    ops = []
+    for i in xrange(nr_ops):
+        if operation == '+':
+            ops.append((operation, random.choice(operands), random.choice(operands)))
+        else:
+            ops.append((operation, random.choice(operands), random.uniform(0.0, 100.0)))
+
+    print('key size : %d bit, operation : %s, %d ops per run, %d cores' % (key_size, operation, nr_ops, multiprocessing.cpu_count()))
+    print('%-8s %12s %10s' % ('workers', 'ops/sec', 'speedup'))
+
+    start_time = time.time()
+    operations.process_operations('encrypted', ops, public_key)
+    baseline = nr_ops / (time.time() - start_time)
+    print('%-8s %12.1f %10.2f' % ('none', baseline, 1.0))
+
+    for nr_workers in xrange(1, max_workers + 1):
+
+        pool = workers.WorkerPool(nr_workers, chunk_size)
+        # warm up the workers (and their key caches)
+        pool.process_operations('encrypted', ops[:nr_workers * chunk_size], public_key, 'bench')
+
+        start_time = time.time()
+        pool.process_operations('encrypted', ops, public_key, 'bench')
+        throughput = nr_ops / (time.time() - start_time)
+        pool.close()
+
+        print('%-8d %12.1f %10.2f' % (nr_workers, throughput, throughput / baseline))
+
+    sys.exit(0)
@@ -0,0 +1,644 @@
+import sys
+import argparse
+import random
+import socket
+import threading
+import time
+import json
+import csv
+
+from phe import paillier # for hpe operations
+
+# custom imports
+import keycache
+import wire
+import transport
+import keystore
+import backend
+import clientlib
+
+# headless benchmark runner : sweeps key sizes, operation mixes, batch sizes,
+# nr. of concurrent connections and transports (see transport.TRANSPORTS)
+# against a running server, and reports
+# latency percentiles and throughput per operation, mode and stage :
+#
+#   'encrypt' : encryption of the operands of an operation (on the client)
+#   'request' : round trip of the request (or batch) holding an operation,
+#               i.e. what the server adds
+#   'decrypt' : decryption of the result of an operation (on the client)
+#
+# the stages run one after the other, so that they don't skew each other :
+# operands are encrypted before requests are sent, and results decrypted
+# after all responses are in. operations and operands are drawn from a
+# seeded generator, so that runs w/ the same seed request the same
+# operations w/ the same values (ciphertexts still differ, since paillier
+# encryption is randomized, and so do keys, unless they're taken from a key
+# store w/ '--keystore').
+#
+# results go to a json or csv file, and can be compared against a stored
+# (json) baseline : stages which got slower by more than a threshold are
+# flagged, and the runner exits w/ status 2. the arithmetic backends of the
+# client and server (see backend.py) are part of the results, since they
+# make an order of magnitude of difference.
+
+MIXES = {
+    'scalar' : ['x*', '+', '+*'],
+    'mult' : ['x*'],
+    'add' : ['+'],
+    'add-scalar' : ['+*'],
+    'vector' : ['sum', 'dot', 'mean'],
+    'all' : ['x*', '+', '+*', 'sum', 'dot', 'mean']
+}
+
+STAGES = ['encrypt', 'request', 'decrypt']
+PERCENTILES = [50, 90, 99]
+
+# columns of the results, in csv output
+FIELDS = ['key_size', 'mix', 'batch_size', 'concurrency', 'transport', 'mode', 'operation', 'stage',
+    'count', 'p50', 'p90', 'p99', 'max', 'ops_per_sec']
+# a result is identified by the run parameters, operation and stage
+KEY_FIELDS = FIELDS[:8]
+# metrics which regress when they go down (latencies regress when they go up)
+HIGHER_IS_BETTER = set(['ops_per_sec'])
+
+# percentile w/ linear interpolation between closest ranks (same as
+# numpy.percentile()), p in [0, 100]
+def percentile(values, p):
+
+    values = sorted(values)
+    rank = (len(values) - 1) * (p / 100.0)
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+# summary of the durations of the ops of a stage (or of a single operation 
+# within a stage). ops of all operations run interleaved within a stage, so 
+# ops_per_sec is over the wall time of the whole stage : per operation, it's 
+# the operation's share of the stage's throughput (and the rows of each 
+# operation add up to the 'all' row), not its throughput if run on its own.
+def summarize(durations, wall_time):
+
+    summary = {}
+    summary['count'] = len(durations)
+
+    for p in PERCENTILES:
+        summary['p%d' % (p)] = percentile(durations, p)
+
+    summary['max'] = max(durations)
+    summary['ops_per_sec'] = len(durations) / wall_time if wall_time > 0.0 else 0.0
+
+    return summary
+
+# (operation, operand 1, operand 2, expected result) tuples
+def generate_ops(rng, mix, nr_ops, vector_size):
+
+    ops = []
+    for i in xrange(nr_ops):
+
+        operation = rng.choice(MIXES[mix])
+
+        if operation in wire.VECTOR_OPERATIONS:
+            operand_1 = [ rng.uniform(0.0, 100.0) for j in xrange(vector_size) ]
+            operand_2 = [ rng.uniform(0.0, 1.0) for j in xrange(vector_size) ] if operation == 'dot' else []
+        else:
+            operand_1 = rng.uniform(0.0, 100.0)
+            operand_2 = rng.uniform(0.0, 100.0)
+
+        ops.append((operation, operand_1, operand_2, clientlib.get_expected_result(operand_1, operand_2, operation)))
+
+    return ops
+
+def encrypt(public_key, value):
+    encrypted = public_key.encrypt(value)
+    return (encrypted.ciphertext(), encrypted.exponent)
+
+# builds the wire version of each operation, encrypting operands in
+# encrypted mode. returns the operations and the encryption time of each.
+def prepare_ops(public_key, mode, ops):
+
+    prepared = []
+    durations = []
+
+    for operation, operand_1, operand_2, expected_result in ops:
+
+        op = {}
+        op['operation'] = operation
+
+        start_time = time.time()
+
+        if mode != 'encrypted':
+            op['operand_1'] = operand_1
+            op['operand_2'] = operand_2
+        elif operation in wire.VECTOR_OPERATIONS:
+            op['operand_1'] = [ encrypt(public_key, value) for value in operand_1 ]
+            op['operand_2'] = operand_2
+        else:
+            op['operand_1'] = encrypt(public_key, operand_1)
+            op['operand_2'] = encrypt(public_key, operand_2) if operation == '+' else operand_2
+
+        durations.append(time.time() - start_time)
+        prepared.append(op)
+
+    return prepared, durations
+
+def build_message(mode, key_id, ops):
+
+    message = {}
+    message['mode'] = mode
+
+    if mode == 'encrypted':
+        message['key_id'] = key_id
+
+    if len(ops) > 1:
+        message['type'] = 'batch'
+        message['ops'] = ops
+    else:
+        message.update(ops[0])
+        message['type'] = 'request'
+
+    return message
+
+# a connection to the server, which sends its messages one at a time (i.e.
+# w/o pipelining), and records the round trip time of each
+class BenchConnection(threading.Thread):
+
+    def __init__(self, server_address, public_key, fmt, mode, messages, kind = 'tcp', 
+        unix_path = transport.DEFAULT_UNIX_SOCKET, shm_size = transport.RING_SIZE):
+
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self.server_address = server_address
+        self.kind = kind
+        self.unix_path = unix_path
+        self.shm_size = shm_size
+        self.ring = None
+        self.public_key = public_key
+        self.fmt = fmt
+        self.mode = mode
+        # list of (indexes of the operations, message) tuples
+        self.messages = messages
+
+        self.width = wire.ciphertext_width(public_key)
+        self.reader = transport.FrameReader()
+
+        # index of operation -> (result, round trip time)
+        self.results = {}
+        self.error = None
+
+    def send(self, sock, message):
+        transport.send_frame(sock, wire.encode(message, self.fmt, self.width), self.ring)
+
+    def setup_shm(self, sock):
+
+        channel = clientlib.setup_shm(lambda message: self.send(sock, message), lambda: self.recv(sock), self.shm_size)
+
+        self.reader.ring = channel.inbound
+        self.ring = channel.outbound
+
+    def recv(self, sock):
+        return wire.decode(self.reader.recv_frame(sock))
+
+    def run(self):
+
+        try:
+
+            sock = transport.connect(self.kind, self.server_address, self.unix_path)
+            if self.kind == 'shm':
+                self.setup_shm(sock)
+
+            response = clientlib.register_key(lambda message: self.send(sock, message), lambda: self.recv(sock), 
+                self.public_key, self.fmt)
+            # the server may not support the requested format
+            self.fmt = response.get('format', 'json')
+
+            for indexes, message in self.messages:
+
+                start_time = time.time()
+                self.send(sock, message)
+                response = self.recv(sock)
+                duration = time.time() - start_time
+
+                if response['type'] != 'response':
+                    raise ValueError('unexpected response : %s' % (response))
+
+                results = response['results'] if 'results' in response else [response['result']]
+                for index, result in zip(indexes, results):
+                    self.results[index] = (result, duration)
+
+            sock.close()
+
+        except Exception, e:
+            self.error = e
+
+def decrypt_results(public_key, private_key, mode, ops, results):
+
+    plaintexts = []
+    durations = []
+
+    for i in xrange(len(ops)):
+
+        result = results[i][0]
+
+        start_time = time.time()
+        if mode == 'encrypted':
+            result = private_key.decrypt(paillier.EncryptedNumber(public_key, int(result[0]), int(result[1])))
+        else:
+            result = float(result)
+        durations.append(time.time() - start_time)
+
+        plaintexts.append(result)
+
+    return plaintexts, durations
+
+def count_errors(ops, plaintexts):
+
+    errors = 0
+    for (operation, operand_1, operand_2, expected_result), result in zip(ops, plaintexts):
+        # operations are evaluated in a different order (and precision) on
+        # the server
+        if abs(result - expected_result) > 1e-9 * max(1.0, abs(expected_result)):
+            errors += 1
+
+    return errors
+
+def run(server_address, keys, fmt, key_size, mix, batch_size, concurrency, kind, unix_path, mode, nr_ops, vector_size, seed):
+
+    public_key, private_key = keys[key_size]
+    key_id = keycache.key_fingerprint(public_key.g, public_key.n)
+
+    rng = random.Random(seed)
+    ops = generate_ops(rng, mix, nr_ops, vector_size)
+
+    # stage 1 : encryption
+    start_time = time.time()
+    prepared, encrypt_times = prepare_ops(public_key, mode, ops)
+    encrypt_wall_time = time.time() - start_time
+
+    # stage 2 : requests, w/ batches dealt round-robin to the connections
+    messages = [ [] for i in xrange(concurrency) ]
+    for i in xrange(0, nr_ops, batch_size):
+        indexes = range(i, min(i + batch_size, nr_ops))
+        message = build_message(mode, key_id, [ prepared[j] for j in indexes ])
+        messages[(i // batch_size) % concurrency].append((indexes, message))
+
+    connections = [ BenchConnection(server_address, public_key, fmt, mode, m, kind, unix_path) for m in messages if m ]
+
+    start_time = time.time()
+    for connection in connections:
+        connection.start()
+    for connection in connections:
+        connection.join()
+    request_wall_time = time.time() - start_time
+
+    results = {}
+    for connection in connections:
+        if connection.error is not None:
+            raise connection.error
+        results.update(connection.results)
+
+    # stage 3 : decryption
+    start_time = time.time()
+    plaintexts, decrypt_times = decrypt_results(public_key, private_key, mode, ops, results)
+    decrypt_wall_time = time.time() - start_time
+
+    errors = count_errors(ops, plaintexts)
+
+    # durations of each stage, per operation
+    durations = {}
+    for i, (operation, operand_1, operand_2, expected_result) in enumerate(ops):
+        for stage, duration in [('encrypt', encrypt_times[i]), ('request', results[i][1]), ('decrypt', decrypt_times[i])]:
+            durations.setdefault((operation, stage), []).append(duration)
+            durations.setdefault(('all', stage), []).append(duration)
+
+    wall_times = {'encrypt' : encrypt_wall_time, 'request' : request_wall_time, 'decrypt' : decrypt_wall_time}
+
+    rows = []
+    for (operation, stage), values in sorted(durations.items()):
+
+        # in unencrypted mode, there's nothing to encrypt or decrypt
+        if mode != 'encrypted' and stage != 'request':
+            continue
+
+        row = {
+            'key_size' : key_size, 'mix' : mix, 'batch_size' : batch_size,
+            'concurrency' : concurrency, 'transport' : kind, 'mode' : mode, 'operation' : operation, 'stage' : stage
+        }
+        row.update(summarize(values, wall_times[stage]))
+        rows.append(row)
+
+    return rows, errors
+
+def row_key(row):
+    # older results have no transport : they're all over TCP
+    return tuple(str(row.get(field, 'tcp')) for field in KEY_FIELDS)
+
+# returns a list of (row, baseline row, metric) tuples, for each metric of
+# a row which is worse than in the baseline by more than threshold (i.e. 
+# higher, or lower for HIGHER_IS_BETTER metrics)
+def compare(rows, baseline_rows, metrics, threshold):
+
+    baseline = dict((row_key(row), row) for row in baseline_rows)
+
+    regressions = []
+    for row in rows:
+
+        base = baseline.get(row_key(row))
+        if base is None:
+            continue
+
+        for metric in metrics:
+
+            if base[metric] <= 0.0:
+                continue
+
+            if metric in HIGHER_IS_BETTER:
+                regressed = row[metric] < base[metric] * (1.0 - threshold)
+            else:
+                regressed = row[metric] > base[metric] * (1.0 + threshold)
+
+            if regressed:
+                regressions.append((row, base, metric))
+
+    return regressions
+
+# the server's arithmetic backend, as reported in its stats (older servers 
+# don't report it)
+def server_backend(server_address):
+
+    sock = socket.create_connection(server_address)
+    reader = transport.FrameReader()
+
+    try:
+        request = {}
+        request['type'] = 'stats'
+        transport.send_frame(sock, wire.encode(request))
+        stats = wire.decode(reader.recv_frame(sock))
+
+        terminate = {}
+        terminate['type'] = 'terminate'
+        transport.send_frame(sock, wire.encode(terminate))
+
+    finally:
+        sock.close()
+
+    return stats.get('backend', 'unknown')
+
+def write_results(filename, fmt, config, rows, errors):
+
+    with open(filename, 'w') as f:
+
+        if fmt == 'csv':
+            writer = csv.DictWriter(f, fieldnames = FIELDS)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(dict((field, row[field]) for field in FIELDS))
+
+        else:
+            json.dump({'config' : config, 'errors' : errors, 'results' : rows}, f, indent = 2, sort_keys = True)
+
+def print_rows(rows):
+
+    print('%-6s %-10s %6s %5s %-5s %-12s %-5s %-8s %6s %10s %10s %10s %10s %10s' % (
+        'key', 'mix', 'batch', 'conn', 'trans', 'mode', 'op', 'stage', 'count', 'p50 (ms)', 'p90 (ms)', 'p99 (ms)', 'max (ms)', 'ops/sec'))
+
+    for row in rows:
+        print('%-6d %-10s %6d %5d %-5s %-12s %-5s %-8s %6d %10.3f %10.3f %10.3f %10.3f %10.1f' % (
+            row['key_size'], row['mix'], row['batch_size'], row['concurrency'], row['transport'], row['mode'],
+            row['operation'], row['stage'], row['count'],
+            row['p50'] * 1000.0, row['p90'] * 1000.0, row['p99'] * 1000.0, row['max'] * 1000.0, row['ops_per_sec']))
+
+# request round trips over each transport, next to the same runs over TCP
+def print_transports(rows):
+
+    tcp_rows = dict((row_key(row), row) for row in rows if row['transport'] == 'tcp')
+
+    for row in rows:
+
+        if row['transport'] == 'tcp' or row['operation'] != 'all' or row['stage'] != 'request':
+            continue
+
+        key = row_key(dict(row, transport = 'tcp'))
+        if key not in tcp_rows:
+            continue
+
+        tcp_row = tcp_rows[key]
+        print('%s vs. tcp : %d bit key, %s mix, batch size %d, %d connection(s), %s : p50 %.3f ms vs. %.3f ms, %.1f vs. %.1f ops/sec (x%.2f)' % (
+            row['transport'], row['key_size'], row['mix'], row['batch_size'], row['concurrency'], row['mode'],
+            row['p50'] * 1000.0, tcp_row['p50'] * 1000.0, row['ops_per_sec'], tcp_row['ops_per_sec'],
+            row['ops_per_sec'] / tcp_row['ops_per_sec'] if tcp_row['ops_per_sec'] > 0.0 else 0.0))
+
+def parse_list(value, default, convert = str):
+
+    if not value:
+        return default
+
+    return [ convert(v) for v in value.split(',') ]
+
+if __name__ == "__main__":
+
+    # use an ArgumentParser for a nice CLI
+    parser = argparse.ArgumentParser()
+
+    # options (self-explanatory)
+    parser.add_argument(
+        "--server",
+         help = """<host>:<port> of the server (default : localhost:10000)""")
+
+    parser.add_argument(
+        "--key-sizes",
+         help = """comma-separated list of paillier key sizes, in bits (default : 1024,2048)""")
+
+    parser.add_argument(
+        "--mixes",
+         help = """comma-separated list of operation mixes, out of %s (default : scalar)""" % (', '.join(sorted(MIXES))))
+
+    parser.add_argument(
+        "--batch-sizes",
+         help = """comma-separated list of nr. of operations per request (default : 1,10)""")
+
+    parser.add_argument(
+        "--concurrency",
+         help = """comma-separated list of nr. of concurrent connections (default : 1,4)""")
+
+    parser.add_argument(
+        "--transports",
+         help = """comma-separated list of transports, out of %s (default : tcp). the server must listen on a unix socket for 'unix' (and allow shared memory for 'shm')""" % (', '.join(transport.TRANSPORTS)))
+
+    parser.add_argument(
+        "--unix-socket",
+         help = """path of the server's unix socket (default : %s)""" % (transport.DEFAULT_UNIX_SOCKET))
+
+    parser.add_argument(
+        "--modes",
+         help = """comma-separated list of modes (default : encrypted,unencrypted)""")
+
+    parser.add_argument(
+        "--nr-ops",
+         help = """nr. of operations per run (default : 200)""")
+
+    parser.add_argument(
+        "--vector-size",
+         help = """nr. of values in the operands of vector operations (default : 16)""")
+
+    parser.add_argument(
+        "--format",
+         help = """wire format : 'binary' or 'json' (default : binary)""")
+
+    parser.add_argument(
+        "--keystore",
+         help = """take keys from (or add them to) the key store in directory <keystore>, instead of generating new keys for each run""")
+
+    parser.add_argument(
+        "--seed",
+         help = """seed for operations and operands (default : 0)""")
+
+    parser.add_argument(
+        "--output",
+         help = """file to write results to, in json (default) or csv, if the file name ends in '.csv'""")
+
+    parser.add_argument(
+        "--baseline",
+         help = """json results of a previous run, to compare this run against""")
+
+    parser.add_argument(
+        "--threshold",
+         help = """flag stages which are slower than in the baseline by more than <threshold>, as a fraction (default : 0.2)""")
+
+    parser.add_argument(
+        "--metrics",
+         help = """comma-separated list of metrics compared against the baseline, e.g. p50,p99,ops_per_sec (default : p50,p90)""")
+
+    parser.add_argument(
+        "--backend",
+         help = """big integer arithmetic backend of the client : 'gmpy2', 'python' or 'auto' (default : auto, i.e. gmpy2 if installed)""")
+
+    args = parser.parse_args()
+
+    host, port = (args.server if args.server else 'localhost:10000').rsplit(':', 1)
+    server_address = (host, int(port))
+
+    key_sizes = parse_list(args.key_sizes, [1024, 2048], int)
+    mixes = parse_list(args.mixes, ['scalar'])
+    batch_sizes = parse_list(args.batch_sizes, [1, 10], int)
+    concurrency_levels = parse_list(args.concurrency, [1, 4], int)
+    transports = parse_list(args.transports, ['tcp'])
+    unix_path = args.unix_socket if args.unix_socket else transport.DEFAULT_UNIX_SOCKET
+    modes = parse_list(args.modes, ['encrypted', 'unencrypted'])
+    metrics = parse_list(args.metrics, ['p50', 'p90'])
+
+    nr_ops = int(args.nr_ops) if args.nr_ops else 200
+    vector_size = int(args.vector_size) if args.vector_size else 16
+    fmt = args.format if args.format else 'binary'
+    seed = int(args.seed) if args.seed else 0
+    threshold = float(args.threshold) if args.threshold else 0.2
+
+    try:
+        backend.select(args.backend)
+    except ValueError, e:
+        sys.stderr.write("""%s: [ERROR] %s\n""" % (sys.argv[0], e.args[0]))
+        sys.exit(1)
+
+    for mix in mixes:
+        if mix not in MIXES:
+            sys.stderr.write("""%s: [ERROR] unknown operation mix : %s\n""" % (sys.argv[0], mix))
+            parser.print_help()
+            sys.exit(1)
+
+    for kind in transports:
+        if kind not in transport.TRANSPORTS:
+            sys.stderr.write("""%s: [ERROR] unknown transport : %s\n""" % (sys.argv[0], kind))
+            parser.print_help()
+            sys.exit(1)
+
+    if fmt not in wire.FORMATS:
+        sys.stderr.write("""%s: [ERROR] unknown wire format : %s\n""" % (sys.argv[0], fmt))
+        parser.print_help()
+        sys.exit(1)
+
+    config = {
+        'key_sizes' : key_sizes, 'mixes' : mixes, 'batch_sizes' : batch_sizes,
+        'concurrency' : concurrency_levels, 'transports' : transports, 'modes' : modes, 'nr_ops' : nr_ops,
+        'vector_size' : vector_size, 'format' : fmt, 'seed' : seed,
+        'backend' : backend.describe(), 'server_backend' : server_backend(server_address)
+    }
+
+    print('arithmetic backend : %s (server : %s)' % (config['backend'], config['server_backend']))
+
+    # one key pair per key size, shared by all runs
+    keys = {}
+    key_store = keystore.KeyStore(args.keystore) if args.keystore else None
+
+    for key_size in key_sizes:
+
+        if key_store is not None:
+            key_id, public_key, private_key = key_store.get(key_size)
+            print('using %d bit key %s from %s' % (key_size, key_id, key_store.path))
+            keys[key_size] = (public_key, private_key)
+        else:
+            print('generating %d bit key pair...' % (key_size))
+            keys[key_size] = paillier.generate_paillier_keypair(n_length = key_size)
+
+    rows = []
+    errors = 0
+
+    for key_size in key_sizes:
+        for mix in mixes:
+            for batch_size in batch_sizes:
+                for concurrency in concurrency_levels:
+                    for kind in transports:
+                        for mode in modes:
+
+                            print('run : %d bit key, %s mix, batch size %d, %d connection(s), %s, %s' % (
+                                key_size, mix, batch_size, concurrency, kind, mode))
+
+                            run_rows, run_errors = run(server_address, keys, fmt, key_size, mix, batch_size,
+                                concurrency, kind, unix_path, mode, nr_ops, vector_size, seed)
+
+                            if run_errors:
+                                print('[WARNING] %d wrong results' % (run_errors))
+
+                            rows.extend(run_rows)
+                            errors += run_errors
+
+    print_rows(rows)
+    print_transports(rows)
+
+    if args.output:
+        write_results(args.output, 'csv' if args.output.endswith('.csv') else 'json', config, rows, errors)
+        print('results written to %s' % (args.output))
+
+    if args.baseline:
+
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+            baseline_rows = baseline['results']
+
+        # comparisons across backends are mostly meaningless
+        for name in ['backend', 'server_backend']:
+            if baseline['config'].get(name, config[name]) != config[name]:
+                print('[WARNING] %s differs from the baseline : %s (baseline : %s)' % (name.replace('_', ' '), config[name], baseline['config'][name]))
+
+        regressions = compare(rows, baseline_rows, metrics, threshold)
+
+        for row, base, metric in regressions:
+
+            if metric in HIGHER_IS_BETTER:
+                change = '%.1f -> %.1f' % (base[metric], row[metric])
+            else:
+                change = '%.3f ms -> %.3f ms' % (base[metric] * 1000.0, row[metric] * 1000.0)
+
+            print('[REGRESSION] %d bit key, %s mix, batch size %d, %d connection(s), %s, %s, %s %s : %s %s (%+.0f%%)' % (
+                row['key_size'], row['mix'], row['batch_size'], row['concurrency'], row['transport'], row['mode'],
+                row['operation'], row['stage'], metric, change, (row[metric] / base[metric] - 1.0) * 100.0))
+
+        print('%d regression(s) against %s (threshold : %.0f%%)' % (len(regressions), args.baseline, threshold * 100.0))
+
+        if regressions:
+            sys.exit(2)
+
+    if errors:
+        sys.exit(1)
+
+    sys.exit(0)
@@ -6,79 +6,592 @@ import random
 import fcntl, os
 import errno
 import time
-import numpy as np
-import matplotlib
-import matplotlib.pyplot as plt
 import math
+import threading
 
 from collections import defaultdict
 from phe import paillier # for hpe operations
 from pprint import pprint 
 
+# custom imports
+import keycache
+import wire
+import transport
+import obfuscator
+import decryptor
+import packing
+import keystore
+import backend
+import tracefile
+import clientlib
+
 correctness = defaultdict()
 processing_times = defaultdict(list)
-
-# generate public and private key
-public_key, private_key = paillier.generate_paillier_keypair()
+# the results above are updated by the main thread, and by the decryptor 
+# pool's result thread (see process_response())
+results_lock = threading.Lock()
+
+# for the time to first request (i.e. from start to the 1st response)
+client_start_time = time.time()
+
+# public and private key, loaded from the key store (or generated) at 
+# startup (see load_keys())
+public_key = None
+private_key = None
+# the server refers to our public key by this id, once it's registered
+key_id = None
+# nr. of bytes of our ciphertexts, in the binary wire format
+ciphertext_width = 0
+# wire format for requests and responses, agreed w/ the server at key 
+# registration
+wire_format = 'json'
+# shared memory rings agreed w/ the server, w/ '--transport shm' (see 
+# transport.ShmChannel)
+shm_channel = None
+# trace of the messages we send, if any (see tracefile.py)
+trace_writer = None
+# time to wait before re-sending a request the server was too busy to take
+BUSY_BACKOFF = 0.01
+# precomputed obfuscators for encryption, if '--obfuscator-pool' is set
+obfuscator_pool = None
+# processes which decrypt results, if '--decrypt-workers' is set
+decryptor_pool = None
 
 # supported operations in paillier cryptosystem:
 #   'x*' : encrypted numbers can be multiplied by a non encrypted scalar
 #   '+'  : encrypted numbers can be added together 
 #   '+*' : encrypted numbers can be added to non encrypted scalars
-operations = ['x*', '+', '+*']
+scalar_operations = ['x*', '+', '+*']
+# and, built on top of those, operations which aggregate a vector of 
+# encrypted numbers into a single one on the server :
+#   'sum'  : sum of the vector
+#   'dot'  : dot product w/ a vector of non encrypted weights
+#   'mean' : mean of the vector
+vector_operations = ['sum', 'dot', 'mean']
+operations = scalar_operations + vector_operations
+
+# nr. of values in the operands of vector operations. vector operations 
+# are only requested if > 0 (see '--vector-size')
+vector_size = 0
+
+# if set (see '--packing'), encrypted operations work on packed ciphertexts, 
+# each holding several values (see packing.py) :
+#   'p+'  : packed version of '+'
+#   'px*' : packed version of 'x*'
+#   'p+*' : packed version of '+*'
+packed_operations = ['p+', 'px*', 'p+*']
+value_packing = None
+
+# if set (see '--fixed-precision'), all values are encrypted w/ the same 
+# exponent, agreed w/ the server at key registration, so that the server 
+# can add them w/o aligning exponents first. values are rounded to a 
+# multiple of EncodedNumber.BASE^fixed_exponent (<= fixed_precision).
+fixed_precision = None
+fixed_exponent = None
+
+def record_time(name, duration):
+
+    with results_lock:
+        processing_times[name].append(duration)
+
+def format_operand(operand):
+
+    if isinstance(operand, list):
+        return '[%d values]' % (len(operand))
+
+    return '%f' % (operand)
+
+# returns an encrypted number whose ciphertext is already obfuscated (by
+# phe, or by the obfuscator pool) : read it w/ ciphertext(be_secure = False)
+def encrypt(value):
+
+    if obfuscator_pool is not None:
+        return obfuscator_pool.encrypt(value, fixed_precision)
+
+    return public_key.encrypt(value, fixed_precision)
+
+def encrypt_timed(value):
+
+    start_time = time.time()
+    encrypted = encrypt(value)
+    record_time('encrypt', time.time() - start_time)
+
+    return (encrypted.ciphertext(be_secure = False), encrypted.exponent)
 
-def get_expected_result(operand_1, operand_2, operation):
+def encrypt_raw(plaintext):
 
-    if operation == 'x*':
-        return operand_1 * operand_2
+    if obfuscator_pool is not None:
+        return obfuscator_pool.raw_encrypt(plaintext)
+
+    return public_key.raw_encrypt(plaintext)
+
+def generate_random_packed_operation():
+
+    # pick an operation at random, and as many operand pairs as there are 
+    # slots in a packed ciphertext
+    operation = random.choice(scalar_operations)
+    operand_1 = [ random.uniform(0.0, 100.0) for i in xrange(value_packing.slots) ]
+
+    if operation == '+':
+        operand_2 = [ random.uniform(0.0, 100.0) for i in xrange(value_packing.slots) ]
+        expected_result = [ clientlib.get_expected_result(a, b, operation) for a, b in zip(operand_1, operand_2) ]
     else:
-        return operand_1 + operand_2
+        operand_2 = random.uniform(0.0, 100.0)
+        expected_result = [ clientlib.get_expected_result(a, operand_2, operation) for a in operand_1 ]
 
-def generate_random_request(mode = 'encrypted'):
+    operation_msg = {}
+    operation_msg['operation'] = 'p' + operation
 
-    # client request to send to server encoded in json
-    message = {}
-    message['type'] = 'request'
-    message['mode'] = mode
+    start_time = time.time()
+    operation_msg['operand_1'] = (value_packing.encrypt(operand_1, encrypt_raw), 0)
+    record_time('encrypt', time.time() - start_time)
+
+    # operand 2 is a large integer in all cases : a packed ciphertext ('+'), 
+    # a packed plaintext ('+*'), or a fixed-point multiplier ('x*')
+    if operation == '+':
+        start_time = time.time()
+        operation_msg['operand_2'] = (value_packing.encrypt(operand_2, encrypt_raw), 0)
+        record_time('encrypt', time.time() - start_time)
+    elif operation == '+*':
+        operation_msg['operand_2'] = (value_packing.pack([operand_2] * value_packing.slots), 0)
+    else:
+        operation_msg['operand_2'] = (value_packing.encode_scalar(operand_2), 0)
+
+    return operand_1, operand_2, expected_result, operation_msg
+
+def generate_random_vector_operation(mode, operation):
+
+    operation_msg = {}
+    operation_msg['operation'] = operation
 
-    # in the paillier cryptosystem, a public key is a base g and modulus n
-    message['public_key'] = {'g': public_key.g, 'n': public_key.n}
+    # operand 1 is a vector of values, operand 2 a vector of weights 
+    # (for dot products only)
+    operand_1 = [ random.uniform(0.0, 100.0) for i in xrange(vector_size) ]
+
+    if operation == 'dot':
+        operand_2 = [ random.uniform(0.0, 1.0) for i in xrange(vector_size) ]
+    else:
+        operand_2 = []
+
+    expected_result = clientlib.get_expected_result(operand_1, operand_2, operation)
+
+    if mode == 'encrypted':
+        operation_msg['operand_1'] = [ encrypt_timed(value) for value in operand_1 ]
+    else:
+        operation_msg['operand_1'] = operand_1
+
+    operation_msg['operand_2'] = operand_2
+
+    return operand_1, operand_2, expected_result, operation_msg
+
+def generate_random_operation(mode = 'encrypted'):
+
+    if mode == 'encrypted' and value_packing is not None:
+        return generate_random_packed_operation()
 
     # pick an operation at random
-    operation = random.choice(operations)
-    message['operation'] = operation
+    if vector_size > 0:
+        operation = random.choice(operations)
+    else:
+        operation = random.choice(scalar_operations)
+
+    if operation in vector_operations:
+        return generate_random_vector_operation(mode, operation)
+
+    operation_msg = {}
+    operation_msg['operation'] = operation
 
     # pick 2 operands at random
     operand_1 = random.uniform(0.0, 100.0)
     operand_2 = random.uniform(0.0, 100.0)
-    expected_result = get_expected_result(operand_1, operand_2, operation)
+    expected_result = clientlib.get_expected_result(operand_1, operand_2, operation)
 
     if mode == 'encrypted':
         # send the encrypted operands (operand 1 is encrypted for sure, operand 
         # 2 depends on the operation)
         start_time = time.time()
-        encrypted_operand_1 = public_key.encrypt(operand_1)
-        processing_times['encrypt'].append(time.time() - start_time)
-        message['operand_1'] = (str(encrypted_operand_1.ciphertext()), encrypted_operand_1.exponent)
+        encrypted_operand_1 = encrypt(operand_1)
+        record_time('encrypt', time.time() - start_time)
+        operation_msg['operand_1'] = (encrypted_operand_1.ciphertext(be_secure = False), encrypted_operand_1.exponent)
 
         # if operation is plain addition, encrypt the 2nd operand too 
         if operation == '+':
             start_time = time.time()
-            encrypted_operand_2 = public_key.encrypt(operand_2)
-            processing_times['encrypt'].append(time.time() - start_time)
-            message['operand_2'] = (str(encrypted_operand_2.ciphertext()), encrypted_operand_2.exponent)
+            encrypted_operand_2 = encrypt(operand_2)
+            record_time('encrypt', time.time() - start_time)
+            operation_msg['operand_2'] = (encrypted_operand_2.ciphertext(be_secure = False), encrypted_operand_2.exponent)
         else:
-            message['operand_2'] = str(operand_2)
+            operation_msg['operand_2'] = operand_2
 
     else:
-        message['operand_1'] = str(operand_1)
-        message['operand_2'] = str(operand_2)
+        operation_msg['operand_1'] = operand_1
+        operation_msg['operand_2'] = operand_2
+
+    # return the unencrypted operands and operation contents
+    return operand_1, operand_2, expected_result, operation_msg
+
+def generate_random_request(mode = 'encrypted'):
+
+    # client request to send to server encoded in json
+    operand_1, operand_2, expected_result, message = generate_random_operation(mode)
+    message['type'] = 'request'
+    message['mode'] = mode
+
+    # the public key is registered w/ the server beforehand (see 
+    # register_key()), so we only need to send its id
+    if mode == 'encrypted':
+        message['key_id'] = key_id
 
     # return the unencrypted operands and message contents
     return operand_1, operand_2, expected_result, message
 
+def generate_random_batch(mode = 'encrypted', batch_size = 1):
+
+    # a batch request carries several (random) operations, all w/ the same 
+    # mode, evaluated by the server in a single pass
+    message = {}
+    message['type'] = 'batch'
+    message['mode'] = mode
+    message['ops'] = []
+
+    if mode == 'encrypted':
+        message['key_id'] = key_id
+
+    # unencrypted operands, operation and expected result of each op
+    ops = []
+    for i in xrange(batch_size):
+        operand_1, operand_2, expected_result, operation_msg = generate_random_operation(mode)
+        ops.append((operand_1, operand_2, expected_result, operation_msg['operation']))
+        message['ops'].append(operation_msg)
+
+    return ops, message
+
+def decode_result(mode, result):
+
+    if mode == 'encrypted':
+
+        encrypted_result = paillier.EncryptedNumber(public_key, int(result[0]), int(result[1]))
+
+        start_time = time.time()
+        result = private_key.decrypt(encrypted_result)
+        record_time('decrypt', time.time() - start_time)
+
+        return result
+
+    else:
+        return float(result)
+
+# max. error of the result of an encrypted operation, due to the rounding 
+# of its operands to the agreed precision (None if there's no agreed 
+# precision)
+def result_tolerance(mode, operation, operand_1, operand_2):
+
+    if mode != 'encrypted' or fixed_exponent is None:
+        return None
+
+    # each encoded value is off by at most half a unit of its last digit
+    error = 0.5 * pow(paillier.EncodedNumber.BASE, fixed_exponent)
+
+    if operation in ['+', '+*']:
+        # the server encodes the scalar in '+*' w/ the same precision
+        tolerance = 2 * error
+    elif operation == 'x*':
+        tolerance = error * abs(operand_2)
+    elif operation == 'sum':
+        tolerance = error * len(operand_1)
+    elif operation == 'dot':
+        tolerance = error * sum(abs(w) for w in operand_2)
+    else:
+        tolerance = error
+
+    # on top of the (float) rounding errors in the client's expected result
+    return tolerance + 1e-9 * max(1.0, abs(clientlib.get_expected_result(operand_1, operand_2, operation)))
+
+def check_result(operation, result, expected_result, tolerance = None):
+
+    # packed values (or values w/ a fixed precision) are rounded, and vector 
+    # operations add up values in a different order (and precision) than 
+    # the client does
+    if tolerance is not None:
+        wrong = abs(result - expected_result) > tolerance
+    elif operation in vector_operations:
+        wrong = abs(result - expected_result) > 1e-9 * max(1.0, abs(expected_result))
+    else:
+        wrong = (result != expected_result)
+
+    key = 'wrong' if wrong else 'correct'
+
+    with results_lock:
+
+        if key not in correctness:
+            correctness[key] = [0, 0, 0, 0, 0, 0]
+
+        correctness[key][operations.index(operation)] += 1
+
+def send_message(sock, message):
+    send_messages(sock, [message])
+
+# sends several messages w/ a single (vectored, if possible) write
+def send_messages(sock, messages):
+
+    bodies = [ wire.encode(message, wire_format, ciphertext_width) for message in messages ]
+
+    if trace_writer is not None:
+        for message, body in zip(messages, bodies):
+            trace_writer.record(message, body)
+
+    transport.send_frames(sock, bodies, shm_channel.outbound if shm_channel is not None else None)
+
+# bytes received after the last response, i.e. the beginning of the next 
+# response(s), when requests are pipelined
+frame_reader = transport.FrameReader()
+
+def recv_message(sock):
+    return wire.decode(frame_reader.recv_frame(sock))
+
+# asks the server to pass large frames (both ways) through a pair of shared 
+# memory rings (see clientlib.setup_shm()). returns the channel, or None if 
+# the server doesn't agree to it.
+def setup_shm(sock, size):
+
+    try:
+        channel = clientlib.setup_shm(lambda message: send_message(sock, message), lambda: recv_message(sock), size)
+    except ValueError, e:
+        print('[WARNING] %s' % (e))
+        return None
+
+    frame_reader.ring = channel.inbound
+    print('passing frames of %d bytes or more through shared memory rings of %d bytes' % (transport.RING_MIN_FRAME, size))
+
+    return channel
+
+def registration_message(fmt = 'json'):
+    return clientlib.registration_message(public_key, fmt, fixed_exponent)
+
+def register_key(sock, fmt = 'json'):
+
+    global wire_format
+
+    response = clientlib.register_key(lambda message: send_message(sock, message), lambda: recv_message(sock), 
+        public_key, fmt, fixed_exponent)
+
+    wire_format = response.get('format', 'json')
+    print('registered public key %s (wire format : %s)' % (key_id, wire_format))
+
+    # older servers don't know about fixed exponents : our values are still 
+    # rounded to the same precision, but the server aligns their exponents 
+    # as usual
+    if fixed_exponent is not None and response.get('exponent') != fixed_exponent:
+        print('[WARNING] server did not agree to fixed exponent %d' % (fixed_exponent))
+
+# generates a random request (or batch of requests) w/ nr_ops operations
+def generate_random_message(mode = 'encrypted', nr_ops = 1):
+
+    if nr_ops > 1:
+        ops, body = generate_random_batch(mode, nr_ops)
+    else:
+        operand_1, operand_2, expected_result, body = generate_random_request(mode)
+        ops = [(operand_1, operand_2, expected_result, body['operation'])]
+
+    for operand_1, operand_2, expected_result, operation in ops:
+        print('request : %s %s %s (= %s)' % (format_operand(operand_1), operation, format_operand(operand_2), format_operand(expected_result)))
+
+    return ops, body
+
+def process_response(mode, ops, response):
+
+    if 'first-request' not in processing_times:
+        record_time('first-request', time.time() - client_start_time)
+
+    if 'results' in response:
+        results = response['results']
+    else:
+        results = [response['result']]
+
+    if mode == 'encrypted' and value_packing is not None:
+
+        for (operand_1, operand_2, expected_result, operation), result in zip(ops, results):
+
+            # packed results are unpacked into one value per slot
+            start_time = time.time()
+            result = value_packing.decrypt(private_key, int(result[0]), len(expected_result), 
+                value_packing.result_fraction_bits(operation))
+            record_time('decrypt', time.time() - start_time)
+
+            tolerance = value_packing.tolerance(operation)
+            error = max(abs(r - e) for r, e in zip(result, expected_result))
+            print('response : %s %s %s = %s (max. error : %e)' % (format_operand(operand_1), operation, format_operand(operand_2), format_operand(result), error))
+
+            for r, e in zip(result, expected_result):
+                check_result(operation[1:], r, e, tolerance)
+
+        return
+
+    if mode == 'encrypted' and decryptor_pool is not None:
+
+        # decrypt the results on the decryptor processes, and check them 
+        # once they're done, while we carry on w/ the next responses
+        def check_batch(offset, plaintexts, duration, error):
+
+            if error is not None:
+                print('[ERROR] failed to decrypt results %d to %d : %s' % (offset, 
+                    min(offset + decryptor_pool.batch_size, len(ops)) - 1, error))
+                return
+
+            with results_lock:
+                processing_times['decrypt-batch'].append(duration)
+                # per result decryption time, on average
+                processing_times['decrypt'].extend([ duration / len(plaintexts) ] * len(plaintexts))
+
+            for (operand_1, operand_2, expected_result, operation), result in zip(ops[offset:], plaintexts):
+                print('response : %s %s %s = %f (%f)' % (format_operand(operand_1), operation, format_operand(operand_2), result, expected_result))
+                check_result(operation, result, expected_result, result_tolerance(mode, operation, operand_1, operand_2))
+
+        decryptor_pool.decrypt_async([ (int(c), int(e)) for c, e in results ], check_batch)
+        return
+
+    for (operand_1, operand_2, expected_result, operation), result in zip(ops, results):
+
+        result = decode_result(mode, result)
+        print('response : %s %s %s = %f (%f)' % (format_operand(operand_1), operation, format_operand(operand_2), result, expected_result))
+        check_result(operation, result, expected_result, result_tolerance(mode, operation, operand_1, operand_2))
+
+# loads our key pair from the key store, generating it if needed. returns 
+# the key id, public and private key.
+def load_keys(key_store, key_size = 2048, requested_key_id = None, new_key = False):
+
+    if key_store is None or new_key:
+        public_key, private_key = paillier.generate_paillier_keypair(n_length = key_size)
+        if key_store is not None:
+            key_store.save(public_key, private_key)
+
+    elif requested_key_id is not None:
+        public_key, private_key = key_store.load(requested_key_id)
+
+    else:
+        requested_key_id, public_key, private_key = key_store.get(key_size)
+
+    return keycache.key_fingerprint(public_key.g, public_key.n), public_key, private_key
+
+def register_op_message(op, name, operand = None, encrypted = False, reply = True):
+
+    message = {}
+    message['type'] = 'register_op'
+    message['mode'] = 'encrypted'
+    message['key_id'] = key_id
+    message['op'] = op
+    message['register'] = name
+    message['reply'] = reply
+
+    if operand is not None:
+        message['operand'] = operand
+        message['encrypted'] = encrypted
+
+    return message
+
+# streams nr_ops contributions (alternately encrypted values and scalars) 
+# into nr_registers encrypted registers on the server, w/o waiting for any 
+# response, then scales each register by 1/N and reads it back, i.e. gets 
+# the mean of the contributions to each register
+def run_registers(sock, nr_ops, nr_registers):
+
+    contributions = defaultdict(list)
+
+    start_time = time.time()
+    for i in xrange(nr_ops):
+
+        name = 'r%d' % (i % nr_registers)
+        value = random.uniform(0, 100)
+        contributions[name].append(value)
+
+        if i % 2 == 0:
+            message = register_op_message('add_to', name, encrypt_timed(value), encrypted = True, reply = False)
+        else:
+            message = register_op_message('add_to', name, value, reply = False)
+
+        send_message(sock, message)
+
+    record_time('register-stream', time.time() - start_time)
+
+    for name, values in sorted(contributions.items()):
+
+        send_messages(sock, [
+            register_op_message('scale', name, 1.0 / len(values), reply = False),
+            register_op_message('read', name) ])
+
+        response = recv_message(sock)
+        if response['type'] != 'register_value':
+            raise ValueError('unexpected response to register read : %s' % (response))
+
+        # the server may have dropped the register (see '--max-registers' 
+        # and '--register-ttl' on the server), in which case some (or all) 
+        # of our contributions are lost
+        if response['count'] != len(values):
+            print('[WARNING] register %s lost %d of %d contributions' % (name, len(values) - response['count'], len(values)))
+            if response['value'] is None:
+                continue
+
+        result = decode_result('encrypted', response['value'])
+        expected_result = clientlib.get_expected_result(values, None, 'mean')
+        print('register %s : mean of %d values = %f (%f)' % (name, len(values), result, expected_result))
+        check_result('mean', result, expected_result, result_tolerance('encrypted', 'mean', values, None))
+
+    record_time('registers', time.time() - start_time)
+    print('registers : %d contributions to %d registers in %.3f sec (streamed in %.3f sec)' % (nr_ops, len(contributions), 
+        processing_times['registers'][0], processing_times['register-stream'][0]))
+
+# keeps up to window requests in flight, each w/ its own request id, and 
+# handles responses in whatever order the server sends them
+def run_pipelined(sock, mode, nr_ops, batch_size = 1, window = 1, fmt = 'json'):
+
+    # request id -> (ops, message) of requests w/o a response
+    pending = {}
+    next_id = 1
+
+    i = 0
+    while i < nr_ops or pending:
+
+        # fill the window
+        while i < nr_ops and len(pending) < window:
+
+            ops, body = generate_random_message(mode, min(batch_size, nr_ops - i))
+            body['id'] = next_id
+            pending[next_id] = (ops, body)
+            send_message(sock, body)
+
+            next_id += 1
+            i += len(ops)
+
+        response = recv_message(sock)
+
+        if response['type'] == 'registered':
+            # response to a re-registration (see below)
+            continue
+
+        elif response['type'] == 'error' and response['error'] == 'unknown key':
+            # the server has evicted our key : register it again and 
+            # re-send the request. the server handles messages in order, so 
+            # there's no need to wait for the registration to complete.
+            send_messages(sock, [registration_message(fmt), pending[response['id']][1]])
+            continue
+
+        elif response['type'] == 'error' and response['error'] == 'busy':
+            # the server's work queue is full : back off, and re-send the 
+            # request
+            time.sleep(BUSY_BACKOFF)
+            send_message(sock, pending[response['id']][1])
+            continue
+
+        ops, body = pending.pop(response['id'])
+        process_response(mode, ops, response)
+
 def print_graph(data):
 
+    # plotting dependencies are slow to import, and only needed here
+    import numpy as np
+    import matplotlib
+    import matplotlib.pyplot as plt
+
     fig = plt.figure(figsize=(5, 4))
 
     for mode in ['crypt-times', 'errors']:
@@ -97,8 +610,8 @@ def print_graph(data):
             for k in ['encrypt', 'decrypt']:
                 # if max(data[k]) > n:
                 #     n = max(data['encrypt'])
-                if np.percentile(data[k], 0.90) > n:
-                    n = np.percentile(data[k], 0.90)
+                if np.percentile(data[k], 90) > n:
+                    n = np.percentile(data[k], 90)
                     print('client::print_graph() : %f (%d)' % (n, int(math.log10(n))))
 
             log_n = int(math.log10(n))
@@ -138,90 +651,253 @@ if __name__ == "__main__":
         "--nr-ops", 
          help = """nr. of operations to request""")
 
+    parser.add_argument(
+        "--batch-size", 
+         help = """nr. of operations to send in a single batch request (default : 1, i.e. no batching)""")
+
+    parser.add_argument(
+        "--format", 
+         help = """wire format for requests and responses : 'binary' or 'json' (default : binary)""")
+
+    parser.add_argument(
+        "--window", 
+         help = """max. nr. of requests in flight, i.e. sent w/o a response (default : 1, i.e. no pipelining)""")
+
+    parser.add_argument(
+        "--obfuscator-pool", 
+         help = """precompute up to <obfuscator-pool> encryption obfuscators in the background (default : 0, i.e. no precomputation)""")
+
+    parser.add_argument(
+        "--obfuscator-mode", 
+         help = """precompute obfuscators on a 'thread' or on a separate 'process' (default : thread)""")
+
+    parser.add_argument(
+        "--decrypt-workers", 
+         help = """decrypt results on <decrypt-workers> processes, in the background (default : 0, i.e. decrypt inline)""")
+
+    parser.add_argument(
+        "--decrypt-batch-size", 
+         help = """max. nr. of results handed to a decrypt worker at once (default : 16)""")
+
+    parser.add_argument(
+        "--vector-size", 
+         help = """also request vector operations (sum, dot product and mean) over <vector-size> values (default : 0, i.e. no vector operations)""")
+
+    parser.add_argument(
+        "--packing", 
+         help = """pack several values into each encrypted operand (encrypted operations only)""",
+         action = "store_true")
+
+    parser.add_argument(
+        "--slot-bits", 
+         help = """nr. of bits per packed value, w/ '--packing' (default : 64)""")
+
+    parser.add_argument(
+        "--fraction-bits", 
+         help = """nr. of fractional bits of packed values and scalars, w/ '--packing' (default : 20)""")
+
+    parser.add_argument(
+        "--fixed-precision", 
+         help = """encrypt all values w/ the same exponent, w/ (at least) precision <fixed-precision> (e.g. 1e-6), so that the server adds them w/o aligning exponents (default : off, i.e. exponents depend on each value)""")
+
+    parser.add_argument(
+        "--key-size", 
+         help = """size of the paillier key, in bits (default : 2048)""")
+
+    parser.add_argument(
+        "--key-id", 
+         help = """use the key w/ id <key-id> from the key store (default : the oldest stored key of <key-size> bits)""")
+
+    parser.add_argument(
+        "--keystore", 
+         help = """directory of the key store, or 'none' to generate a new key (w/o storing it) (default : %s)""" % (keystore.DEFAULT_PATH))
+
+    parser.add_argument(
+        "--new-key", 
+         help = """generate a new key (and add it to the key store)""",
+         action = "store_true")
+
+    parser.add_argument(
+        "--registers", 
+         help = """also stream <nr-ops> contributions into <registers> encrypted registers on the server, and read back their means (default : 0, i.e. no registers)""")
+
+    parser.add_argument(
+        "--transport", 
+         help = """how to reach the server : 'tcp', 'unix' (unix socket) or 'shm' (unix socket, w/ large frames in shared memory) (default : tcp)""")
+
+    parser.add_argument(
+        "--unix-socket", 
+         help = """path of the server's unix socket, w/ '--transport unix' or 'shm' (default : %s)""" % (transport.DEFAULT_UNIX_SOCKET))
+
+    parser.add_argument(
+        "--shm-size", 
+         help = """size of each shared memory ring, in bytes, w/ '--transport shm' (default : %d)""" % (transport.RING_SIZE))
+
+    parser.add_argument(
+        "--record", 
+         help = """record the request stream to trace file <record>, for replay.py""")
+
+    parser.add_argument(
+        "--backend", 
+         help = """big integer arithmetic backend : 'gmpy2', 'python' or 'auto' (default : auto, i.e. gmpy2 if installed)""")
+
     args = parser.parse_args()
 
-    if not args.nr_ops:
-        nr_ops = 100
-    else:
-        nr_ops = int(args.nr_ops)
+    try:
+        backend.select(args.backend)
+    except ValueError, e:
+        sys.stderr.write("""%s: [ERROR] %s\n""" % (sys.argv[0], e.args[0])) 
+        sys.exit(1)
 
-    # create a tpc/ip socket
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    print('arithmetic backend : %s' % (backend.describe()))
 
-    # connect the socket to the port where the server is listening
-    server_address = ('localhost', 10000)
-    print('connecting to %s port %s' % (server_address))
-    sock.connect(server_address)
+    if not args.format:
+        args.format = 'binary'
 
-    # set socket to non-blocking mode
-    # fcntl.fcntl(sock, fcntl.F_SETFL, os.O_NONBLOCK)
+    if not args.transport:
+        args.transport = 'tcp'
 
-    # run some requests on the server and time it
-    for mode in ['encrypted', 'unencrypted']:
+    if args.transport not in transport.TRANSPORTS:
+        sys.stderr.write("""%s: [ERROR] unknown transport : %s\n""" % (sys.argv[0], args.transport)) 
+        parser.print_help()
+        sys.exit(1)
 
-        for i in xrange(nr_ops):
+    if args.format not in wire.FORMATS:
+        sys.stderr.write("""%s: [ERROR] unknown wire format : %s\n""" % (sys.argv[0], args.format)) 
+        parser.print_help()
+        sys.exit(1)
 
-            try:
-                
-                # generate a random request
-                operand_1, operand_2, expected_result, body = generate_random_request(mode)
-                print('request : %f %s %f (= %f)' % (operand_1, body['operation'], operand_2, expected_result))
+    if not args.nr_ops:
+        nr_ops = 100
+    else:
+        nr_ops = int(args.nr_ops)
 
-                # send the message
-                body = json.dumps(body)
-                body_len = len(body)
-                sock.sendall(str(body_len) + '\r\n' + body)
+    if not args.batch_size:
+        batch_size = 1
+    else:
+        batch_size = int(args.batch_size)
 
-                response = ''
-                response_size = 1
+    if args.vector_size:
+        vector_size = int(args.vector_size)
 
-                while len(response) < response_size:
+    if args.keystore == 'none':
+        key_store = None
+    else:
+        key_store = keystore.KeyStore(args.keystore if args.keystore else keystore.DEFAULT_PATH)
 
-                    # keep buffering the response
-                    response += sock.recv(4096)
+    try:
+        start_time = time.time()
+        key_id, public_key, private_key = load_keys(key_store, 
+            int(args.key_size) if args.key_size else 2048, args.key_id, args.new_key)
+        record_time('key-setup', time.time() - start_time)
+
+    # w/o gmpy2, phe can't generate keys (unless pycrypto is installed)
+    except (KeyError, NotImplementedError), e:
+        sys.stderr.write("""%s: [ERROR] %s\n""" % (sys.argv[0], e.args[0])) 
+        sys.exit(1)
+
+    ciphertext_width = wire.ciphertext_width(public_key)
+
+    if args.fixed_precision:
+        fixed_precision = float(args.fixed_precision)
+        # the same exponent phe picks for values encrypted w/ this precision
+        fixed_exponent = paillier.EncodedNumber.encode(public_key, 0.0, fixed_precision).exponent
+        print('fixed precision : %g (exponent : %d)' % (fixed_precision, fixed_exponent))
+    print('using %d bit key %s (setup : %.3f sec)' % (public_key.n.bit_length(), key_id, processing_times['key-setup'][0]))
+
+    if args.packing:
+        fraction_bits = int(args.fraction_bits) if args.fraction_bits else 20
+        value_packing = packing.Packing(public_key, 
+            slot_bits = int(args.slot_bits) if args.slot_bits else 64, 
+            fraction_bits = fraction_bits, scalar_fraction_bits = fraction_bits)
+        print('packing %d values per ciphertext' % (value_packing.slots))
+
+    if not args.window:
+        window = 1
+    else:
+        window = int(args.window)
 
-                    # extract the response size
-                    if '\r\n' in response:
-                        response_size_str = response.split('\r\n', 1)[0]
-                        response_size = len(response_size_str) + 2 + int(response_size_str)
+    # start the decrypt processes before any thread is started
+    if args.decrypt_workers and int(args.decrypt_workers) > 0:
+        decryptor_pool = decryptor.DecryptorPool(private_key, int(args.decrypt_workers), 
+            batch_size = int(args.decrypt_batch_size) if args.decrypt_batch_size else 16)
 
-                    else:
-                        response_size = len(response) + 1
+    if args.obfuscator_pool and int(args.obfuscator_pool) > 0:
+        obfuscator_pool = obfuscator.ObfuscatorPool(public_key, int(args.obfuscator_pool), 
+            mode = args.obfuscator_mode if args.obfuscator_mode else 'thread')
 
-                    print('response_size : %d (/%d)' % (response_size, len(response)))
+    # connect to the server, over TCP (to the port where the server is 
+    # listening) or a unix socket
+    server_address = ('localhost', 10000)
+    unix_path = args.unix_socket if args.unix_socket else transport.DEFAULT_UNIX_SOCKET
+    if args.transport == 'tcp':
+        print('connecting to %s port %s' % (server_address))
+    else:
+        print('connecting to %s' % (unix_path))
+    sock = transport.connect(args.transport, server_address, unix_path)
 
-                response = json.loads(response.split('\r\n', 1)[1])
+    if args.transport == 'shm':
+        shm_channel = setup_shm(sock, int(args.shm_size) if args.shm_size else transport.RING_SIZE)
 
-                if mode == 'encrypted':
+    # handshake : register our public key w/ the server
+    register_key(sock, args.format)
 
-                    encrypted_result = paillier.EncryptedNumber(public_key, 
-                                                                int(response['result'][0]), 
-                                                                int(response['result'][1]))
+    # the trace is labelled w/ the wire format the server agreed to, so it's 
+    # only created once the handshake is done. the registration is recorded 
+    # as it was sent (control messages always go in json).
+    if args.record:
+        trace_writer = tracefile.TraceWriter(args.record, {'key_id' : key_id, 
+            'key_size' : public_key.n.bit_length(), 'format' : wire_format})
+        message = registration_message(args.format)
+        trace_writer.record(message, wire.encode(message))
+        print('recording requests to %s' % (args.record))
 
-                    start_time = time.time()
-                    result = private_key.decrypt(encrypted_result)
-                    processing_times['decrypt'].append(time.time() - start_time)
+    # set socket to non-blocking mode
+    # fcntl.fcntl(sock, fcntl.F_SETFL, os.O_NONBLOCK)
 
-                    print('response : %f %s %f = %f (%f)' % (operand_1, response['operation'], operand_2, result, expected_result))
+    # run some requests on the server and time it
+    for mode in ['encrypted', 'unencrypted']:
 
-                else:
+        if window > 1:
 
-                    result = float(response['result'])
-                    print('response : %f %s %f = %f (%f)' % (operand_1, response['operation'], operand_2, result, expected_result))
+            try:
+                run_pipelined(sock, mode, nr_ops, batch_size, window, args.format)
 
-                if result != expected_result:
+            except socket.error, e:
+                print('error occurred : %s. aborting.' % (e))
+                sock.close()
+                sys.exit(1)
 
-                    if 'wrong' not in correctness:
-                        correctness['wrong'] = [0, 0, 0, 0, 0, 0]
+            continue
 
-                    correctness['wrong'][operations.index(response['operation'])] += 1
+        for i in xrange(0, nr_ops, batch_size):
 
-                else:
+            try:
+                
+                # generate a random request (or batch of requests)
+                ops, body = generate_random_message(mode, min(batch_size, nr_ops - i))
+
+                # send the message
+                send_message(sock, body)
+                response = recv_message(sock)
+
+                while response['type'] == 'error':
+
+                    if response['error'] == 'unknown key':
+                        # the server has evicted our key : register it again 
+                        # and re-send the request
+                        register_key(sock, args.format)
+                    elif response['error'] == 'busy':
+                        # the server's work queue is full : back off, and 
+                        # re-send the request
+                        time.sleep(BUSY_BACKOFF)
+                    else:
+                        raise ValueError('unexpected response : %s' % (response))
 
-                    if 'correct' not in correctness:
-                        correctness['correct'] = [0, 0, 0, 0, 0, 0]
+                    send_message(sock, body)
+                    response = recv_message(sock)
 
-                    correctness['correct'][operations.index(response['operation'])] += 1
+                process_response(mode, ops, response)
 
             except socket.error, e:
 
@@ -236,6 +912,28 @@ if __name__ == "__main__":
                     sock.close()
                     sys.exit(1)
 
+    if args.registers and int(args.registers) > 0:
+
+        try:
+            run_registers(sock, nr_ops, int(args.registers))
+
+        except socket.error, e:
+            print('error occurred : %s. aborting.' % (e))
+            sock.close()
+            sys.exit(1)
+
+    if decryptor_pool is not None:
+        # wait for the last results to be decrypted and checked : from now 
+        # on, only the main thread touches the results
+        decryptor_pool.close()
+
+    if obfuscator_pool is not None:
+        print('obfuscator pool : %d hits, %d misses' % (obfuscator_pool.hits, obfuscator_pool.misses))
+        obfuscator_pool.close()
+
+    if 'first-request' in processing_times:
+        print('time to first request : %.3f sec (key setup : %.3f sec)' % (processing_times['first-request'][0], processing_times['key-setup'][0]))
+
     if mode == 'unencrypted' and args.plot:
 
         # print the client data
@@ -244,19 +942,17 @@ if __name__ == "__main__":
         plot = {}
         plot['type'] = 'plot'
         plot['mode'] = mode
-
-        body = json.dumps(plot)
-        body_len = len(body)
-        sock.sendall(str(body_len) + '\r\n' + body)
+        send_message(sock, plot)
 
     else:
         # terminate the connection
         terminate = {}
         terminate['type'] = 'terminate'
         terminate['mode'] = mode
-
-        body = json.dumps(terminate)
-        body_len = len(body)
-        sock.sendall(str(body_len) + '\r\n' + body)
+        send_message(sock, terminate)
         
     sock.close()
+
+    if trace_writer is not None:
+        trace_writer.close()
+        print('recorded %d requests (%d bytes) to %s' % (trace_writer.nr_records, trace_writer.nr_bytes, args.record))
@@ -0,0 +1,76 @@
+import keycache
+import transport
+
+# the client side of the protocol, shared by the tools which talk to the
+# server (client.py, benchmark.py and loadgen.py) : the handshake (key
+# registration, and shared memory rings), and the plaintext results of
+# operations, to check the server's against. messages are sent and
+# received through send(message) and recv() callables, so that each tool
+# keeps its own framing (e.g. locks, rings, or trace recording).
+
+def get_expected_result(operand_1, operand_2, operation):
+
+    if operation == 'x*':
+        return operand_1 * operand_2
+    elif operation == 'sum':
+        return sum(operand_1)
+    elif operation == 'dot':
+        return sum(x * w for x, w in zip(operand_1, operand_2))
+    elif operation == 'mean':
+        return sum(operand_1) / len(operand_1)
+    else:
+        return operand_1 + operand_2
+
+def registration_message(public_key, fmt = 'json', exponent = None):
+
+    # in the paillier cryptosystem, a public key is a base g and modulus n
+    message = {}
+    message['type'] = 'register'
+    message['public_key'] = {'g': public_key.g, 'n': public_key.n}
+    # ask for a wire format : the server may not support it, in which case
+    # we fall back to json
+    message['format'] = fmt
+    # and a fixed exponent for our encrypted values, if any
+    if exponent is not None:
+        message['exponent'] = exponent
+
+    return message
+
+# registers public_key w/ the server, and returns its response, w/ the
+# wire format (and exponent, if any) it agreed to. raises a ValueError on
+# any other response.
+def register_key(send, recv, public_key, fmt = 'json', exponent = None):
+
+    send(registration_message(public_key, fmt, exponent))
+
+    response = recv()
+    if response['type'] != 'registered' or response['key_id'] != keycache.key_fingerprint(public_key.g, public_key.n):
+        raise ValueError('unexpected response to key registration : %s' % (response))
+
+    return response
+
+# asks the server to pass large frames (both ways) through a pair of shared
+# memory rings, in a file we create. returns the channel, or raises a
+# ValueError if the server doesn't agree to it.
+def setup_shm(send, recv, size):
+
+    channel = transport.ShmChannel.create(size)
+
+    try:
+        message = {}
+        message['type'] = 'shm'
+        message['path'] = channel.path
+        message['size'] = size
+        send(message)
+
+        response = recv()
+
+    finally:
+        # once the server has mapped the file (or not), it's no longer needed
+        channel.unlink()
+
+    if response['type'] != 'shm' or 'error' in response:
+        channel.close()
+        raise ValueError('server did not agree to shared memory rings : %s' % (response.get('error', response)))
+
+    return channel
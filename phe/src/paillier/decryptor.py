@@ -0,0 +1,136 @@
+import time
+import signal
+import threading
+import multiprocessing
+
+from phe import paillier # for hpe operations
+
+# decrypts batches (or streams) of ciphertexts on a pool of processes, so 
+# that decryption runs on several cores, and overlaps w/ whatever the 
+# client is doing meanwhile (e.g. receiving responses). ciphertexts are 
+# passed around as (ciphertext, exponent) tuples.
+
+# per worker process : the private key stays here for the lifetime of the 
+# worker, so that it's sent to each worker only once
+worker_key = None
+
+def init_worker(private_key):
+
+    global worker_key
+
+    # SIGINT is handled by the client process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker_key = private_key
+
+# runs on a worker process. returns the plaintexts and the time it took to 
+# decrypt them.
+def decrypt_batch(batch):
+
+    start_time = time.time()
+
+    plaintexts = []
+    for ciphertext, exponent in batch:
+        encrypted_number = paillier.EncryptedNumber(worker_key.public_key, ciphertext, exponent)
+        plaintexts.append(worker_key.decrypt(encrypted_number))
+
+    return plaintexts, time.time() - start_time
+
+# runs on a worker process, for decrypt_async() : apply_async() has no 
+# error callback (in python 2.7), so errors are returned, as a description 
+# (which is always picklable). returns the plaintexts (or None), the time 
+# it took, and the error (or None).
+def try_decrypt_batch(batch):
+
+    start_time = time.time()
+
+    try:
+        plaintexts, duration = decrypt_batch(batch)
+        return plaintexts, duration, None
+
+    except Exception, e:
+        return None, time.time() - start_time, '%s : %s' % (e.__class__.__name__, e)
+
+class DecryptorPool:
+
+    def __init__(self, private_key, nr_workers = None, batch_size = 16):
+
+        if nr_workers is None:
+            nr_workers = multiprocessing.cpu_count()
+
+        self.batch_size = batch_size
+        self.pool = multiprocessing.Pool(nr_workers, initializer = init_worker, initargs = (private_key,))
+
+        # nr. of batches handed to decrypt_async(), w/o a result yet
+        self.pending = 0
+        self.pending_cond = threading.Condition()
+
+    def split(self, ciphertexts):
+        return [ ciphertexts[i:i + self.batch_size] for i in xrange(0, len(ciphertexts), self.batch_size) ]
+
+    # decrypts a list of ciphertexts, and blocks until done. returns the 
+    # plaintexts, and the per-batch decryption times.
+    def decrypt(self, ciphertexts):
+
+        plaintexts = []
+        durations = []
+        for batch_plaintexts, duration in self.pool.map(decrypt_batch, self.split(ciphertexts), chunksize = 1):
+            plaintexts.extend(batch_plaintexts)
+            durations.append(duration)
+
+        return plaintexts, durations
+
+    # decrypts a stream of ciphertexts, yielding (plaintexts, duration) as 
+    # each batch is decrypted, in order
+    def decrypt_stream(self, ciphertexts):
+
+        def batches():
+
+            batch = []
+            for ciphertext in ciphertexts:
+                batch.append(ciphertext)
+                if len(batch) == self.batch_size:
+                    yield batch
+                    batch = []
+
+            if batch:
+                yield batch
+
+        return self.pool.imap(decrypt_batch, batches())
+
+    # decrypts a list of ciphertexts in the background, and calls 
+    # callback(offset, plaintexts, duration, error) for each batch, in the 
+    # order batches are done, w/ offset the index of the batch's 1st 
+    # ciphertext. if a batch can't be decrypted, plaintexts is None and error 
+    # describes why (otherwise, error is None). callbacks run on a single 
+    # (pool) thread.
+    def decrypt_async(self, ciphertexts, callback):
+
+        for i, batch in enumerate(self.split(ciphertexts)):
+
+            with self.pending_cond:
+                self.pending += 1
+
+            def done(result, offset = i * self.batch_size):
+
+                try:
+                    plaintexts, duration, error = result
+                    callback(offset, plaintexts, duration, error)
+
+                finally:
+                    with self.pending_cond:
+                        self.pending -= 1
+                        self.pending_cond.notify_all()
+
+            self.pool.apply_async(try_decrypt_batch, (batch,), callback = done)
+
+    # waits for all decrypt_async() batches to be done
+    def wait(self):
+
+        with self.pending_cond:
+            while self.pending > 0:
+                self.pending_cond.wait(1.0)
+
+    def close(self):
+        self.wait()
+        self.pool.close()
+        self.pool.join()
@@ -0,0 +1,447 @@
+import os
+import socket
+import select
+import errno
+import fcntl
+import time
+import collections
+
+# custom imports
+import transport
+
+# a single-threaded, poll()-based server loop : all sockets are non
+# blocking, and are served by the same thread, so that idle connections
+# cost (almost) nothing. cpu heavy work is handed to an executor (a bounded
+# workqueue.WorkQueue), and its results are handed back to the loop thread
+# through a wakeup pipe.
+
+POLLIN = select.POLLIN
+POLLOUT = select.POLLOUT
+POLLERR = select.POLLERR
+POLLHUP = select.POLLHUP
+
+# a connection stops reading requests while it has more than this many
+# bytes of responses waiting to be sent to the client
+MAX_OUT_BUFFER = 4 * 1024 * 1024
+# ... or this many requests in flight (i.e. handed to the executor, w/o a
+# result yet)
+MAX_IN_FLIGHT = 32
+
+def set_nonblocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+# epoll() if available (it scales to many connections), poll() otherwise
+class Poller:
+
+    def __init__(self):
+
+        if hasattr(select, 'epoll'):
+            self.poller = select.epoll()
+            # epoll() timeouts are in seconds, poll()'s in milliseconds
+            self.timeout_scale = 1.0
+        else:
+            self.poller = select.poll()
+            self.timeout_scale = 1000.0
+
+    def register(self, fd, events):
+        self.poller.register(fd, events)
+
+    def modify(self, fd, events):
+        self.poller.modify(fd, events)
+
+    def unregister(self, fd):
+        self.poller.unregister(fd)
+
+    def poll(self, timeout):
+
+        try:
+            return self.poller.poll(timeout * self.timeout_scale)
+
+        except (select.error, IOError, OSError), e:
+            # interrupted by a signal (e.g. SIGINT)
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+
+# runs on an executor thread (or process) : exceptions are returned, rather
+# than raised, so that the loop always learns about the outcome of a job
+def call(func, args):
+
+    try:
+        return True, func(*args)
+    except Exception, e:
+        return False, e
+
+# a client connection. subclasses implement on_frame(), called for each
+# '<body length>\r\n<body>' frame received from the client.
+class LoopConnection:
+
+    def __init__(self, loop, sock, address):
+
+        self.loop = loop
+        self.sock = sock
+        self.address = address
+        self.fd = sock.fileno()
+
+        sock.setblocking(0)
+
+        self.reader = transport.FrameReader()
+        self.writer = transport.FrameWriter()
+
+        # nr. of jobs handed to the executor, w/o a result yet
+        self.in_flight = 0
+        # no frames are handed to on_frame() while paused
+        self.paused = False
+        # a closing connection stops reading frames, and closes as soon as
+        # its in-flight jobs are done and its responses are sent
+        self.closing = False
+        self.closed = False
+        # the client is done sending : frames already received are still 
+        # handed to on_frame() (once the connection can take them), then the 
+        # connection closes
+        self.eof = False
+
+        self.events = POLLIN
+
+    def on_frame(self, body):
+        raise NotImplementedError()
+
+    def send_frame(self, body):
+
+        if self.closed:
+            return
+
+        self.writer.add_frame(body)
+        self.handle_write()
+        self.update()
+
+    def pause(self):
+        self.paused = True
+        self.update()
+
+    def resume(self):
+        self.paused = False
+        self.process_frames()
+        self.update()
+
+    # frames are only handed to on_frame() while the connection (and the
+    # executor) can take more requests
+    def can_read(self):
+
+        if self.paused or self.closing or self.closed or self.in_flight >= self.loop.max_in_flight:
+            return False
+
+        # the executor's queue is full : the loop lets us know once there's
+        # room again (see EventLoop.run_completions())
+        if self.loop.saturated():
+            self.loop.throttled.add(self)
+            return False
+
+        return True
+
+    def close(self):
+        self.closing = True
+        self.update()
+
+    def handle_events(self, events):
+
+        if events & POLLIN:
+            self.handle_read()
+
+        if events & POLLOUT:
+            self.handle_write()
+
+        if events & (POLLERR | POLLHUP) and not events & POLLIN:
+            self.close_now()
+
+        self.update()
+
+    def handle_read(self):
+
+        try:
+            read = self.reader.fill(self.sock)
+
+        except socket.error, e:
+            if e.args[0] in [errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR]:
+                return
+            print('eventloop::handle_read() : error occurred: %s. aborting.' % (e))
+            self.close_now()
+            return
+
+        if not read:
+            # the client is gone : finish what it sent, then close
+            self.eof = True
+
+        self.process_frames()
+
+    # a single read may hold several frames
+    def process_frames(self):
+
+        while self.can_read():
+
+            try:
+                body = self.reader.next_frame()
+
+            except ValueError, e:
+                print('eventloop::process_frames() : error occurred: %s. aborting.' % (e))
+                self.close_now()
+                return
+
+            if body is None:
+                # no more (complete) frames will come
+                if self.eof:
+                    self.closing = True
+                return
+
+            self.on_frame(body)
+
+    def handle_write(self):
+
+        if not self.writer.pending or self.closed:
+            return
+
+        try:
+            self.writer.write(self.sock)
+
+        except socket.error, e:
+            if e.args[0] in [errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR]:
+                return
+            print('eventloop::handle_write() : error occurred: %s. aborting.' % (e))
+            self.close_now()
+            return
+
+    # (re-)computes which events we want to poll for
+    def update(self):
+
+        if self.closed:
+            return
+
+        if self.closing and self.in_flight == 0 and not self.writer.pending:
+            self.close_now()
+            return
+
+        events = 0
+        # backpressure : stop reading if the client doesn't read its
+        # responses, or if there's no room for more requests
+        if not self.eof and self.can_read() and self.writer.pending < MAX_OUT_BUFFER:
+            events |= POLLIN
+
+        if self.writer.pending:
+            events |= POLLOUT
+
+        if events != self.events:
+            self.loop.poller.modify(self.fd, events)
+            self.events = events
+
+    def close_now(self):
+
+        if self.closed:
+            return
+
+        self.closed = True
+        self.loop.remove_connection(self)
+        self.sock.close()
+
+class EventLoop:
+
+    # listen_socks is a list of listening sockets (e.g. a TCP and a unix
+    # socket). if backpressure is set, connections stop reading requests
+    # while the executor's queue is full. otherwise, they keep reading, and
+    # submit() turns requests away.
+    def __init__(self, listen_socks, connection_class, executor, max_connections = 1024,
+        max_in_flight = MAX_IN_FLIGHT, backpressure = True):
+
+        # fd -> listening socket
+        self.listen_socks = {}
+        for listen_sock in listen_socks:
+            listen_sock.setblocking(0)
+            self.listen_socks[listen_sock.fileno()] = listen_sock
+
+        self.connection_class = connection_class
+        self.executor = executor
+        self.max_connections = max_connections
+        self.max_in_flight = max_in_flight
+        self.backpressure = backpressure
+        # connections which stopped reading because the executor's queue
+        # was full
+        self.throttled = set()
+
+        self.poller = Poller()
+        for fd in self.listen_socks:
+            self.poller.register(fd, POLLIN)
+        self.accepting = True
+
+        # executor threads hand results back to the loop thread via this
+        # queue, and wake it up by writing to the pipe
+        self.completions = collections.deque()
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        set_nonblocking(self.wakeup_r)
+        set_nonblocking(self.wakeup_w)
+        self.poller.register(self.wakeup_r, POLLIN)
+
+        # fd -> connection
+        self.connections = {}
+
+        self.stopping = False
+        self.stop_time = None
+
+    def run(self, drain_timeout = 10.0):
+
+        while not (self.stopping and not self.connections):
+
+            if self.stopping and time.time() - self.stop_time > drain_timeout:
+                print('eventloop::run() : drain timeout, closing %d connections' % (len(self.connections)))
+                for connection in self.connections.values():
+                    connection.close_now()
+                break
+
+            for fd, events in self.poller.poll(1.0):
+
+                if fd == self.wakeup_r:
+                    self.clear_wakeup()
+
+                elif not self.stopping and fd in self.listen_socks:
+                    self.accept(self.listen_socks[fd])
+
+                elif fd in self.connections:
+                    self.connections[fd].handle_events(events)
+
+            self.run_completions()
+
+        os.close(self.wakeup_r)
+        os.close(self.wakeup_w)
+
+    # stops accepting connections and requests, and lets in-flight requests
+    # finish (and their responses be sent) before run() returns. called from
+    # the loop thread (e.g. by a signal handler).
+    def stop(self):
+
+        if self.stopping:
+            return
+
+        print('eventloop::stop() : draining %d connections' % (len(self.connections)))
+
+        self.stopping = True
+        self.stop_time = time.time()
+
+        self.update_accepting()
+        for listen_sock in self.listen_socks.values():
+            listen_sock.close()
+
+        for connection in self.connections.values():
+            connection.close()
+
+        self.wakeup()
+
+    def accept(self, listen_sock):
+
+        while len(self.connections) < self.max_connections:
+
+            try:
+                sock, address = listen_sock.accept()
+
+            except socket.error, e:
+                if e.args[0] in [errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR]:
+                    break
+                raise
+
+            connection = self.connection_class(self, sock, address)
+            self.connections[connection.fd] = connection
+            self.poller.register(connection.fd, connection.events)
+
+        self.update_accepting()
+
+    # at the connection limit, we stop accepting, and new connections wait in
+    # the listen backlog
+    def update_accepting(self):
+
+        accepting = not self.stopping and len(self.connections) < self.max_connections
+
+        for fd in self.listen_socks:
+            if accepting and not self.accepting:
+                self.poller.register(fd, POLLIN)
+            elif not accepting and self.accepting:
+                self.poller.unregister(fd)
+
+        self.accepting = accepting
+
+    def remove_connection(self, connection):
+
+        self.poller.unregister(connection.fd)
+        del self.connections[connection.fd]
+        self.throttled.discard(connection)
+        self.update_accepting()
+
+    def saturated(self):
+        return self.backpressure and self.executor.full()
+
+    # runs func(*args) on the executor, then callback(connection, result) on
+    # the loop thread. the connection is closed if func raises an exception.
+    # returns False if the executor's queue is full.
+    def submit(self, connection, func, args, callback):
+
+        def done(outcome):
+            self.call_soon(self.complete, connection, callback, outcome)
+
+        if not self.executor.submit(call, (func, args), done, block = False):
+            return False
+
+        connection.in_flight += 1
+        return True
+
+    def complete(self, connection, callback, outcome):
+
+        connection.in_flight -= 1
+
+        ok, result = outcome
+        if connection.closed:
+            pass
+        elif ok:
+            callback(connection, result)
+        else:
+            print('eventloop::complete() : error occurred: %s. aborting.' % (result))
+            connection.close_now()
+
+        # the connection may have stopped reading at its in-flight limit
+        connection.process_frames()
+        connection.update()
+
+    # thread-safe
+    def call_soon(self, func, *args):
+        self.completions.append((func, args))
+        self.wakeup()
+
+    def wakeup(self):
+
+        try:
+            os.write(self.wakeup_w, 'x')
+        except OSError, e:
+            # the pipe is full, i.e. the loop will wake up anyway
+            if e.args[0] not in [errno.EAGAIN, errno.EWOULDBLOCK]:
+                raise
+
+    def clear_wakeup(self):
+
+        try:
+            while os.read(self.wakeup_r, 4096):
+                pass
+        except OSError, e:
+            if e.args[0] not in [errno.EAGAIN, errno.EWOULDBLOCK]:
+                raise
+
+    def run_completions(self):
+
+        while self.completions:
+            func, args = self.completions.popleft()
+            func(*args)
+
+        # the executor has made room for more requests
+        if self.throttled and not self.saturated():
+
+            throttled = list(self.throttled)
+            self.throttled.clear()
+
+            for connection in throttled:
+                connection.process_frames()
+                connection.update()
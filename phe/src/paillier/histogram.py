@@ -0,0 +1,186 @@
+import math
+import threading
+import time
+
+# fixed-memory latency histograms, for long running servers : values (in
+# seconds) are counted in buckets whose bounds grow by a constant factor
+# (BUCKETS_PER_OCTAVE buckets per power of 2), so that quantiles are
+# reported w/ a bounded relative error (~4.4% w/ 8 buckets per octave),
+# regardless of how many values are recorded. values below min_value (or
+# above max_value) are counted in an underflow (or overflow) bucket.
+
+MIN_VALUE = 1e-6
+MAX_VALUE = 3600.0
+BUCKETS_PER_OCTAVE = 8
+
+# quantiles reported by Histogram.summary()
+QUANTILES = [('p50', 0.50), ('p90', 0.90), ('p99', 0.99), ('p999', 0.999)]
+
+class Histogram:
+
+    def __init__(self, min_value = MIN_VALUE, max_value = MAX_VALUE, buckets_per_octave = BUCKETS_PER_OCTAVE):
+
+        self.min_value = min_value
+        self.scale = buckets_per_octave / math.log(2.0)
+
+        # + underflow and overflow buckets
+        self.nr_buckets = int(math.ceil(math.log(max_value / min_value) * self.scale)) + 2
+        self.counts = [0] * self.nr_buckets
+
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+        # histograms are updated from several threads
+        self.lock = threading.Lock()
+
+    def bucket(self, value):
+
+        if value < self.min_value:
+            return 0
+
+        return min(int(math.log(value / self.min_value) * self.scale) + 1, self.nr_buckets - 1)
+
+    # representative value of a bucket : the geometric mean of its bounds
+    def bucket_value(self, bucket):
+
+        if bucket == 0:
+            return self.min_value
+
+        return self.min_value * math.exp((bucket - 0.5) / self.scale)
+
+    def record(self, value):
+
+        bucket = self.bucket(value)
+
+        with self.lock:
+
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += value
+
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    # q in [0, 1]
+    def quantile(self, q):
+
+        with self.lock:
+            return self._quantile(q)
+
+    def _quantile(self, q):
+
+        if self.count == 0:
+            return 0.0
+
+        rank = q * (self.count - 1)
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+
+            seen += count
+            if seen > rank:
+                # the exact min and max are known : don't report anything
+                # outside of them
+                return min(max(self.bucket_value(bucket), self.min), self.max)
+
+        return self.max
+
+    def summary(self):
+
+        with self.lock:
+
+            summary = {}
+            summary['count'] = self.count
+            summary['mean'] = self.total / self.count if self.count else 0.0
+            summary['min'] = self.min if self.min is not None else 0.0
+            summary['max'] = self.max if self.max is not None else 0.0
+
+            for name, q in QUANTILES:
+                summary[name] = self._quantile(q)
+
+        return summary
+
+    # box plot statistics, in the format of matplotlib's Axes.bxp() (w/
+    # whiskers at 1.5 x the inter-quartile range, as in Axes.boxplot())
+    def boxplot_stats(self, scale = 1.0):
+
+        with self.lock:
+            q1, median, q3 = self._quantile(0.25), self._quantile(0.50), self._quantile(0.75)
+            low, high = self.min, self.max
+
+        iqr = q3 - q1
+
+        stats = {}
+        stats['q1'] = q1 * scale
+        stats['med'] = median * scale
+        stats['q3'] = q3 * scale
+        stats['whislo'] = max(q1 - 1.5 * iqr, low) * scale
+        stats['whishi'] = min(q3 + 1.5 * iqr, high) * scale
+
+        return stats
+
+# histograms indexed by tuples of names, e.g. (mode, operation), created on
+# first use
+class HistogramSet:
+
+    def __init__(self):
+
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+
+        with self.lock:
+
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+
+            return self.histograms[key]
+
+    def record(self, key, value):
+        self.get(key).record(value)
+
+    def keys(self):
+
+        with self.lock:
+            return list(self.histograms.keys())
+
+    # summaries of all histograms, in nested dicts (one level per name in
+    # the keys)
+    def summary(self):
+
+        summary = {}
+        for key in self.keys():
+
+            level = summary
+            for name in key[:-1]:
+                level = level.setdefault(name, {})
+
+            level[key[-1]] = self.get(key).summary()
+
+        return summary
+
+class Counters:
+
+    def __init__(self):
+
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+
+    def add(self, name, value = 1):
+
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+
+        with self.lock:
+            summary = dict(self.counters)
+
+        summary['uptime'] = time.time() - self.start_time
+
+        return summary
@@ -0,0 +1,69 @@
+import hashlib
+import threading
+
+from collections import OrderedDict
+from phe import paillier # for hpe operations
+
+# a key id is a short fingerprint of a paillier public key {g, n}. since it
+# only depends on the key itself, clients can compute it on their own, and
+# different connections using the same key end up sharing a cache entry.
+def key_fingerprint(g, n):
+
+    sha = hashlib.sha256()
+    sha.update('%x:%x' % (g, n))
+
+    return sha.hexdigest()[:16]
+
+# bounded cache of paillier.PaillierPublicKey objects, indexed by key id.
+# entries are evicted in least-recently-used order once the cache holds
+# more than max_keys keys. shared by all connection threads, hence the lock.
+class KeyCache:
+
+    def __init__(self, max_keys = 128):
+
+        self.max_keys = max_keys
+        self.keys = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, g, n):
+
+        key_id = key_fingerprint(g, n)
+
+        with self.lock:
+
+            if key_id in self.keys:
+                # re-insert the key, so that it becomes the most recently used
+                public_key = self.keys.pop(key_id)
+                self.hits += 1
+
+            else:
+                public_key = paillier.PaillierPublicKey(g = g, n = n)
+                self.misses += 1
+
+            self.keys[key_id] = public_key
+
+            while len(self.keys) > self.max_keys:
+                self.keys.popitem(last = False)
+
+        return key_id, public_key
+
+    # returns None if the key is unknown (or has been evicted meanwhile)
+    def get(self, key_id):
+
+        with self.lock:
+
+            if key_id not in self.keys:
+                self.misses += 1
+                return None
+
+            public_key = self.keys.pop(key_id)
+            self.keys[key_id] = public_key
+            self.hits += 1
+
+        return public_key
+
+    def __len__(self):
+        return len(self.keys)
@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import time
+
+from phe import paillier # for hpe operations
+
+# custom imports
+import keycache
+
+# on-disk store of paillier key pairs, so that clients don't pay for prime
+# generation (up to seconds, for 2048 bit keys) every time they start. each
+# key pair is kept in its own json file, named after its key id (see
+# keycache.key_fingerprint()), readable by its owner only.
+#
+# run as a script, it pre-generates a pool of key pairs (e.g. for tests and
+# benchmarks), or lists the stored ones.
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.paillier-keys')
+
+class KeyStore:
+
+    def __init__(self, path = DEFAULT_PATH):
+
+        self.path = path
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path, 0700)
+
+    def key_path(self, key_id):
+        return os.path.join(self.path, key_id + '.json')
+
+    def save(self, public_key, private_key):
+
+        key_id = keycache.key_fingerprint(public_key.g, public_key.n)
+
+        key = {}
+        key['key_size'] = public_key.n.bit_length()
+        key['g'] = public_key.g
+        key['n'] = public_key.n
+        # phe 1.2 private keys are (lambda, mu) pairs (see requirements.txt)
+        key['lambda'] = private_key.Lambda
+        key['mu'] = private_key.mu
+
+        # write to a temporary file, then rename it, so that readers never
+        # see a partially written key
+        fd, tmp_path = tempfile.mkstemp(dir = self.path, suffix = '.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(key, f)
+        os.rename(tmp_path, self.key_path(key_id))
+
+        return key_id
+
+    # returns the (public key, private key) pair w/ key_id. raises KeyError
+    # if there's no such key.
+    def load(self, key_id):
+
+        try:
+            with open(self.key_path(key_id)) as f:
+                key = json.load(f)
+
+        except IOError:
+            raise KeyError('no key %s in %s' % (key_id, self.path))
+
+        public_key = paillier.PaillierPublicKey(int(key['g']), int(key['n']))
+        private_key = paillier.PaillierPrivateKey(public_key, int(key['lambda']), int(key['mu']))
+
+        return public_key, private_key
+
+    def key_size(self, key_id):
+
+        with open(self.key_path(key_id)) as f:
+            return int(json.load(f)['key_size'])
+
+    # ids of the stored keys (of a given size, if key_size is set), oldest
+    # first
+    def key_ids(self, key_size = None):
+
+        files = [ f for f in os.listdir(self.path) if f.endswith('.json') ]
+        files.sort(key = lambda f: os.path.getmtime(os.path.join(self.path, f)))
+
+        key_ids = [ f[:-len('.json')] for f in files ]
+
+        if key_size is not None:
+            key_ids = [ key_id for key_id in key_ids if self.key_size(key_id) == key_size ]
+
+        return key_ids
+
+    def generate(self, key_size = 2048):
+
+        public_key, private_key = paillier.generate_paillier_keypair(n_length = key_size)
+        key_id = self.save(public_key, private_key)
+
+        return key_id, public_key, private_key
+
+    # the oldest stored key pair of a given size, generated (and stored) if
+    # there is none. returns (key id, public key, private key).
+    def get(self, key_size = 2048):
+
+        key_ids = self.key_ids(key_size)
+
+        if not key_ids:
+            return self.generate(key_size)
+
+        public_key, private_key = self.load(key_ids[0])
+        return (key_ids[0], public_key, private_key)
+
+    # makes sure there are at least count key pairs of a given size. returns
+    # the ids of the generated keys.
+    def fill(self, key_size, count):
+
+        generated = []
+        for i in xrange(len(self.key_ids(key_size)), count):
+            key_id, public_key, private_key = self.generate(key_size)
+            generated.append(key_id)
+
+        return generated
+
+if __name__ == "__main__":
+
+    # use an ArgumentParser for a nice CLI
+    parser = argparse.ArgumentParser()
+
+    # options (self-explanatory)
+    parser.add_argument(
+        "--keystore",
+         help = """directory of the key store (default : %s)""" % (DEFAULT_PATH))
+
+    parser.add_argument(
+        "--key-size",
+         help = """size of paillier keys, in bits (default : 2048)""")
+
+    parser.add_argument(
+        "--count",
+         help = """pre-generate keys until there are <count> keys of <key-size> bits in the store (default : 1)""")
+
+    parser.add_argument(
+        "--list",
+         help = """list the stored keys, and exit""",
+         action = "store_true")
+
+    args = parser.parse_args()
+
+    key_store = KeyStore(args.keystore if args.keystore else DEFAULT_PATH)
+
+    if args.list:
+        for key_id in key_store.key_ids():
+            print('%s : %d bit' % (key_id, key_store.key_size(key_id)))
+        sys.exit(0)
+
+    key_size = int(args.key_size) if args.key_size else 2048
+    count = int(args.count) if args.count else 1
+
+    start_time = time.time()
+    generated = key_store.fill(key_size, count)
+
+    for key_id in generated:
+        print('generated %d bit key %s' % (key_size, key_id))
+
+    print('%d key(s) generated in %.3f sec, %d %d bit key(s) in %s' % (
+        len(generated), time.time() - start_time, len(key_store.key_ids(key_size)), key_size, key_store.path))
+
+    sys.exit(0)
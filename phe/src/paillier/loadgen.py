@@ -0,0 +1,480 @@
+import sys
+import argparse
+import random
+import socket
+import threading
+import time
+import json
+
+from phe import paillier # for hpe operations
+
+# custom imports
+import keycache
+import wire
+import transport
+import keystore
+import histogram
+import benchmark
+import clientlib
+
+# load generator : drives a running server w/ several connections at once,
+# either in a closed loop (each connection keeps <window> requests in
+# flight, and sends a new one as soon as a response comes back) or in an
+# open loop (requests are sent at a target rate, whether or not the server
+# keeps up). it reports throughput and latency quantiles for each interval
+# of the run, and for the whole run.
+#
+# in open loop mode, the latency of a request is measured from the time it
+# was scheduled to be sent, not from the time it was actually sent : if the
+# load generator falls behind (e.g. blocked on a full socket, because the
+# server is slow), the time requests spend waiting to be sent counts too.
+# otherwise, a slow server would be measured against fewer (and luckier)
+# requests than it was supposed to get (i.e. 'coordinated omission').
+#
+# requests are drawn from a pool of pre-built (and pre-encrypted)
+# messages, so that client-side encryption doesn't limit the load.
+
+# a pool of messages for each mode, each w/ a label for reporting : the
+# operation for single requests, 'batch' for batches
+def build_pool(public_key, key_id, modes, mix, batch_size, pool_size, vector_size, seed):
+
+    rng = random.Random(seed)
+    pool = {}
+
+    for mode in modes:
+
+        ops = benchmark.generate_ops(rng, mix, pool_size * batch_size, vector_size)
+        prepared, durations = benchmark.prepare_ops(public_key, mode, ops)
+
+        pool[mode] = []
+        for i in xrange(0, len(prepared), batch_size):
+            message = benchmark.build_message(mode, key_id, prepared[i:i + batch_size])
+            label = message['operation'] if message['type'] == 'request' else 'batch'
+            pool[mode].append((label, message))
+
+    return pool
+
+class LoadStats:
+
+    def __init__(self, start_time, interval, warmup):
+
+        self.start_time = start_time
+        self.interval = interval
+        self.warmup = warmup
+
+        # latencies after warmup, per (mode, label), and overall
+        self.latencies = histogram.HistogramSet()
+        self.overall = histogram.Histogram()
+        # latencies of the responses received in each interval (w/ warmup)
+        self.intervals = {}
+        self.errors = 0
+        # requests turned away by the server (w/ '--overload busy')
+        self.busy = 0
+
+        self.lock = threading.Lock()
+
+    def record(self, mode, label, latency, now):
+
+        elapsed = now - self.start_time
+        index = int(elapsed / self.interval)
+
+        with self.lock:
+            if index not in self.intervals:
+                self.intervals[index] = histogram.Histogram()
+            interval = self.intervals[index]
+
+        interval.record(latency)
+
+        if elapsed >= self.warmup:
+            self.latencies.record((mode, label), latency)
+            self.overall.record(latency)
+
+    def record_error(self, busy = False):
+
+        with self.lock:
+            self.errors += 1
+            if busy:
+                self.busy += 1
+
+    # throughput and latency quantiles of an interval
+    def interval_summary(self, index):
+
+        with self.lock:
+            interval = self.intervals.get(index)
+
+        if interval is None:
+            interval = histogram.Histogram()
+
+        summary = interval.summary()
+        summary['time'] = (index + 1) * self.interval
+        summary['throughput'] = summary['count'] / self.interval
+
+        return summary
+
+# a connection to the server, w/ a sender thread (which sends requests in
+# open or closed loop) and a receiver thread (which matches responses to
+# requests, by request id)
+class LoadConnection:
+
+    def __init__(self, index, server_address, public_key, fmt, pool, stats, rng):
+
+        self.index = index
+        self.public_key = public_key
+        self.fmt = fmt
+        self.width = wire.ciphertext_width(public_key)
+        self.pool = pool
+        self.stats = stats
+        self.rng = rng
+
+        self.sock = socket.create_connection(server_address)
+        self.reader = transport.FrameReader()
+        self.send_lock = threading.Lock()
+
+        # request id -> (mode, label, intended send time)
+        self.pending = {}
+        self.pending_lock = threading.Condition()
+        self.next_id = 1
+
+        # closed loop : nr. of requests which may still be sent
+        self.window = None
+        self.stopping = False
+
+    def send(self, message):
+
+        body = wire.encode(message, self.fmt, self.width)
+        with self.send_lock:
+            transport.send_frame(self.sock, body)
+
+    def register(self):
+
+        response = clientlib.register_key(self.send, lambda: wire.decode(self.reader.recv_frame(self.sock)), 
+            self.public_key, self.fmt)
+
+        self.fmt = response.get('format', 'json')
+
+    def send_request(self, intended_time):
+
+        mode = self.rng.choice(self.pool.keys())
+        label, message = self.rng.choice(self.pool[mode])
+
+        message = dict(message)
+
+        with self.pending_lock:
+            message['id'] = self.next_id
+            self.pending[self.next_id] = (mode, label, intended_time)
+            self.next_id += 1
+
+        self.send(message)
+
+    def run_closed(self, window):
+
+        self.window = threading.Semaphore(window)
+
+        while not self.stopping:
+            self.window.acquire()
+            if self.stopping:
+                break
+            self.send_request(time.time())
+
+    # sends requests at a given rate (per second), at regular intervals or
+    # w/ exponentially distributed gaps (i.e. poisson arrivals)
+    def run_open(self, rate, arrivals):
+
+        next_time = time.time()
+
+        while not self.stopping:
+
+            if arrivals == 'poisson':
+                next_time += self.rng.expovariate(rate)
+            else:
+                next_time += 1.0 / rate
+
+            delay = next_time - time.time()
+            if delay > 0.0:
+                time.sleep(delay)
+
+            if self.stopping:
+                break
+
+            # if we're late, the request is sent right away, but its latency
+            # still counts from next_time
+            self.send_request(next_time)
+
+    def run_receiver(self):
+
+        while True:
+
+            try:
+                response = wire.decode(self.reader.recv_frame(self.sock))
+            except socket.error:
+                return
+
+            now = time.time()
+
+            with self.pending_lock:
+                mode, label, intended_time = self.pending.pop(response['id'])
+                self.pending_lock.notify_all()
+
+            if response['type'] == 'response':
+                self.stats.record(mode, label, now - intended_time, now)
+            else:
+                self.stats.record_error(response.get('error') == 'busy')
+
+            if self.window is not None:
+                self.window.release()
+
+    def start(self, loop, window, rate, arrivals):
+
+        self.receiver = threading.Thread(target = self.run_receiver)
+        self.receiver.daemon = True
+        self.receiver.start()
+
+        if loop == 'closed':
+            self.sender = threading.Thread(target = self.run_closed, args = (window,))
+        else:
+            self.sender = threading.Thread(target = self.run_open, args = (rate, arrivals))
+
+        self.sender.daemon = True
+        self.sender.start()
+
+    def stop_sending(self):
+
+        self.stopping = True
+        if self.window is not None:
+            self.window.release()
+        self.sender.join()
+
+    # waits up to timeout seconds for the responses to the requests in 
+    # flight, and closes the connection. returns the nr. of requests left
+    # w/o a response.
+    def close(self, timeout):
+
+        deadline = time.time() + timeout
+        with self.pending_lock:
+            while self.pending and time.time() < deadline:
+                self.pending_lock.wait(deadline - time.time())
+            lost = len(self.pending)
+
+        terminate = {}
+        terminate['type'] = 'terminate'
+
+        try:
+            self.send(terminate)
+        except socket.error:
+            pass
+
+        self.sock.close()
+        return lost
+
+def print_summary(summary, name = ''):
+    print('%-24s %8d %10.3f %10.3f %10.3f %10.3f %10.3f' % (name, summary['count'],
+        summary['p50'] * 1000.0, summary['p90'] * 1000.0, summary['p99'] * 1000.0,
+        summary['p999'] * 1000.0, summary['max'] * 1000.0))
+
+if __name__ == "__main__":
+
+    # use an ArgumentParser for a nice CLI
+    parser = argparse.ArgumentParser()
+
+    # options (self-explanatory)
+    parser.add_argument(
+        "--server",
+         help = """<host>:<port> of the server (default : localhost:10000)""")
+
+    parser.add_argument(
+        "--connections",
+         help = """nr. of connections to the server (default : 4)""")
+
+    parser.add_argument(
+        "--loop",
+         help = """'closed' (fixed nr. of requests in flight per connection) or 'open' (fixed request rate) (default : closed)""")
+
+    parser.add_argument(
+        "--window",
+         help = """nr. of requests in flight per connection, in closed loop (default : 1)""")
+
+    parser.add_argument(
+        "--rate",
+         help = """target nr. of requests per second, over all connections, in open loop (default : 100)""")
+
+    parser.add_argument(
+        "--arrivals",
+         help = """request arrivals in open loop : 'uniform' or 'poisson' (default : poisson)""")
+
+    parser.add_argument(
+        "--duration",
+         help = """duration of the run, in seconds (default : 30)""")
+
+    parser.add_argument(
+        "--warmup",
+         help = """seconds at the start of the run left out of the overall quantiles (default : 2)""")
+
+    parser.add_argument(
+        "--interval",
+         help = """reporting interval, in seconds (default : 1)""")
+
+    parser.add_argument(
+        "--modes",
+         help = """comma-separated list of modes to mix requests from (default : encrypted,unencrypted)""")
+
+    parser.add_argument(
+        "--mix",
+         help = """operation mix, out of %s (default : scalar)""" % (', '.join(sorted(benchmark.MIXES))))
+
+    parser.add_argument(
+        "--batch-size",
+         help = """nr. of operations per request (default : 1)""")
+
+    parser.add_argument(
+        "--vector-size",
+         help = """nr. of values in the operands of vector operations (default : 16)""")
+
+    parser.add_argument(
+        "--pool-size",
+         help = """nr. of distinct (pre-encrypted) requests per mode (default : 64)""")
+
+    parser.add_argument(
+        "--key-size",
+         help = """size of the paillier key, in bits (default : 2048)""")
+
+    parser.add_argument(
+        "--keystore",
+         help = """take the key from (or add it to) the key store in directory <keystore>, instead of generating a new key""")
+
+    parser.add_argument(
+        "--format",
+         help = """wire format : 'binary' or 'json' (default : binary)""")
+
+    parser.add_argument(
+        "--seed",
+         help = """seed for requests and arrivals (default : 0)""")
+
+    parser.add_argument(
+        "--output",
+         help = """file to write the results (per interval, and overall) to, in json""")
+
+    args = parser.parse_args()
+
+    host, port = (args.server if args.server else 'localhost:10000').rsplit(':', 1)
+    server_address = (host, int(port))
+
+    nr_connections = int(args.connections) if args.connections else 4
+    loop = args.loop if args.loop else 'closed'
+    window = int(args.window) if args.window else 1
+    rate = float(args.rate) if args.rate else 100.0
+    arrivals = args.arrivals if args.arrivals else 'poisson'
+    duration = float(args.duration) if args.duration else 30.0
+    warmup = float(args.warmup) if args.warmup else 2.0
+    interval = float(args.interval) if args.interval else 1.0
+    modes = benchmark.parse_list(args.modes, ['encrypted', 'unencrypted'])
+    mix = args.mix if args.mix else 'scalar'
+    batch_size = int(args.batch_size) if args.batch_size else 1
+    vector_size = int(args.vector_size) if args.vector_size else 16
+    pool_size = int(args.pool_size) if args.pool_size else 64
+    key_size = int(args.key_size) if args.key_size else 2048
+    fmt = args.format if args.format else 'binary'
+    seed = int(args.seed) if args.seed else 0
+
+    if loop not in ['closed', 'open'] or arrivals not in ['uniform', 'poisson'] or mix not in benchmark.MIXES:
+        sys.stderr.write("""%s: [ERROR] invalid --loop, --arrivals or --mix\n""" % (sys.argv[0]))
+        parser.print_help()
+        sys.exit(1)
+
+    if args.keystore:
+        key_id, public_key, private_key = keystore.KeyStore(args.keystore).get(key_size)
+    else:
+        public_key, private_key = paillier.generate_paillier_keypair(n_length = key_size)
+        key_id = keycache.key_fingerprint(public_key.g, public_key.n)
+
+    print('building a pool of %d requests per mode (%d bit key %s)...' % (pool_size, key_size, key_id))
+    pool = build_pool(public_key, key_id, modes, mix, batch_size, pool_size, vector_size, seed)
+
+    connections = []
+    for i in xrange(nr_connections):
+        connection = LoadConnection(i, server_address, public_key, fmt, pool, None, random.Random(seed + i))
+        connection.register()
+        connections.append(connection)
+
+    if loop == 'closed':
+        print('closed loop : %d connections, %d request(s) in flight each, for %.1f sec' % (nr_connections, window, duration))
+    else:
+        print('open loop : %d connections, %.1f requests/sec (%s arrivals), for %.1f sec' % (nr_connections, rate, arrivals, duration))
+
+    start_time = time.time()
+    stats = LoadStats(start_time, interval, warmup)
+
+    for connection in connections:
+        connection.stats = stats
+        connection.start(loop, window, rate / nr_connections, arrivals)
+
+    # report each interval once it's over
+    print('%8s %12s %10s %10s %10s' % ('time (s)', 'requests/s', 'p50 (ms)', 'p99 (ms)', 'max (ms)'))
+
+    timeline = []
+    nr_intervals = int(duration / interval)
+
+    try:
+
+        for index in xrange(nr_intervals):
+
+            delay = start_time + (index + 1) * interval - time.time()
+            if delay > 0.0:
+                time.sleep(delay)
+
+            summary = stats.interval_summary(index)
+            timeline.append(summary)
+            print('%8.1f %12.1f %10.3f %10.3f %10.3f' % (summary['time'], summary['throughput'],
+                summary['p50'] * 1000.0, summary['p99'] * 1000.0, summary['max'] * 1000.0))
+
+    except KeyboardInterrupt:
+        pass
+
+    for connection in connections:
+        connection.stop_sending()
+
+    lost = 0
+    for connection in connections:
+        lost += connection.close(timeout = 5.0)
+
+    # latencies include responses received after the run (to requests sent 
+    # during the run), but throughput only counts those received during the 
+    # run, after warmup
+    overall = stats.overall.summary()
+    measured = [ summary for summary in timeline if summary['time'] - interval >= warmup ]
+    if measured:
+        overall['throughput'] = sum(summary['count'] for summary in measured) / (len(measured) * interval)
+    else:
+        overall['throughput'] = 0.0
+
+    print('')
+    print('%-24s %8s %10s %10s %10s %10s %10s' % ('', 'count', 'p50 (ms)', 'p90 (ms)', 'p99 (ms)', 'p999 (ms)', 'max (ms)'))
+
+    for (mode, label) in sorted(stats.latencies.keys()):
+        print_summary(stats.latencies.get((mode, label)).summary(), '%s %s' % (mode, label))
+    print_summary(overall, 'all')
+
+    print('throughput : %.1f requests/sec (after %.1f sec warmup), %d errors (%d busy), %d w/o response' % (
+        overall['throughput'], warmup, stats.errors, stats.busy, lost))
+
+    if args.output:
+
+        results = {}
+        results['config'] = {
+            'connections' : nr_connections, 'loop' : loop, 'window' : window, 'rate' : rate,
+            'arrivals' : arrivals, 'duration' : duration, 'warmup' : warmup, 'interval' : interval,
+            'modes' : modes, 'mix' : mix, 'batch_size' : batch_size, 'key_size' : key_size,
+            'format' : fmt, 'seed' : seed
+        }
+        results['timeline'] = timeline
+        results['overall'] = overall
+        results['latencies'] = stats.latencies.summary()
+        results['errors'] = stats.errors
+        results['busy'] = stats.busy
+        results['lost'] = lost
+
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent = 2, sort_keys = True)
+
+        print('results written to %s' % (args.output))
+
+    sys.exit(0)
@@ -0,0 +1,107 @@
+import threading
+import multiprocessing
+import Queue
+
+from phe import paillier # for hpe operations
+
+# custom imports
+from backend import powmod
+
+# paillier encryption is E(m) = g^m * r^n mod n^2, for a random r. the 
+# obfuscator r^n mod n^2 is the expensive part, and doesn't depend on m, 
+# so we precompute obfuscators in the background (on a thread or a 
+# separate process), into a bounded queue which encrypt() draws from.
+
+def generate_obfuscator(n, nsquare):
+    r = paillier.PaillierPublicKey(g = n + 1, n = n).get_random_lt_n()
+    return powmod(r, n, nsquare)
+
+# runs on the background thread or process, until stopped
+def fill_queue(queue, stop, n, nsquare):
+
+    obfuscator = None
+
+    while not stop.is_set():
+
+        if obfuscator is None:
+            obfuscator = generate_obfuscator(n, nsquare)
+
+        try:
+            # time out every now and then, to check if we should stop
+            queue.put(obfuscator, timeout = 0.5)
+            obfuscator = None
+        except Queue.Full:
+            pass
+
+class ObfuscatorPool:
+
+    def __init__(self, public_key, size = 256, mode = 'thread'):
+
+        self.public_key = public_key
+
+        # hits : obfuscators taken from the pool, misses : obfuscators 
+        # computed inline, because the pool was empty
+        self.hits = 0
+        self.misses = 0
+
+        args = (public_key.n, public_key.nsquare)
+
+        if mode == 'process':
+            self.queue = multiprocessing.Queue(maxsize = size)
+            self.stop = multiprocessing.Event()
+            self.filler = multiprocessing.Process(target = fill_queue, args = (self.queue, self.stop) + args)
+        else:
+            self.queue = Queue.Queue(maxsize = size)
+            self.stop = threading.Event()
+            self.filler = threading.Thread(target = fill_queue, args = (self.queue, self.stop) + args)
+
+        self.filler.daemon = True
+        self.filler.start()
+
+    def get_obfuscator(self):
+
+        try:
+            obfuscator = self.queue.get_nowait()
+            self.hits += 1
+
+        except Queue.Empty:
+            obfuscator = generate_obfuscator(self.public_key.n, self.public_key.nsquare)
+            self.misses += 1
+
+        return obfuscator
+
+    # same as paillier.PaillierPublicKey.raw_encrypt(), but w/ a 
+    # precomputed obfuscator
+    def raw_encrypt(self, plaintext):
+
+        public_key = self.public_key
+
+        if public_key.g == public_key.n + 1:
+            # (n + 1)^m = 1 + n * m mod n^2, so that g^m is a single 
+            # multiplication (phe keys always use g = n + 1)
+            nude_ciphertext = (public_key.n * plaintext + 1) % public_key.nsquare
+        else:
+            nude_ciphertext = public_key.raw_encrypt(plaintext, r_value = 1)
+
+        return (nude_ciphertext * self.get_obfuscator()) % public_key.nsquare
+
+    # same as paillier.PaillierPublicKey.encrypt(), but w/ a precomputed 
+    # obfuscator. the ciphertext is already obfuscated, but phe doesn't 
+    # know it : read it w/ ciphertext(be_secure = False), otherwise phe 
+    # obfuscates it again (at the cost we're trying to save).
+    def encrypt(self, value, precision = None):
+
+        encoding = paillier.EncodedNumber.encode(self.public_key, value, precision)
+        return paillier.EncryptedNumber(self.public_key, self.raw_encrypt(encoding.encoding), encoding.exponent)
+
+    def stats(self):
+        return {'hits' : self.hits, 'misses' : self.misses, 'size' : self.queue.qsize()}
+
+    def close(self):
+
+        self.stop.set()
+
+        if isinstance(self.filler, multiprocessing.Process):
+            self.filler.terminate()
+
+        self.filler.join()
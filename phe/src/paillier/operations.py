@@ -0,0 +1,211 @@
+import time
+
+from phe import paillier # for hpe operations
+
+# custom imports
+from backend import powmod, mulmod
+
+# homomorphic (and plain) operations supported by the server, shared by the 
+# server and its worker processes (see workers.py)
+
+# scalar operations (see client.py)
+SCALAR_OPERATIONS = ['x*', '+', '+*']
+# vector operations reduce a vector of encrypted numbers (operand 1) to a 
+# single encrypted number :
+#   'sum'  : sum of the vector
+#   'dot'  : dot product w/ a vector of non encrypted weights (operand 2)
+#   'mean' : sum of the vector, multiplied by the (non encrypted) scalar 1/N
+VECTOR_OPERATIONS = ['sum', 'dot', 'mean']
+# operations on packed ciphertexts (see packing.py), which hold several 
+# values each. operands are (ciphertext, exponent) tuples, w/ exponent 0 :
+#   'p+'  : slot-wise sum of 2 packed ciphertexts
+#   'px*' : multiplication of all slots by a non encrypted integer (operand 2)
+#   'p+*' : slot-wise sum w/ a non encrypted packed plaintext (operand 2)
+PACKED_OPERATIONS = ['p+', 'px*', 'p+*']
+# operations w/ a faster path if the client encodes its operands w/ a fixed 
+# exponent, agreed at key registration (see process_fixed_operation())
+FIXED_OPERATIONS = ['+', '+*']
+
+def process_packed_operation(mode, operation, operand_1, operand_2, public_key_rec = None):
+
+    if mode != 'encrypted':
+        raise ValueError('packed operations require encrypted operands')
+
+    n = public_key_rec.n
+    nsquare = public_key_rec.nsquare
+
+    ciphertext = int(operand_1[0])
+
+    if operation == 'p+':
+        ciphertext = mulmod(ciphertext, int(operand_2[0]), nsquare)
+
+    elif operation == 'px*':
+        ciphertext = powmod(ciphertext, int(operand_2[0]), nsquare)
+
+    else:
+        # encryption of the plaintext w/o obfuscation, i.e. g^m mod n^2
+        if public_key_rec.g == n + 1:
+            plaintext = (n * int(operand_2[0]) + 1) % nsquare
+        else:
+            plaintext = public_key_rec.raw_encrypt(int(operand_2[0]), r_value = 1)
+
+        ciphertext = mulmod(ciphertext, plaintext, nsquare)
+
+    result = paillier.EncryptedNumber(public_key_rec, ciphertext, 0)
+    return (result.ciphertext(), result.exponent)
+
+# encrypted sum (or dot product, if weights are given) of a vector of 
+# (ciphertext, exponent) tuples. adding encrypted numbers requires their 
+# exponents to match, so operands are aligned to the smallest exponent 
+# (and weights to a common exponent) once, and the ciphertexts are then 
+# multiplied together, one at a time.
+def encrypted_sum(public_key_rec, operands, weights = None):
+
+    nsquare = public_key_rec.nsquare
+    exponent = min(int(e) for c, e in operands)
+
+    if weights is not None:
+
+        if len(weights) != len(operands):
+            raise ValueError('%d weights for %d operands' % (len(weights), len(operands)))
+
+        encodings = [ paillier.EncodedNumber.encode(public_key_rec, float(w)) for w in weights ]
+        weight_exponent = min(encoding.exponent for encoding in encodings)
+        encodings = [ encoding.decrease_exponent_to(weight_exponent) for encoding in encodings ]
+
+    else:
+        weight_exponent = 0
+
+    # encryption of 0, w/o obfuscation
+    ciphertext = 1
+
+    for i, (c, e) in enumerate(operands):
+
+        operand = paillier.EncryptedNumber(public_key_rec, int(c), int(e))
+        if operand.exponent > exponent:
+            operand = operand.decrease_exponent_to(exponent)
+
+        if weights is not None:
+            operand = operand * encodings[i]
+
+        ciphertext = mulmod(ciphertext, operand.ciphertext(be_secure = False), nsquare)
+
+    return paillier.EncryptedNumber(public_key_rec, ciphertext, exponent + weight_exponent)
+
+def process_vector_operation(mode, operation, operand_1, operand_2, public_key_rec = None):
+
+    # reject empty (and mismatched) vectors before any work is done
+    if len(operand_1) == 0:
+        raise ValueError('empty vector for %s' % (operation))
+    if operation == 'dot' and len(operand_2) != len(operand_1):
+        raise ValueError('%d weights for %d operands' % (len(operand_2), len(operand_1)))
+
+    if mode == 'encrypted':
+
+        if operation == 'dot':
+            result = encrypted_sum(public_key_rec, operand_1, operand_2)
+        else:
+            result = encrypted_sum(public_key_rec, operand_1)
+
+        if operation == 'mean':
+            result = result * (1.0 / len(operand_1))
+
+        return (result.ciphertext(), result.exponent)
+
+    else:
+
+        if operation == 'dot':
+            result = sum(float(x) * float(w) for x, w in zip(operand_1, operand_2))
+        else:
+            result = sum(float(x) for x in operand_1)
+
+        if operation == 'mean':
+            result = result / len(operand_1)
+
+        return result
+
+# w/ all operands encoded w/ the same exponent, sums need no exponent 
+# alignment (i.e. no extra modular exponentiation, see 
+# paillier.EncryptedNumber.decrease_exponent_to()) : a sum of 2 encrypted 
+# numbers is a single modular multiplication, and so is the sum w/ a scalar, 
+# once the scalar is encoded w/ the same exponent.
+def process_fixed_operation(operation, operand_1, operand_2, public_key_rec, exponent):
+
+    n = public_key_rec.n
+    nsquare = public_key_rec.nsquare
+
+    if operation == '+':
+        ciphertext = int(operand_2[0])
+
+    else:
+        # the scalar is rounded to the agreed precision
+        plaintext = int(round(float(operand_2) * pow(paillier.EncodedNumber.BASE, -exponent))) % n
+
+        if public_key_rec.g == n + 1:
+            # (n + 1)^m = 1 + n * m mod n^2
+            ciphertext = (n * plaintext + 1) % nsquare
+        else:
+            ciphertext = powmod(public_key_rec.g, plaintext, nsquare)
+
+    return (mulmod(int(operand_1[0]), ciphertext, nsquare), exponent)
+
+def is_fixed(operation, operand_1, operand_2, exponent):
+
+    if exponent is None or operation not in FIXED_OPERATIONS or int(operand_1[1]) != exponent:
+        return False
+
+    return operation != '+' or int(operand_2[1]) == exponent
+
+# evaluates a single operation, and returns its result, ready to be json'd. 
+# exponent is the fixed exponent of encrypted operands agreed w/ the client, 
+# if any.
+def process_operation(mode, operation, operand_1, operand_2, public_key_rec = None, exponent = None):
+
+    if operation in VECTOR_OPERATIONS:
+        return process_vector_operation(mode, operation, operand_1, operand_2, public_key_rec)
+
+    if operation in PACKED_OPERATIONS:
+        return process_packed_operation(mode, operation, operand_1, operand_2, public_key_rec)
+
+    if mode == 'encrypted' and is_fixed(operation, operand_1, operand_2, exponent):
+        return process_fixed_operation(operation, operand_1, operand_2, public_key_rec, exponent)
+
+    if mode == 'encrypted':
+
+        operand_1 = paillier.EncryptedNumber(public_key_rec, int(operand_1[0]), int(operand_1[1]))
+
+        # if operation is plain addition, encrypt the 2nd operand too 
+        if operation == '+':
+            operand_2 = paillier.EncryptedNumber(public_key_rec, int(operand_2[0]), int(operand_2[1]))
+        else:
+            operand_2 = float(operand_2)
+
+        # the actual operation
+        if operation == 'x*':
+            result = operand_1 * operand_2
+        else:
+            result = operand_1 + operand_2
+
+        return (result.ciphertext(), result.exponent)
+
+    else:
+
+        if '+' in operation:
+            result = float(operand_1) + float(operand_2)
+        else:
+            result = float(operand_1) * float(operand_2)
+
+        return result
+
+# evaluates a list of (operation, operand 1, operand 2) tuples. returns a 
+# list of (result, execution time) tuples, in the same order.
+def process_operations(mode, ops, public_key_rec = None, exponent = None):
+
+    results = []
+    for operation, operand_1, operand_2 in ops:
+
+        start_time = time.time()
+        result = process_operation(mode, operation, operand_1, operand_2, public_key_rec, exponent)
+        results.append((result, time.time() - start_time))
+
+    return results
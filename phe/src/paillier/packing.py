@@ -0,0 +1,113 @@
+# packs several bounded, non-negative fixed-point values into the slots of
+# a single paillier plaintext, so that one encryption (and ciphertext, and
+# homomorphic operation, and decryption) covers several values :
+#
+#   m = v_0 + v_1 * 2^s + v_2 * 2^(2s) + ... + v_(k-1) * 2^((k-1)s)
+#
+# w/ s the nr. of bits per slot, and v_i = round(value_i * 2^f) the
+# fixed-point encoding of value_i, w/ f fractional bits.
+#
+# since E(a) * E(b) = E(a + b) and E(a)^k = E(k * a), multiplying packed
+# ciphertexts adds them slot-wise, and raising a packed ciphertext to an
+# integer k multiplies every slot by k, as long as no slot overflows into
+# the next one. the packing is set up so that this can't happen, given :
+#
+#   - values in [0, max_value]
+#   - scalars in [0, max_scalar], encoded w/ g fractional bits (i.e. as
+#     k = round(scalar * 2^g))
+#   - a single operation per ciphertext : addition of 2 packed values (or of
+#     a packed value and a scalar), or multiplication by a scalar
+#
+# the largest slot value is then max(2 * max_value * 2^f,
+# max_value * max_scalar * 2^(f + g)), which must fit in s bits. the result
+# of a multiplication by a scalar has f + g fractional bits, all other
+# results have f.
+#
+# negative values are not supported : they would borrow from the next slot.
+
+class Packing:
+
+    def __init__(self, public_key, slot_bits = 64, fraction_bits = 20, scalar_fraction_bits = 20,
+        max_value = 100.0, max_scalar = 100.0):
+
+        self.public_key = public_key
+
+        self.slot_bits = slot_bits
+        self.fraction_bits = fraction_bits
+        self.scalar_fraction_bits = scalar_fraction_bits
+        self.max_value = max_value
+        self.max_scalar = max_scalar
+
+        max_slot_value = max(2 * self.encode(max_value), self.encode(max_value) * self.encode_scalar(max_scalar))
+        if max_slot_value >= (1 << slot_bits):
+            raise ValueError('%d bit slots may overflow (need %d bits)' % (slot_bits, max_slot_value.bit_length()))
+
+        # the packed plaintext must stay < n
+        self.slots = (public_key.n.bit_length() - 1) // slot_bits
+        self.slot_mask = (1 << slot_bits) - 1
+
+    def encode(self, value):
+
+        if not 0.0 <= value <= self.max_value:
+            raise ValueError('value %f out of packing bounds [0, %f]' % (value, self.max_value))
+
+        return int(round(value * (1 << self.fraction_bits)))
+
+    # scalar multiplier for a packed ciphertext (operand 2 of 'px*')
+    def encode_scalar(self, scalar):
+
+        if not 0.0 <= scalar <= self.max_scalar:
+            raise ValueError('scalar %f out of packing bounds [0, %f]' % (scalar, self.max_scalar))
+
+        return int(round(scalar * (1 << self.scalar_fraction_bits)))
+
+    def pack(self, values):
+
+        if len(values) > self.slots:
+            raise ValueError('%d values for %d slots' % (len(values), self.slots))
+
+        plaintext = 0
+        for i, value in enumerate(values):
+            plaintext |= self.encode(value) << (i * self.slot_bits)
+
+        return plaintext
+
+    def unpack(self, plaintext, count, fraction_bits = None):
+
+        if fraction_bits is None:
+            fraction_bits = self.fraction_bits
+
+        scale = float(1 << fraction_bits)
+        return [ ((plaintext >> (i * self.slot_bits)) & self.slot_mask) / scale for i in xrange(count) ]
+
+    # nr. of fractional bits of the result of a (packed) operation
+    def result_fraction_bits(self, operation):
+
+        if operation.endswith('x*'):
+            return self.fraction_bits + self.scalar_fraction_bits
+
+        return self.fraction_bits
+
+    # max. absolute error of a slot of the result of a (packed) operation,
+    # due to rounding to fixed-point
+    def tolerance(self, operation):
+
+        value_error = 1.0 / (1 << (self.fraction_bits + 1))
+        scalar_error = 1.0 / (1 << (self.scalar_fraction_bits + 1))
+
+        if operation.endswith('x*'):
+            return self.max_scalar * value_error + self.max_value * scalar_error + value_error * scalar_error
+
+        return 2 * value_error
+
+    # encrypt_raw is a function which paillier-encrypts a (positive) integer,
+    # e.g. public_key.raw_encrypt
+    def encrypt(self, values, encrypt_raw = None):
+
+        if encrypt_raw is None:
+            encrypt_raw = self.public_key.raw_encrypt
+
+        return encrypt_raw(self.pack(values))
+
+    def decrypt(self, private_key, ciphertext, count, fraction_bits = None):
+        return self.unpack(private_key.raw_decrypt(ciphertext), count, fraction_bits)
@@ -0,0 +1,109 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+# custom imports
+import operations
+
+# named encrypted registers, kept on the server for the duration of a
+# session, so that clients can accumulate encrypted values w/o getting each
+# intermediate result back. a register holds a single encrypted number, as
+# a (ciphertext, exponent) tuple, and supports :
+#
+#   'add_to' : adds an encrypted number or a scalar to the register
+#   'scale'  : multiplies the register by a scalar
+#   'read'   : returns the current value of the register
+#   'delete' : drops the register
+#
+# memory is bounded : registers are evicted in least-recently-used order
+# once there are more than max_registers, and dropped once they go unused
+# for more than ttl seconds. a register that is added to after being
+# dropped starts over from 0 : each register also counts the values added
+# to it, so that clients can tell if contributions were lost.
+
+REGISTER_OPS = ['add_to', 'scale', 'read', 'delete']
+
+class RegisterStore:
+
+    def __init__(self, public_key, exponent = None, max_registers = 1024, ttl = 600.0):
+
+        self.public_key = public_key
+        # fixed exponent agreed w/ the client, if any (see
+        # operations.process_fixed_operation())
+        self.exponent = exponent
+
+        self.max_registers = max_registers
+        self.ttl = ttl
+
+        # name -> [(ciphertext, exponent), nr. of values added, time of last
+        # use], least recently used first
+        self.registers = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.evictions = 0
+        self.expirations = 0
+
+    # an empty register : an (unobfuscated) encryption of 0
+    def zero(self):
+        return (1, self.exponent if self.exponent is not None else 0)
+
+    def expire(self, now):
+
+        while self.registers:
+
+            name, (value, count, last_used) = next(self.registers.iteritems())
+            if now - last_used <= self.ttl:
+                break
+
+            del self.registers[name]
+            self.expirations += 1
+
+    # returns the current value of a register and the nr. of values added
+    # to it (None if there's no such register), after applying op to it
+    def apply(self, op, name, operand = None, encrypted = False):
+
+        if op not in REGISTER_OPS:
+            raise ValueError('unknown register operation : %s' % (op))
+
+        now = time.time()
+
+        with self.lock:
+
+            self.expire(now)
+
+            if op == 'delete':
+                entry = self.registers.pop(name, None)
+                return (entry[0], entry[1]) if entry is not None else None
+
+            if name not in self.registers:
+
+                if op != 'add_to':
+                    return None
+
+                self.registers[name] = [self.zero(), 0, now]
+
+                while len(self.registers) > self.max_registers:
+                    self.registers.popitem(last = False)
+                    self.evictions += 1
+
+            # move the register to the end, i.e. make it the most recently used
+            entry = self.registers.pop(name)
+            entry[2] = now
+            self.registers[name] = entry
+
+            if op == 'add_to':
+                operation = '+' if encrypted else '+*'
+                entry[1] += 1
+            elif op == 'scale':
+                operation = 'x*'
+            else:
+                return (entry[0], entry[1])
+
+            entry[0] = operations.process_operation('encrypted', operation, entry[0], operand,
+                self.public_key, self.exponent)
+
+            return (entry[0], entry[1])
+
+    def __len__(self):
+        return len(self.registers)
@@ -0,0 +1,340 @@
+import sys
+import argparse
+import socket
+import threading
+import collections
+import time
+import json
+
+# custom imports
+import wire
+import transport
+import tracefile
+import histogram
+import loadgen
+
+# replays a trace recorded by the client (see '--record' in client.py, and
+# tracefile.py) against a running server : the recorded frames are sent
+# as they are, so that replay needs neither the private key nor any
+# encryption work, and several connections (and repeats of the trace) can
+# saturate a server from a small machine.
+#
+# frames are sent at the recorded pace (optionally sped up or slowed down
+# w/ '--speed'), or as fast as possible (w/ '--speed max'). as in
+# loadgen.py's open loop, latencies are measured from the time each frame
+# was scheduled to be sent. responses are matched to frames by request id,
+# or in order for frames w/o one (the server answers them in order).
+
+class ReplayStats:
+
+    def __init__(self):
+
+        self.latencies = histogram.Histogram()
+        self.requests = 0
+        self.ops = 0
+        self.bytes = 0
+        self.responses = 0
+        # nr. of error responses, per error (e.g. 'busy')
+        self.errors = collections.defaultdict(int)
+        # nr. of responses which match no frame sent
+        self.unmatched = 0
+
+        self.lock = threading.Lock()
+
+    # ops in frames w/o a response (e.g. register contributions) count once 
+    # they're sent, others once they're answered
+    def sent(self, body, nr_ops = 0):
+
+        with self.lock:
+            self.requests += 1
+            self.bytes += len(body)
+            self.ops += nr_ops
+
+    def record(self, response, latency, nr_ops):
+
+        self.latencies.record(latency)
+
+        with self.lock:
+            self.responses += 1
+            if response['type'] == 'error':
+                self.errors[response.get('error', 'unknown')] += 1
+            else:
+                self.ops += nr_ops
+
+    def record_unmatched(self, response):
+
+        with self.lock:
+            self.unmatched += 1
+            if response['type'] == 'error':
+                self.errors[response.get('error', 'unknown')] += 1
+
+# a connection to the server, w/ a sender thread (which replays the trace)
+# and a receiver thread (which matches responses to frames)
+class ReplayConnection:
+
+    def __init__(self, kind, server_address, unix_path, records, stats):
+
+        self.records = records
+        self.stats = stats
+
+        self.sock = transport.connect(kind, server_address, unix_path)
+        self.reader = transport.FrameReader()
+
+        # request id -> (intended send time, nr. of ops) of frames w/o a
+        # response, and the same for frames w/o a request id, in order
+        self.pending = collections.defaultdict(collections.deque)
+        self.ordered = collections.deque()
+        self.nr_pending = 0
+        self.pending_lock = threading.Condition()
+
+        # max. nr. of frames w/o a response, if any
+        self.window = None
+
+    # replays the trace repeat times, at speed x the recorded pace (or as
+    # fast as possible, if speed is None)
+    def run_sender(self, speed, repeat):
+
+        start_time = time.time()
+        elapsed = 0.0
+
+        try:
+            for i in xrange(repeat):
+                for gap, flags, nr_ops, request_id, body in self.records:
+
+                    intended_time = None
+                    if speed is not None:
+                        elapsed += gap / speed
+                        intended_time = start_time + elapsed
+                        delay = intended_time - time.time()
+                        if delay > 0.0:
+                            time.sleep(delay)
+
+                    if flags & tracefile.TRACE_REPLY:
+
+                        if self.window is not None:
+                            self.window.acquire()
+
+                        if intended_time is None:
+                            intended_time = time.time()
+
+                        with self.pending_lock:
+                            if request_id:
+                                self.pending[request_id].append((intended_time, nr_ops))
+                            else:
+                                self.ordered.append((intended_time, nr_ops))
+                            self.nr_pending += 1
+
+                    transport.send_frame(self.sock, body)
+                    self.stats.sent(body, 0 if flags & tracefile.TRACE_REPLY else nr_ops)
+
+        except socket.error, e:
+            print('replay::run_sender() : [ERROR] %s' % (e))
+
+    def run_receiver(self):
+
+        while True:
+
+            try:
+                response = wire.decode(self.reader.recv_frame(self.sock))
+            except socket.error:
+                return
+
+            now = time.time()
+
+            with self.pending_lock:
+
+                request_id = response.get('id', 0)
+                if request_id and self.pending.get(request_id):
+                    intended_time, nr_ops = self.pending[request_id].popleft()
+                    if not self.pending[request_id]:
+                        del self.pending[request_id]
+                elif self.ordered:
+                    intended_time, nr_ops = self.ordered.popleft()
+                # e.g. an error response to a frame recorded as w/o a 
+                # response, or a response w/ an unknown id
+                else:
+                    print('replay::run_receiver() : [WARNING] unmatched response : %s' % (response.get('type')))
+                    self.stats.record_unmatched(response)
+                    continue
+
+                self.nr_pending -= 1
+                self.pending_lock.notify_all()
+
+            self.stats.record(response, now - intended_time, nr_ops)
+
+            if self.window is not None:
+                self.window.release()
+
+    def start(self, speed, repeat, window):
+
+        if window > 0:
+            self.window = threading.Semaphore(window)
+
+        self.receiver = threading.Thread(target = self.run_receiver)
+        self.receiver.daemon = True
+        self.receiver.start()
+
+        self.sender = threading.Thread(target = self.run_sender, args = (speed, repeat))
+        self.sender.daemon = True
+        self.sender.start()
+
+    # waits for the trace to be sent, and up to timeout seconds for the
+    # responses to it, and closes the connection. returns the nr. of frames
+    # left w/o a response.
+    def close(self, timeout):
+
+        self.sender.join()
+
+        deadline = time.time() + timeout
+        with self.pending_lock:
+            while self.nr_pending and time.time() < deadline:
+                self.pending_lock.wait(deadline - time.time())
+            lost = self.nr_pending
+
+        terminate = {}
+        terminate['type'] = 'terminate'
+
+        try:
+            transport.send_frame(self.sock, wire.encode(terminate))
+        except socket.error:
+            pass
+
+        # unblocks the receiver
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+        self.receiver.join()
+        self.sock.close()
+        return lost
+
+if __name__ == "__main__":
+
+    # use an ArgumentParser for a nice CLI
+    parser = argparse.ArgumentParser()
+
+    # options (self-explanatory)
+    parser.add_argument(
+        "trace",
+         help = """trace file to replay (see '--record' in client.py)""")
+
+    parser.add_argument(
+        "--server",
+         help = """<host>:<port> of the server (default : localhost:10000)""")
+
+    parser.add_argument(
+        "--transport",
+         help = """how to reach the server : 'tcp' or 'unix' (default : tcp)""")
+
+    parser.add_argument(
+        "--unix-socket",
+         help = """path of the server's unix socket, w/ '--transport unix' (default : %s)""" % (transport.DEFAULT_UNIX_SOCKET))
+
+    parser.add_argument(
+        "--speed",
+         help = """replay at <speed> x the recorded pace, or 'max' for as fast as possible (default : 1)""")
+
+    parser.add_argument(
+        "--connections",
+         help = """nr. of connections replaying the trace at once (default : 1)""")
+
+    parser.add_argument(
+        "--repeat",
+         help = """nr. of times each connection replays the trace (default : 1)""")
+
+    parser.add_argument(
+        "--window",
+         help = """max. nr. of frames w/o a response per connection (default : 0, i.e. no limit)""")
+
+    parser.add_argument(
+        "--timeout",
+         help = """seconds to wait for responses once the trace is sent (default : 30)""")
+
+    parser.add_argument(
+        "--output",
+         help = """file to write the results to, in json""")
+
+    args = parser.parse_args()
+
+    host, port = (args.server if args.server else 'localhost:10000').rsplit(':', 1)
+    server_address = (host, int(port))
+    kind = args.transport if args.transport else 'tcp'
+    unix_path = args.unix_socket if args.unix_socket else transport.DEFAULT_UNIX_SOCKET
+    speed = None if args.speed == 'max' else (float(args.speed) if args.speed else 1.0)
+    nr_connections = int(args.connections) if args.connections else 1
+    repeat = int(args.repeat) if args.repeat else 1
+    window = int(args.window) if args.window else 0
+    timeout = float(args.timeout) if args.timeout else 30.0
+
+    if kind not in ['tcp', 'unix']:
+        sys.stderr.write("""%s: [ERROR] unknown transport : %s\n""" % (sys.argv[0], kind))
+        parser.print_help()
+        sys.exit(1)
+
+    if speed is not None and speed <= 0.0:
+        sys.stderr.write("""%s: [ERROR] invalid speed : %s\n""" % (sys.argv[0], args.speed))
+        parser.print_help()
+        sys.exit(1)
+
+    try:
+        metadata, records = tracefile.load(args.trace)
+    except (IOError, ValueError), e:
+        sys.stderr.write("""%s: [ERROR] %s\n""" % (sys.argv[0], e))
+        sys.exit(1)
+
+    if metadata.get('truncated'):
+        print('[WARNING] %s is truncated : replaying the %d complete frames' % (args.trace, len(records)))
+
+    print('trace : %d frames, %d operations, %.3f sec (%d bit key %s, %s format)' % (len(records),
+        sum(r[2] for r in records), sum(r[0] for r in records), metadata.get('key_size', 0),
+        metadata.get('key_id'), metadata.get('format')))
+    print('replaying on %d connection(s), %d time(s), at %s' % (nr_connections, repeat,
+        'max. speed' if speed is None else ('%gx the recorded pace' % (speed))))
+
+    stats = ReplayStats()
+    connections = [ ReplayConnection(kind, server_address, unix_path, records, stats) for i in xrange(nr_connections) ]
+
+    start_time = time.time()
+    for connection in connections:
+        connection.start(speed, repeat, window)
+
+    lost = sum(connection.close(timeout) for connection in connections)
+    duration = time.time() - start_time
+
+    summary = stats.latencies.summary()
+
+    print('%-24s %8s %10s %10s %10s %10s %10s' % ('', 'count', 'p50 (ms)', 'p90 (ms)', 'p99 (ms)', 'p999 (ms)', 'max (ms)'))
+    loadgen.print_summary(summary, 'responses')
+
+    print('%d frames (%d bytes) sent in %.3f sec : %.1f frames/sec, %.1f ops/sec' % (stats.requests, stats.bytes,
+        duration, stats.requests / duration, stats.ops / duration))
+
+    for error, count in sorted(stats.errors.items()):
+        print('[WARNING] %d \'%s\' errors' % (count, error))
+
+    if lost:
+        print('[WARNING] %d frames w/o a response' % (lost))
+
+    if stats.unmatched:
+        print('[WARNING] %d responses matched no frame' % (stats.unmatched))
+
+    if args.output:
+
+        results = {}
+        results['config'] = {'trace' : args.trace, 'metadata' : metadata, 'transport' : kind,
+            'speed' : speed if speed is not None else 'max', 'connections' : nr_connections,
+            'repeat' : repeat, 'window' : window}
+        results['duration'] = duration
+        results['frames'] = stats.requests
+        results['bytes'] = stats.bytes
+        results['ops'] = stats.ops
+        results['ops_per_sec'] = stats.ops / duration
+        results['errors'] = dict(stats.errors)
+        results['lost'] = lost
+        results['unmatched'] = stats.unmatched
+        results['latency'] = summary
+
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent = 2, sort_keys = True)
+        print('results written to %s' % (args.output))
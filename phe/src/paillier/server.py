@@ -6,10 +6,8 @@ import random
 import fcntl, os
 import errno
 import thread
+import threading
 import time
-import numpy as np
-import matplotlib
-import matplotlib.pyplot as plt
 import math
 
 from collections import defaultdict
@@ -17,130 +15,646 @@ from phe import paillier # for hpe operations
 from pprint import pprint 
 from signal import signal, SIGINT
 
-processing_times = defaultdict()
+# custom imports
+import keycache
+import wire
+import eventloop
+import transport
+import histogram
+import operations
+import workers
+import registers
+import workqueue
+import backend
+
+# execution times of operations, per (mode, operation), and of each phase 
+# of request handling ('parse', 'compute' and 'serialize'), in fixed-size 
+# histograms (see histogram.py)
+operation_times = histogram.HistogramSet()
+phase_times = histogram.HistogramSet()
+# nr. of connections, requests, operations, etc.
+counters = histogram.Counters()
 sock = None
 
+# public keys registered by clients, shared by all connections
+key_cache = keycache.KeyCache()
+# bounded queue of requests, and the threads which evaluate them, shared by 
+# all connections (see workqueue.py)
+work_queue = None
+# what to do w/ requests once the queue is full : 'block' (stop reading 
+# requests, until there's room in the queue) or 'busy' (reply w/ a 'busy' 
+# error, which the client may retry)
+overload = 'block'
+# max. nr. of requests of a single connection in the queue (or being 
+# evaluated) at once. connections at the limit stop reading requests.
+max_in_flight = eventloop.MAX_IN_FLIGHT
+# set in '--event-loop' mode
+event_loop = None
+# processes which evaluate operations, if '--workers' is set
+worker_pool = None
+# unix socket the server also listens on, if '--unix-socket' is set, and 
+# whether clients on the same host may pass frames through shared memory 
+# rings ('--shm', see transport.ShmChannel)
+unix_sock = None
+unix_path = None
+shm_enabled = False
+# max. nr. of encrypted registers per connection, and max. time (in 
+# seconds) a register is kept w/o being used (see registers.py)
+max_registers = 1024
+register_ttl = 600.0
+
 def signal_handler(signal, frame):
+
+    # the event loop stops accepting requests, and returns once in-flight 
+    # requests are done
+    if event_loop is not None:
+        event_loop.stop()
+        return
+
     sock.close()
+    if unix_sock is not None:
+        unix_sock.close()
+        os.unlink(unix_path)
     sys.exit(0)
 
 # register SIGINT callback
 signal(SIGINT, signal_handler)
 
+def register_key(request):
+
+    public_key = request['public_key']
+    key_id, public_key_rec = key_cache.register(int(public_key['g']), int(public_key['n']))
+    print('server::register_key() : registered key %s (%d keys cached)' % (key_id, len(key_cache)))
+
+    return key_id, public_key_rec
+
+# modes and operations come from clients : only known ones get a histogram, 
+# so that clients can't make the server keep any nr. of them
+def record_time(mode, operation, duration):
+
+    if mode == 'register':
+        known = operation in wire.REGISTER_OPS
+    else:
+        known = mode in wire.MODES and operation in wire.OPERATIONS
+
+    if not known:
+        counters.add('unknown-operations')
+        return
+
+    operation_times.record((mode, operation), duration)
+
+# current quantiles and counters, for a 'stats' request
+def stats_message(request):
+
+    response = {}
+    response['type'] = 'stats'
+    response['counters'] = counters.summary()
+    response['operations'] = operation_times.summary()
+    response['phases'] = phase_times.summary()
+    response['key_cache'] = {'keys' : len(key_cache), 'hits' : key_cache.hits, 'misses' : key_cache.misses}
+    response['queue'] = work_queue.summary()
+    response['backend'] = backend.describe()
+
+    if 'id' in request:
+        response['id'] = request['id']
+
+    return response
+
+# evaluates a list of (operation, operand 1, operand 2) tuples, on the 
+# worker processes if there are any. returns a list of results, in the 
+# same order.
+def evaluate_operations(mode, ops, public_key_rec = None, key_id = None, exponent = None):
+
+    if worker_pool is not None:
+        results = worker_pool.process_operations(mode, ops, public_key_rec, key_id, exponent)
+    else:
+        results = operations.process_operations(mode, ops, public_key_rec, exponent)
+
+    for (operation, operand_1, operand_2), (result, duration) in zip(ops, results):
+        record_time(mode, operation, duration)
+
+    counters.add('operations', len(ops))
+
+    return [ result for result, duration in results ]
+
 def process_request(request, public_key_rec = None):
 
     # prepare the response
     response = {}
     response['type'] = 'response'
     response['mode'] = request['mode']
-    response['public_key'] = request['public_key']
     response['operation']  = request['operation']
 
     if request['mode'] == 'encrypted':
+        response['key_id'] = request['key_id']
+
+    print('performing operation %s' % (request['operation']))
+    ops = [(request['operation'], request['operand_1'], request['operand_2'])]
+    response['result'] = evaluate_operations(request['mode'], ops, public_key_rec, request.get('key_id'), request.get('exponent'))[0]
 
-        if public_key_rec is None:
-            print('unloading public key')
-            public_key = request['public_key']
-            public_key_rec = paillier.PaillierPublicKey(g = int(public_key['g']),
-                                                        n = int(public_key['n']))
+    return response
 
-        print('unloading encrypted operand')
-        operand_1 = paillier.EncryptedNumber(public_key_rec, int(request['operand_1'][0]), int(request['operand_1'][1]))
+# a batch carries a list of operations (w/ the same mode and key, but 
+# possibly different operation types), which are evaluated in a single pass, 
+# and answered w/ a single response, w/ results in the same order
+def process_batch(request, public_key_rec = None):
 
-        # if operation is plain addition, encrypt the 2nd operand too 
-        if request['operation'] == '+':
-            operand_2 = paillier.EncryptedNumber(public_key_rec, int(request['operand_2'][0]), int(request['operand_2'][1]))
-        else:
-            operand_2 = float(request['operand_2'])
+    mode = request['mode']
 
-        # the actual operation
-        print('performing operation %s' % (request['operation']))
-        if request['operation'] == 'x*':
-            result = operand_1 * operand_2
-        else:
-            result = operand_1 + operand_2
+    response = {}
+    response['type'] = 'response'
+    response['mode'] = mode
+
+    if mode == 'encrypted':
+        response['key_id'] = request['key_id']
+
+    print('performing batch of %d operations' % (len(request['ops'])))
+
+    ops = [ (op['operation'], op['operand_1'], op['operand_2']) for op in request['ops'] ]
+    response['results'] = evaluate_operations(mode, ops, public_key_rec, request.get('key_id'), request.get('exponent'))
+
+    return response
+
+# reply to a request which couldn't be handled
+def error_message(request, error):
+
+    response = {}
+    response['type'] = 'error'
+    response['error'] = error
+    if 'key_id' in request:
+        response['key_id'] = request['key_id']
+    if 'id' in request:
+        response['id'] = request['id']
+
+    return response
+
+# reply to a request turned away because the work queue is full
+def busy_message(request):
+
+    counters.add('busy-errors')
+    return error_message(request, 'busy')
+
+def send_message(sock, message, fmt = 'json', width = 0, ring = None):
+
+    start_time = time.time()
+    body = wire.encode(message, fmt, width)
+    phase_times.record(('serialize',), time.time() - start_time)
+    body_len = len(body)
+
+    print('server::send_message() : sending %s (%d)' % (message['type'], body_len))
+    transport.send_frame(sock, body, ring)
+
+# requests which must be done before the connection's next request is 
+# handled : those w/o id, and operations on registers, whatever their id 
+# (e.g. an 'add_to' must be done before a 'read' of the same register)
+def is_ordered(request):
+    return 'id' not in request or request['type'] == 'register_op'
+
+# per-connection state of the protocol
+class Session:
+
+    def __init__(self):
+
+        # key registered by this connection. it is kept here as well as in 
+        # the shared key cache, so that eviction from the cache doesn't 
+        # affect clients which remain connected
+        self.key_id = None
+        self.public_key = None
+        # wire format agreed w/ the client at key registration
+        self.format = 'json'
+        # fixed exponent of the client's encrypted operands, if agreed at key 
+        # registration (see operations.process_fixed_operation())
+        self.exponent = None
+        # encrypted registers of this connection, created on the 1st 
+        # register operation, under the registered key (see registers.py)
+        self.registers = None
+        # shared memory rings agreed w/ the client, if any
+        self.shm = None
+
+# a connection served by its own thread (the default server mode), which 
+# reads requests and hands them to the work queue. it shares its state w/ 
+# the work queue threads, which reply to requests as soon as they're done, 
+# possibly out of order.
+class Connection(Session):
+
+    def __init__(self, sock):
+
+        Session.__init__(self)
+
+        self.sock = sock
+        self.send_lock = threading.Lock()
+        # a client may send several requests back-to-back : whatever comes 
+        # after a frame is kept in the reader's buffer
+        self.reader = transport.FrameReader()
+
+        # nr. of requests handed to the work queue, still w/o a response
+        self.in_flight = 0
+        self.in_flight_cond = threading.Condition()
+
+    def send(self, message, fmt = 'json', width = 0):
+
+        with self.send_lock:
+            send_message(self.sock, message, fmt, width, self.shm.outbound if self.shm else None)
+
+    def attach_shm(self, channel):
+
+        self.shm = channel
+        self.reader.ring = channel.inbound
+
+    # evaluates a request on the work queue, and sends back its response
+    def submit(self, request, public_key_rec, fmt, width):
+
+        # requests w/o id get their responses in order : wait for this one 
+        # to be done before reading the next. pipelined requests (i.e. w/ 
+        # an id) are answered as soon as they're done. register operations 
+        # are always applied in order.
+        done = threading.Event() if is_ordered(request) else None
+
+        self.start_request()
+        if not work_queue.submit(evaluate_and_reply, (self, request, public_key_rec, fmt, width, done), 
+            block = (overload == 'block')):
+
+            self.end_request()
+            self.send(busy_message(request))
+            return
+
+        if done is not None:
+            done.wait()
+
+    # waits while the connection is at its in-flight limit : we don't read 
+    # from the socket in the meantime, so the client is held back by TCP 
+    # flow control
+    def start_request(self):
+
+        with self.in_flight_cond:
+            while self.in_flight >= max_in_flight:
+                self.in_flight_cond.wait()
+            self.in_flight += 1
+
+    def end_request(self):
+
+        with self.in_flight_cond:
+            self.in_flight -= 1
+            self.in_flight_cond.notify_all()
+
+    # waits for the responses to pipelined requests to be sent
+    def drain(self):
+
+        with self.in_flight_cond:
+            while self.in_flight > 0:
+                self.in_flight_cond.wait()
+
+    def close(self):
+        self.drain()
+        self.sock.close()
+
+# a connection served by the event loop (see eventloop.py), in the 
+# '--event-loop' server mode
+class EventConnection(eventloop.LoopConnection, Session):
+
+    def __init__(self, loop, sock, address):
+
+        eventloop.LoopConnection.__init__(self, loop, sock, address)
+        Session.__init__(self)
+
+        counters.add('connections')
+
+    def on_frame(self, body):
+
+        # a bad request must not bring the whole event loop down
+        try:
+            handle_request(self, decode_request(body))
+
+        except Exception, e:
+            print('server::EventConnection::on_frame() : error occurred: %s. aborting.' % (e))
+            self.close_now()
+
+    def send(self, message, fmt = 'json', width = 0):
+
+        start_time = time.time()
+        body = wire.encode(message, fmt, width)
+        phase_times.record(('serialize',), time.time() - start_time)
+
+        print('server::EventConnection::send() : sending %s (%d)' % (message['type'], len(body)))
+        self.send_frame(body)
+
+    def attach_shm(self, channel):
+
+        self.shm = channel
+        self.reader.ring = channel.inbound
+        self.writer.ring = channel.outbound
+
+    # requests are evaluated on the work queue, so that the event loop is 
+    # never blocked by cpu heavy operations
+    def submit(self, request, public_key_rec, fmt, width):
+
+        # requests w/o id (and register operations) are handled in order : 
+        # hold on to the following requests until this one is done
+        ordered = is_ordered(request)
+
+        def reply(connection, response):
+
+            if response is not None:
+                connection.send(response, fmt, width)
+            if ordered:
+                connection.resume()
+
+        # w/ '--overload block', the event loop doesn't read requests while 
+        # the queue is full, so this only fails w/ '--overload busy'
+        if not self.loop.submit(self, evaluate_or_error, (request, public_key_rec), reply):
+            self.send(busy_message(request))
+            return
+
+        if ordered:
+            self.pause()
+
+    # the event loop closes the connection only after in-flight requests 
+    # are done, so there's nothing to wait for here
+    def drain(self):
+        pass
+
+# applies an operation to one of the connection's encrypted registers 
+# (which go along w/ the request, see handle_request()), and returns the 
+# register's value, or None if the client asked for no reply (e.g. when 
+# streaming contributions to a register)
+def process_register_op(request):
+
+    start_time = time.time()
+
+    value = request['registers'].apply(request['op'], request['register'], 
+        request.get('operand'), request.get('encrypted', False))
+
+    record_time('register', request['op'], time.time() - start_time)
+    counters.add('register-ops')
 
-        response['result'] = (str(result.ciphertext()), result.exponent)
+    if not request.get('reply', True):
+        return None
+
+    response = {}
+    response['type'] = 'register_value'
+    response['register'] = request['register']
+    response['key_id'] = request['key_id']
+    # None if there's no such register (e.g. if it was evicted)
+    if value is not None:
+        (ciphertext, exponent), count = value
+        response['value'] = (str(ciphertext), exponent)
+        response['count'] = count
+    else:
+        response['value'] = None
+        response['count'] = 0
+
+    return response
+
+def decode_request(body):
+
+    start_time = time.time()
+    request = wire.decode(body)
+    phase_times.record(('parse',), time.time() - start_time)
+
+    return request
+
+# returns the response to a request, or None if there's nothing to send back
+def evaluate_request(request, public_key_rec = None):
+
+    if request['type'] == 'register_op':
+
+        response = process_register_op(request)
 
     else:
 
-        if '+' in request['operation']:
-            result = float(request['operand_1']) + float(request['operand_2'])
+        start_time = time.time()
+
+        if request['type'] == 'batch':
+            response = process_batch(request, public_key_rec)
         else:
-            result = float(request['operand_1']) * float(request['operand_2'])
+            response = process_request(request, public_key_rec)
 
-        response['result'] = (str(result))
+        phase_times.record(('compute',), time.time() - start_time)
+        counters.add('requests')
+
+    # pipelined requests are matched to their responses by request id
+    if response is not None and 'id' in request:
+        response['id'] = request['id']
 
     return response
 
-def handle_client(sock, client_address):
+# evaluates a request (in any server mode), and returns its response, or an 
+# error response if it couldn't be evaluated (e.g. an empty vector), so 
+# that the client isn't left waiting for it. requests which asked for no 
+# reply get none.
+def evaluate_or_error(request, public_key_rec = None):
 
-    while True:
+    try:
+        return evaluate_request(request, public_key_rec)
 
-        try:
+    except Exception, e:
 
-            request = ''
-            request_size = 1
+        print('server::evaluate_or_error() : error occurred: %s' % (e))
+        counters.add('request-errors')
 
-            while len(request) < request_size:
+        if not request.get('reply', True):
+            return None
 
-                # keep buffering the request
-                request += sock.recv(4096)
+        return error_message(request, str(e))
 
-                # extract the request size
-                if '\r\n' in request:
-                    request_size_str = request.split('\r\n', 1)[0]
-                    request_size = len(request_size_str) + 2 + int(request_size_str)
+# runs on a work queue thread
+def evaluate_and_reply(connection, request, public_key_rec, fmt, width, done = None):
 
-                else:
-                    request_size = len(request) + 1
+    try:
+        response = evaluate_or_error(request, public_key_rec)
+        if response is not None:
+            connection.send(response, fmt, width)
 
-                print('request_size : %d (/%d)' % (request_size, len(request)))
+    except socket.error, e:
+        print('server::evaluate_and_reply() : error occurred: %s' % (e))
 
-            print('server::handle_client() : unloading json')
-            request = json.loads(request.split('\r\n', 1)[1])
+    finally:
+        connection.end_request()
+        if done is not None:
+            done.set()
 
-            if request['type'] == 'terminate':
+# handles a request from a client, in any server mode. returns False if 
+# the connection should not handle any more requests.
+def handle_request(connection, request):
 
-                print('server::handle_client() : terminating...')
-                # close the socket
-                sock.close()
-                return
+    if request['type'] == 'terminate':
 
-            elif request['type'] == 'plot':
+        print('server::handle_request() : terminating...')
+        # close the socket
+        connection.close()
+        return False
 
-                print_graph(processing_times)
-                sock.close()
-                return
+    elif request['type'] == 'plot':
+
+        connection.drain()
+        print_graph(operation_times)
+        connection.close()
+        return False
+
+    elif request['type'] == 'stats':
+
+        # answered right away, possibly ahead of in-flight requests, and w/o 
+        # closing the connection
+        connection.send(stats_message(request))
+
+    elif request['type'] == 'register':
+
+        # handshake : the client registers its public key once, and refers 
+        # to it by its key id from there on
+        connection.key_id, connection.public_key = register_key(request)
+
+        # the client may ask for a binary wire format (older clients don't 
+        # say anything, and get json)
+        if request.get('format') in wire.FORMATS:
+            connection.format = request['format']
+        else:
+            connection.format = 'json'
+
+        # the client may also encode all its operands w/ a fixed exponent
+        if isinstance(request.get('exponent'), (int, long)):
+            connection.exponent = int(request['exponent'])
+        else:
+            connection.exponent = None
+
+        # registers hold values under the previous key (and exponent)
+        connection.registers = None
+
+        response = {}
+        response['type'] = 'registered'
+        response['key_id'] = connection.key_id
+        response['format'] = connection.format
+        if connection.exponent is not None:
+            response['exponent'] = connection.exponent
+        connection.send(response)
+
+    elif request['type'] == 'shm':
 
+        # a client on the same host asks to pass large frames through a pair 
+        # of shared memory rings, in a file it created. frames sent after 
+        # this one may be in the rings already.
+        response = {}
+        response['type'] = 'shm'
+
+        if not shm_enabled:
+            response['error'] = 'shared memory not enabled'
+        else:
+            try:
+                connection.attach_shm(transport.ShmChannel.open(request['path'], int(request['size'])))
+                response['path'] = request['path']
+            except (ValueError, EnvironmentError), e:
+                response['error'] = str(e)
+
+        connection.send(response)
+
+    elif request['type'] == 'register_op':
+
+        # registers live under the key registered by the connection. 
+        # register operations (modular exponentiations and multiplications 
+        # on ciphertexts) are evaluated on the work queue, like any other 
+        # request, in the order they arrive (see submit())
+        if connection.public_key is None or request.get('key_id') != connection.key_id:
+
+            counters.add('unknown-key-errors')
+            response = {}
+            response['type'] = 'error'
+            response['error'] = 'unknown key'
+            response['key_id'] = request.get('key_id')
+            if 'id' in request:
+                response['id'] = request['id']
+            connection.send(response)
+            return True
+
+        if connection.registers is None:
+            connection.registers = registers.RegisterStore(connection.public_key, connection.exponent, 
+                max_registers, register_ttl)
+
+        request['registers'] = connection.registers
+        connection.submit(request, connection.public_key, connection.format, 
+            wire.ciphertext_width(connection.public_key))
+
+    else:
+
+        mode = request['mode']
+
+        public_key_rec = None
+        width = 0
+        if mode == 'encrypted':
+
+            # old-style requests carry the whole public key. requests w/ 
+            # neither a key nor a key id (e.g. binary frames w/ a null key 
+            # id) get an 'unknown key' error, like unknown keys.
+            if 'public_key' in request:
+                request['key_id'], public_key_rec = register_key(request)
+            elif request.get('key_id') is None:
+                public_key_rec = None
+            elif request['key_id'] == connection.key_id:
+                public_key_rec = connection.public_key
             else:
+                public_key_rec = key_cache.get(request['key_id'])
+
+            if public_key_rec is None:
+                # let the client know it should (re-)register the key
+                counters.add('unknown-key-errors')
+                response = {}
+                response['type'] = 'error'
+                response['error'] = 'unknown key'
+                response['key_id'] = request.get('key_id')
+                if 'id' in request:
+                    response['id'] = request['id']
+                connection.send(response)
+                return True
 
-                mode = request['mode']
-                operation = request['operation']
+            width = wire.ciphertext_width(public_key_rec)
+            # the exponent agreed w/ the client (if any) goes along w/ the 
+            # request to wherever it's evaluated
+            request['exponent'] = connection.exponent
 
-                if mode not in processing_times:
-                    processing_times[mode] = defaultdict()
+        connection.submit(request, public_key_rec, connection.format, width)
 
-                if operation not in processing_times[mode]:
-                    processing_times[mode][operation] = []
+    return True
 
-                start_time = time.time()
-                response = process_request(request, public_key_rec)
-                processing_times[mode][operation].append(time.time() - start_time)
+def handle_client(sock, client_address):
+
+    connection = Connection(sock)
+    counters.add('connections')
+
+    while True:
+
+        try:
 
-                response_body = json.dumps(response)
-                response_body_len = len(response_body)
+            request = connection.reader.recv_frame(sock)
 
-                print('server::handle_client() : sending response (%d)' % (response_body_len))
-                sock.sendall(str(response_body_len) + '\r\n' + response_body)
+            print('server::handle_client() : unloading request')
+            if not handle_request(connection, decode_request(request)):
+                return
 
         except socket.error, e:
             print('server::handle_client() : error occurred: %s. aborting.' % (e))
-            sock.close()
+            connection.close()
             return
 
+# accepts connections on a unix socket, and serves each on its own thread 
+# (connections on the TCP socket are accepted by the main thread)
+def accept_unix_connections(listen_sock):
+
+    while True:
+
+        try:
+            connection, client_address = listen_sock.accept()
+
+        except socket.error, e:
+            print('server::accept_unix_connections() : error occurred: %s. aborting.' % (e))
+            return
+
+        print('connection on %s' % (unix_path))
+        thread.start_new_thread(handle_client, (connection, client_address))
+
 def print_graph(data):
 
+    # plotting dependencies are slow to import, and only needed here
+    import matplotlib
+    import matplotlib.pyplot as plt
+
     fig = plt.figure(figsize=(10, 4))
 
     i = 1
@@ -150,43 +664,151 @@ def print_graph(data):
         ax1.set_title(mode)
         ax1.yaxis.grid(True)
 
-        xtick_labels = ['sum', 'sum w/ scalar', 'mult. w/ scalar']
+        # operations w/o any execution times (e.g. none were requested in 
+        # this mode) are left out
+        keys = data.keys()
+        series = [ (k, label) for k, label in [('+', 'sum'), ('+*', 'sum w/ scalar'), ('x*', 'mult. w/ scalar')] 
+            if (mode, k) in keys and data.get((mode, k)).count > 0 ]
+        xtick_labels = [ label for k, label in series ]
 
         n = 0.0
-        for k in data[mode]:
-            # if max(data[mode][k]) > n:
-            if np.percentile(data[mode][k], 0.90) > n:
-                # n = max(data[mode][k])
-                n = np.percentile(data[mode][k], 0.90)
+        for k, label in series:
+            if data.get((mode, k)).quantile(0.90) > n:
+                n = data.get((mode, k)).quantile(0.90)
                 print('server::print_graph() : %f (%d)' % (n, int(math.log10(n))))    
 
+        i = i + 1
+        if n <= 0.0:
+            continue
+
         log_n = int(math.log10(n))
-        for k in data[mode]:
-            data[mode][k] = [ (v / math.pow(10, log_n)) for v in data[mode][k] ]
 
-        values = [
-            data[mode]['+'], 
-            data[mode]['+*'], 
-            data[mode]['x*']
-        ]
+        # the histograms only keep (approximate) quantiles, so we draw the 
+        # box plots from those
+        values = [ data.get((mode, k)).boxplot_stats(1.0 / math.pow(10, log_n)) for k, label in series ]
 
-        ax1.boxplot(values, 0, '')
+        ax1.bxp(values, showfliers = False)
 
-        xticks = [1, 2, 3]
+        xticks = range(1, len(series) + 1)
         ax1.set_xticks(xticks)
         ax1.set_xticklabels(xtick_labels)
         ax1.set_xticklabels(ax1.xaxis.get_majorticklabels(), rotation=45)
         ax1.set_xlabel("Operations")
         ax1.set_ylabel("Execution time ($10^{%s}$ sec)" % (log_n))
 
-        i = i + 1
-
     fig.subplots_adjust(left=None, bottom=None, right=None, top=None, wspace=0.3, hspace=None)
     plt.savefig("../graphs/exec-times.pdf", bbox_inches='tight', format = 'pdf')
 
 if __name__ == "__main__":
 
-    public_key_rec = None
+    # use an ArgumentParser for a nice CLI
+    parser = argparse.ArgumentParser()
+
+    # options (self-explanatory)
+    parser.add_argument(
+        "--max-keys", 
+         help = """max. nr. of client public keys to keep cached (default : 128)""")
+
+    parser.add_argument(
+        "--pipeline-threads", 
+         help = """nr. of threads evaluating requests (default : 8)""")
+
+    parser.add_argument(
+        "--max-queue", 
+         help = """max. nr. of requests waiting to be evaluated (default : 256)""")
+
+    parser.add_argument(
+        "--max-in-flight", 
+         help = """max. nr. of requests of a single connection waiting to be evaluated (or being evaluated) at once (default : %d)""" % (eventloop.MAX_IN_FLIGHT))
+
+    parser.add_argument(
+        "--overload", 
+         help = """once <max-queue> requests are waiting, 'block' (stop reading requests) or reply 'busy' (default : block)""")
+
+    parser.add_argument(
+        "--event-loop", 
+         help = """serve all connections from a single event loop thread, instead of a thread per connection""",
+         action = "store_true")
+
+    parser.add_argument(
+        "--backlog", 
+         help = """size of the listen backlog (default : 128)""")
+
+    parser.add_argument(
+        "--max-connections", 
+         help = """max. nr. of connections served at once in '--event-loop' mode (default : 1024)""")
+
+    parser.add_argument(
+        "--drain-timeout", 
+         help = """max. time (in seconds) to wait for in-flight requests on shutdown in '--event-loop' mode (default : 10)""")
+
+    parser.add_argument(
+        "--workers", 
+         help = """evaluate operations on <workers> processes (default : 0, i.e. evaluate them on the server process)""")
+
+    parser.add_argument(
+        "--chunk-size", 
+         help = """max. nr. of operations handed to a worker process at once (default : 8)""")
+
+    parser.add_argument(
+        "--max-registers", 
+         help = """max. nr. of encrypted registers kept per connection (default : 1024)""")
+
+    parser.add_argument(
+        "--register-ttl", 
+         help = """max. time (in seconds) an encrypted register is kept w/o being used (default : 600)""")
+
+    parser.add_argument(
+        "--unix-socket", 
+         help = """also listen on a unix socket, at path <unix-socket> (e.g. %s)""" % (transport.DEFAULT_UNIX_SOCKET))
+
+    parser.add_argument(
+        "--shm", 
+         help = """let clients on the same host pass large frames through shared memory rings""",
+         action = "store_true")
+
+    parser.add_argument(
+        "--backend", 
+         help = """big integer arithmetic backend : 'gmpy2', 'python' or 'auto' (default : auto, i.e. gmpy2 if installed)""")
+
+    args = parser.parse_args()
+
+    try:
+        backend.select(args.backend)
+    except ValueError, e:
+        sys.stderr.write("""%s: [ERROR] %s\n""" % (sys.argv[0], e.args[0])) 
+        sys.exit(1)
+
+    print('arithmetic backend : %s' % (backend.describe()))
+
+    if args.max_registers:
+        max_registers = int(args.max_registers)
+
+    if args.register_ttl:
+        register_ttl = float(args.register_ttl)
+
+    if args.max_keys:
+        key_cache.max_keys = int(args.max_keys)
+
+    shm_enabled = args.shm
+
+    if args.overload:
+        if args.overload not in ['block', 'busy']:
+            sys.stderr.write("""%s: [ERROR] unknown overload policy : %s\n""" % (sys.argv[0], args.overload)) 
+            parser.print_help()
+            sys.exit(1)
+        overload = args.overload
+
+    if args.max_in_flight:
+        max_in_flight = int(args.max_in_flight)
+
+    # start the worker processes before any thread is started
+    if args.workers and int(args.workers) > 0:
+        worker_pool = workers.WorkerPool(int(args.workers), 
+            chunk_size = int(args.chunk_size) if args.chunk_size else 8)
+
+    work_queue = workqueue.WorkQueue(int(args.pipeline_threads) if args.pipeline_threads else 8, 
+        max_depth = int(args.max_queue) if args.max_queue else 256)
 
     # create a TCP/IP socket
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -200,7 +822,37 @@ if __name__ == "__main__":
     print('starting up on %s port %s' % (server_address))
     sock.bind(server_address)
     # Listen for incoming connections
-    sock.listen(1)
+    sock.listen(int(args.backlog) if args.backlog else 128)
+
+    listen_socks = [sock]
+    if args.unix_socket:
+        unix_path = args.unix_socket
+        print('listening on %s' % (unix_path))
+        unix_sock = transport.listen_unix(unix_path, int(args.backlog) if args.backlog else 128)
+        listen_socks.append(unix_sock)
+
+    if args.event_loop:
+
+        event_loop = eventloop.EventLoop(listen_socks, EventConnection, work_queue, 
+            max_connections = int(args.max_connections) if args.max_connections else 1024, 
+            max_in_flight = max_in_flight, backpressure = (overload == 'block'))
+
+        print('serving connections from event loop...')
+        event_loop.run(drain_timeout = float(args.drain_timeout) if args.drain_timeout else 10.0)
+
+        work_queue.close()
+        work_queue.join()
+
+        if worker_pool is not None:
+            worker_pool.close()
+
+        if unix_sock is not None:
+            os.unlink(unix_path)
+
+        sys.exit(0)
+
+    if unix_sock is not None:
+        thread.start_new_thread(accept_unix_connections, (unix_sock,))
 
     while True:
 
@@ -0,0 +1,111 @@
+import sys
+import argparse
+import socket
+import time
+import json
+
+# custom imports
+import wire
+import transport
+
+# polls a running server for its statistics (w/ 'stats' requests, over a
+# connection of its own), and prints operation and phase latency quantiles,
+# along w/ the server's counters
+
+def get_stats(sock, reader):
+
+    request = {}
+    request['type'] = 'stats'
+    transport.send_frame(sock, wire.encode(request))
+
+    return wire.decode(reader.recv_frame(sock))
+
+def print_stats(stats):
+
+    counters = stats['counters']
+    print('uptime : %.1f sec, %s' % (counters.pop('uptime'),
+        ', '.join('%s : %d' % (name, value) for name, value in sorted(counters.items()))))
+    print('key cache : %(keys)d keys, %(hits)d hits, %(misses)d misses' % stats['key_cache'])
+    print('arithmetic backend : %s' % (stats.get('backend', 'unknown')))
+
+    # older servers don't have a work queue
+    if 'queue' in stats:
+        queue = stats['queue']
+        print('queue : depth %d (max. %d, p99 on arrival %.0f), %d rejected, wait p50 %.3f ms, p99 %.3f ms' % (
+            queue['depth'], queue['max_depth'], queue['depths']['p99'], queue['rejected'], 
+            queue['wait']['p50'] * 1000.0, queue['wait']['p99'] * 1000.0))
+
+    print('%-12s %-10s %10s %10s %10s %10s %10s %10s' % ('mode', 'op', 'count', 'mean (ms)', 'p50 (ms)', 'p90 (ms)', 'p99 (ms)', 'max (ms)'))
+
+    rows = []
+    for mode, ops in sorted(stats['operations'].items()):
+        for operation, summary in sorted(ops.items()):
+            rows.append((mode, operation, summary))
+
+    for phase, summary in sorted(stats['phases'].items()):
+        rows.append(('phase', phase, summary))
+
+    for name, operation, summary in rows:
+        print('%-12s %-10s %10d %10.3f %10.3f %10.3f %10.3f %10.3f' % (name, operation, summary['count'],
+            summary['mean'] * 1000.0, summary['p50'] * 1000.0, summary['p90'] * 1000.0,
+            summary['p99'] * 1000.0, summary['max'] * 1000.0))
+
+if __name__ == "__main__":
+
+    # use an ArgumentParser for a nice CLI
+    parser = argparse.ArgumentParser()
+
+    # options (self-explanatory)
+    parser.add_argument(
+        "--server",
+         help = """<host>:<port> of the server (default : localhost:10000)""")
+
+    parser.add_argument(
+        "--interval",
+         help = """poll the server every <interval> seconds (default : 0, i.e. poll once)""")
+
+    parser.add_argument(
+        "--json",
+         help = """print the raw statistics, in json""",
+         action = "store_true")
+
+    args = parser.parse_args()
+
+    host, port = (args.server if args.server else 'localhost:10000').rsplit(':', 1)
+    interval = float(args.interval) if args.interval else 0.0
+
+    sock = socket.create_connection((host, int(port)))
+    reader = transport.FrameReader()
+
+    try:
+
+        while True:
+
+            stats = get_stats(sock, reader)
+
+            if args.json:
+                print(json.dumps(stats, sort_keys = True))
+            else:
+                print_stats(stats)
+
+            if interval <= 0.0:
+                break
+
+            time.sleep(interval)
+            print('')
+
+    except KeyboardInterrupt:
+        pass
+
+    except socket.error, e:
+        print('error occurred : %s. aborting.' % (e))
+        sock.close()
+        sys.exit(1)
+
+    # terminate the connection
+    terminate = {}
+    terminate['type'] = 'terminate'
+    transport.send_frame(sock, wire.encode(terminate))
+
+    sock.close()
+    sys.exit(0)
@@ -0,0 +1,92 @@
+import os
+import sys
+import socket
+import signal
+import subprocess
+import tempfile
+import time
+import unittest
+
+# custom imports
+import wire
+import tracefile
+import replay
+
+# records a batch w/ more operations than version 1 traces had room for, and
+# replays it against a server (started on port 10000, w/ the same python).
+# run from this directory : python -m unittest test_tracefile
+
+NR_OPS = 70000
+SERVER_ADDRESS = ('localhost', 10000)
+
+def large_batch(nr_ops):
+
+    message = {}
+    message['type'] = 'batch'
+    message['mode'] = 'unencrypted'
+    message['ops'] = [ {'operation' : '+', 'operand_1' : float(i), 'operand_2' : 1.0} for i in xrange(nr_ops) ]
+
+    return message
+
+class LargeBatchTest(unittest.TestCase):
+
+    def setUp(self):
+
+        fd, self.path = tempfile.mkstemp(suffix = '.trace')
+        os.close(fd)
+
+        message = large_batch(NR_OPS)
+        writer = tracefile.TraceWriter(self.path, {'format' : 'json'})
+        writer.record(message, wire.encode(message))
+        writer.close()
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_record(self):
+
+        metadata, records = tracefile.load(self.path)
+
+        self.assertFalse(metadata.get('truncated'))
+        self.assertEqual(len(records), 1)
+
+        gap, flags, nr_ops, request_id, body = records[0]
+        self.assertEqual(nr_ops, NR_OPS)
+        self.assertTrue(flags & tracefile.TRACE_REPLY)
+        self.assertEqual(len(wire.decode(body)['ops']), NR_OPS)
+
+    def test_replay(self):
+
+        server = subprocess.Popen([sys.executable, 'server.py'], stdout = open(os.devnull, 'w'), stderr = subprocess.STDOUT)
+
+        try:
+            # wait for the server to listen
+            deadline = time.time() + 10.0
+            while True:
+                try:
+                    socket.create_connection(SERVER_ADDRESS).close()
+                    break
+                except socket.error:
+                    if time.time() > deadline or server.poll() is not None:
+                        self.fail('server did not start')
+                    time.sleep(0.1)
+
+            metadata, records = tracefile.load(self.path)
+
+            stats = replay.ReplayStats()
+            connection = replay.ReplayConnection('tcp', SERVER_ADDRESS, None, records, stats)
+            connection.start(None, 1, 0)
+            lost = connection.close(60.0)
+
+            self.assertEqual(lost, 0)
+            self.assertEqual(stats.unmatched, 0)
+            self.assertEqual(dict(stats.errors), {})
+            self.assertEqual(stats.responses, 1)
+            self.assertEqual(stats.ops, NR_OPS)
+
+        finally:
+            server.send_signal(signal.SIGINT)
+            server.wait()
+
+if __name__ == "__main__":
+    unittest.main()
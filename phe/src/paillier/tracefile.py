@@ -0,0 +1,131 @@
+import json
+import struct
+import threading
+import time
+
+# traces of the request stream a client sends to the server (see
+# '--record' in client.py, and replay.py), so that a run can be played back
+# against a server, over and over, w/o a private key or any encryption work.
+#
+# a trace is a header (TRACE_MAGIC, version and the length of the json
+# metadata, e.g. key id and wire format), the metadata, and a record per
+# frame sent to the server : the time since the previous frame, flags, nr.
+# of operations in the frame, its request id (0 if none), and the frame
+# body, exactly as it was sent (i.e. already encoded, w/ ciphertexts).
+#
+# frames which only make sense for the connection they were sent on (e.g.
+# 'shm' setup) aren't recorded, nor are 'plot' and 'terminate' messages :
+# replay.py closes connections on its own.
+
+TRACE_MAGIC = 'PHETRACE'
+TRACE_VERSION = 2
+TRACE_HEADER = struct.Struct('!8sBI')
+# time since the previous record (in microseconds), flags, nr. of
+# operations, request id and body length
+TRACE_RECORD = struct.Struct('!IBIII')
+# version 1 traces only had room for 65535 operations per frame
+TRACE_RECORDS = {1 : struct.Struct('!IBHII'), TRACE_VERSION : TRACE_RECORD}
+# the server replies to the frame
+TRACE_REPLY = 0x01
+MAX_GAP = 2**32 - 1
+
+SKIPPED_TYPES = ['shm', 'plot', 'terminate']
+
+# nr. of operations in a message, and whether the server replies to it
+def message_info(message):
+
+    if message['type'] == 'batch':
+        nr_ops = len(message['ops'])
+    elif message['type'] in ['request', 'register_op']:
+        nr_ops = 1
+    else:
+        nr_ops = 0
+
+    reply = not (message['type'] == 'register_op' and not message.get('reply', True))
+
+    return nr_ops, reply
+
+class TraceWriter:
+
+    def __init__(self, path, metadata = {}):
+
+        self.path = path
+        self.file = open(path, 'wb')
+        self.lock = threading.Lock()
+        self.last_time = None
+        self.nr_records = 0
+        self.nr_bytes = 0
+
+        metadata = dict(metadata, created = time.time())
+        metadata = json.dumps(metadata, sort_keys = True)
+        self.file.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, len(metadata)))
+        self.file.write(metadata)
+
+    # records an (encoded) message body, sent right now
+    def record(self, message, body):
+
+        if message['type'] in SKIPPED_TYPES:
+            return
+
+        nr_ops, reply = message_info(message)
+
+        with self.lock:
+
+            now = time.time()
+            gap = now - self.last_time if self.last_time is not None else 0.0
+            self.last_time = now
+
+            self.file.write(TRACE_RECORD.pack(min(int(gap * 1000000.0), MAX_GAP),
+                TRACE_REPLY if reply else 0, nr_ops, message.get('id', 0), len(body)))
+            self.file.write(body)
+
+            self.nr_records += 1
+            self.nr_bytes += len(body)
+
+    def close(self):
+
+        with self.lock:
+            self.file.close()
+
+# reads a whole trace. records are (gap in seconds, flags, nr. of
+# operations, request id, body) tuples. raises a ValueError if the file
+# isn't a trace. if the last record is incomplete (e.g. the client was
+# killed while recording), it's left out, and metadata['truncated'] is set.
+def load(path):
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if len(data) < TRACE_HEADER.size:
+        raise ValueError('not a trace : %s' % (path))
+
+    magic, version, metadata_length = TRACE_HEADER.unpack_from(data, 0)
+    if magic != TRACE_MAGIC:
+        raise ValueError('not a trace : %s' % (path))
+    if version not in TRACE_RECORDS:
+        raise ValueError('unsupported trace version : %d' % (version))
+
+    record = TRACE_RECORDS[version]
+
+    offset = TRACE_HEADER.size
+    metadata = json.loads(data[offset:offset + metadata_length])
+    offset += metadata_length
+
+    records = []
+    while offset < len(data):
+
+        if offset + record.size > len(data):
+            metadata['truncated'] = True
+            break
+
+        gap, flags, nr_ops, request_id, length = record.unpack_from(data, offset)
+        offset += record.size
+
+        if offset + length > len(data):
+            metadata['truncated'] = True
+            break
+
+        records.append((gap / 1000000.0, flags, nr_ops, request_id, data[offset:offset + length]))
+        offset += length
+
+    return metadata, records
@@ -0,0 +1,401 @@
+import os
+import socket
+import errno
+import collections
+import itertools
+import mmap
+import struct
+import tempfile
+
+# '<body length>\r\n<body>' framing, shared by the client, the server and
+# the event loop.
+#
+# received bytes go into a preallocated bytearray (w/ recv_into()), and
+# frames are located w/ find() on the bytearray, so that the bytes of a
+# frame are copied once, when the frame body is handed to the caller (it
+# must outlive the next read, which may overwrite the buffer). a single
+# read may yield several frames.
+#
+# frames to be sent are queued as separate (header, body) chunks, and sent
+# w/ a single sendmsg() (i.e. a vectored send) if available (python 3.3+).
+# otherwise, chunks are coalesced into a single send() of up to WRITE_SIZE
+# bytes.
+#
+# client and server may also talk over a unix socket, rather than TCP, if
+# they run on the same host. on top of it, they may agree on a pair of
+# shared memory rings (see ShmChannel), through which frame bodies of
+# RING_MIN_FRAME bytes or more (e.g. batches of ciphertexts) are passed :
+# only a reference to the body in the ring goes through the socket.
+
+HAVE_SENDMSG = hasattr(socket.socket, 'sendmsg')
+
+# initial size of the receive buffer. it grows to fit larger frames.
+READ_SIZE = 65536
+# min. nr. of free bytes at the end of the buffer for a recv_into()
+MIN_READ = 4096
+# max. nr. of bytes coalesced into a single send()
+WRITE_SIZE = 65536
+# max. nr. of chunks per sendmsg()
+MAX_IOV = 64
+# a frame header is a decimal length : no need to look any further for the
+# '\r\n' that ends it
+MAX_HEADER_SIZE = 20
+
+# ways of reaching the server : 'tcp', 'unix' (unix socket) or 'shm' (unix 
+# socket, w/ frame bodies in shared memory rings)
+TRANSPORTS = ['tcp', 'unix', 'shm']
+DEFAULT_UNIX_SOCKET = '/tmp/paillier.sock'
+
+# shared memory files are created in SHM_DIR, w/ names starting w/ 
+# SHM_PREFIX (the server doesn't map any other file)
+SHM_DIR = '/dev/shm'
+SHM_PREFIX = 'paillier-'
+# default size of each ring
+RING_SIZE = 4 * 1024 * 1024
+# smaller frame bodies go through the socket as usual
+RING_MIN_FRAME = 1024
+# a reference to a frame body in a ring : RING_MARKER (which neither json 
+# nor binary message bodies start w/), followed by the position of the 
+# body in the ring's stream of bytes, and its length
+RING_MARKER = '\x00'
+RING_REFERENCE = struct.Struct('!QI')
+# each ring's read position (see ShmRing), in its own cache line
+RING_HEADER_SIZE = 64
+RING_TAIL = struct.Struct('Q')
+
+def connect(kind, server_address, unix_path = DEFAULT_UNIX_SOCKET):
+
+    if kind == 'tcp':
+        return socket.create_connection(server_address)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(unix_path)
+
+    return sock
+
+def listen_unix(path, backlog = 128):
+
+    # remove a socket left behind by a previous server
+    if os.path.exists(path):
+        os.unlink(path)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(backlog)
+
+    return sock
+
+def frame_header(body_len):
+    return str(body_len) + '\r\n'
+
+class FrameReader:
+
+    def __init__(self, size = READ_SIZE):
+
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        # unparsed bytes are in buffer[start:end]
+        self.start = 0
+        self.end = 0
+        # size of the frame at start, if its header has been parsed
+        self.body_start = None
+        self.body_end = None
+        # ring of frame bodies sent to us, if any (see ShmChannel)
+        self.ring = None
+
+    # reads whatever is available from sock into the buffer, and returns the
+    # nr. of bytes read (0 if the peer closed the connection). socket
+    # errors (e.g. EAGAIN on non blocking sockets) are raised as usual.
+    def fill(self, sock):
+
+        self.reserve()
+        read = sock.recv_into(self.view[self.end:])
+        self.end += read
+
+        return read
+
+    # makes room at the end of the buffer : unparsed bytes are moved to the
+    # beginning of the buffer, which is resized if the frame being received
+    # doesn't fit
+    def reserve(self):
+
+        if len(self.buffer) - self.end >= MIN_READ:
+            return
+
+        needed = self.end - self.start
+        if self.body_end is not None:
+            needed = max(needed, self.body_end - self.start)
+
+        if needed + MIN_READ > len(self.buffer):
+            buffer = bytearray(max(2 * len(self.buffer), needed + READ_SIZE))
+            buffer[:self.end - self.start] = self.view[self.start:self.end]
+            self.buffer = buffer
+            self.view = memoryview(self.buffer)
+        else:
+            self.buffer[:self.end - self.start] = self.view[self.start:self.end]
+
+        if self.body_end is not None:
+            self.body_start -= self.start
+            self.body_end -= self.start
+
+        self.end -= self.start
+        self.start = 0
+
+    # returns the next complete frame body in the buffer, or None
+    def next_frame(self):
+
+        if self.body_end is None:
+
+            eol = self.buffer.find('\r\n', self.start, min(self.end, self.start + MAX_HEADER_SIZE))
+            if eol < 0:
+                if self.end - self.start >= MAX_HEADER_SIZE:
+                    raise ValueError('invalid frame header : %r' % (self.view[self.start:self.start + MAX_HEADER_SIZE].tobytes()))
+                return None
+
+            self.body_start = eol + 2
+            self.body_end = self.body_start + int(self.view[self.start:eol].tobytes())
+
+        if self.end < self.body_end:
+            return None
+
+        body = self.view[self.body_start:self.body_end].tobytes()
+
+        self.start = self.body_end
+        self.body_start = self.body_end = None
+        # nothing left to parse : start over at the beginning of the buffer
+        if self.start == self.end:
+            self.start = self.end = 0
+
+        if self.ring is not None and body[:1] == RING_MARKER:
+            return self.ring.get(body)
+
+        return body
+
+    # all the complete frame bodies in the buffer
+    def frames(self):
+
+        while True:
+            body = self.next_frame()
+            if body is None:
+                return
+            yield body
+
+    # reads from a blocking socket until a complete frame is in the buffer
+    def recv_frame(self, sock):
+
+        while True:
+
+            body = self.next_frame()
+            if body is not None:
+                return body
+
+            if not self.fill(sock):
+                raise socket.error('connection closed by peer')
+
+class FrameWriter:
+
+    def __init__(self):
+
+        self.chunks = collections.deque()
+        # nr. of bytes of chunks[0] already sent
+        self.offset = 0
+        # nr. of bytes not sent yet
+        self.pending = 0
+        # ring for our frame bodies, if any (see ShmChannel)
+        self.ring = None
+
+    def add_frame(self, body):
+
+        # if the ring is full, the body goes through the socket
+        if self.ring is not None and len(body) >= RING_MIN_FRAME:
+            reference = self.ring.put(body)
+            if reference is not None:
+                body = reference
+
+        header = frame_header(len(body))
+        self.chunks.append(header)
+        self.chunks.append(body)
+        self.pending += len(header) + len(body)
+
+    # a single send() (or sendmsg()) call. returns the nr. of bytes sent.
+    # socket errors (e.g. EAGAIN on non blocking sockets) are raised as usual.
+    def write(self, sock):
+
+        if not self.chunks:
+            return 0
+
+        if HAVE_SENDMSG:
+            buffers = [ memoryview(self.chunks[0])[self.offset:] ]
+            buffers.extend(itertools.islice(self.chunks, 1, MAX_IOV))
+            sent = sock.sendmsg(buffers)
+
+        else:
+
+            # coalesce small chunks (e.g. headers), so that we don't pay a
+            # system call per chunk. a partially sent chunk is sent on its
+            # own, so that no byte is copied more than once.
+            if self.offset == 0 and len(self.chunks) > 1 and len(self.chunks[0]) < WRITE_SIZE:
+
+                chunks = []
+                size = 0
+                while self.chunks and size + len(self.chunks[0]) <= WRITE_SIZE:
+                    chunk = self.chunks.popleft()
+                    chunks.append(chunk)
+                    size += len(chunk)
+
+                if len(chunks) > 1:
+                    self.chunks.appendleft(''.join(chunks))
+                else:
+                    self.chunks.appendleft(chunks[0])
+
+            sent = sock.send(memoryview(self.chunks[0])[self.offset:])
+
+        self.consume(sent)
+        return sent
+
+    def consume(self, sent):
+
+        self.pending -= sent
+        sent += self.offset
+
+        while self.chunks and sent >= len(self.chunks[0]):
+            sent -= len(self.chunks.popleft())
+
+        self.offset = sent
+
+    # writes everything to a blocking socket
+    def flush(self, sock):
+
+        while self.pending:
+
+            try:
+                self.write(sock)
+
+            except socket.error, e:
+                if e.args[0] != errno.EINTR:
+                    raise
+
+def send_frames(sock, bodies, ring = None):
+
+    writer = FrameWriter()
+    writer.ring = ring
+    for body in bodies:
+        writer.add_frame(body)
+
+    writer.flush(sock)
+
+def send_frame(sock, body, ring = None):
+    send_frames(sock, [body], ring)
+
+# a ring of frame bodies in shared memory, w/ a single producer and a single 
+# consumer (the sending and receiving ends of a connection). positions are 
+# offsets in the (endless) stream of bytes written to the ring, so that a 
+# body at position p is at p % size in the ring. bodies are never split : 
+# a body which doesn't fit before the end of the ring starts at the 
+# beginning of the ring instead. the consumer publishes how far it has 
+# read (the tail) in the ring's header, and the producer doesn't write 
+# past it. the references sent through the socket tell the consumer where 
+# bodies are, and make sure they're written before they're read.
+class ShmRing:
+
+    def __init__(self, mm, header_offset, data_offset, size):
+
+        self.mm = mm
+        self.header_offset = header_offset
+        self.data_offset = data_offset
+        self.size = size
+        # producer only : position of the next body
+        self.head = 0
+
+    def tail(self):
+        return RING_TAIL.unpack_from(self.mm, self.header_offset)[0]
+
+    # copies body into the ring, and returns a reference to it, or None if 
+    # there's no room for it
+    def put(self, body):
+
+        length = len(body)
+        start = self.head
+
+        offset = start % self.size
+        if offset + length > self.size:
+            start += self.size - offset
+            offset = 0
+
+        if start + length - self.tail() > self.size:
+            return None
+
+        self.mm[self.data_offset + offset:self.data_offset + offset + length] = body
+        self.head = start + length
+
+        return RING_MARKER + RING_REFERENCE.pack(start, length)
+
+    # copies the body a reference points to out of the ring, and frees its 
+    # space in the ring
+    def get(self, reference):
+
+        start, length = RING_REFERENCE.unpack_from(reference, len(RING_MARKER))
+        offset = self.data_offset + start % self.size
+
+        body = self.mm[offset:offset + length]
+        RING_TAIL.pack_into(self.mm, self.header_offset, start + length)
+
+        return body
+
+# a pair of rings in a shared memory file : one for frames from client to 
+# server, and one for frames from server to client. the client creates the 
+# file, and tells the server its path (see 'shm' messages in server.py). 
+# once both ends have mapped it, the file can be removed.
+class ShmChannel:
+
+    def __init__(self, path, size = RING_SIZE, create = False):
+
+        self.path = path
+        self.size = size
+        total_size = 2 * (RING_HEADER_SIZE + size)
+
+        fd = os.open(path, os.O_RDWR)
+        try:
+            if create:
+                os.ftruncate(fd, total_size)
+            elif os.fstat(fd).st_size != total_size:
+                raise ValueError('%s is not a shared memory file of %d bytes' % (path, total_size))
+
+            self.mm = mmap.mmap(fd, total_size)
+
+        finally:
+            os.close(fd)
+
+        rings = [ ShmRing(self.mm, i * RING_HEADER_SIZE, 2 * RING_HEADER_SIZE + i * size, size) for i in xrange(2) ]
+
+        # ring 0 carries frames from client (the creator) to server
+        if create:
+            self.outbound, self.inbound = rings
+        else:
+            self.inbound, self.outbound = rings
+
+    @classmethod
+    def create(cls, size = RING_SIZE):
+
+        fd, path = tempfile.mkstemp(prefix = SHM_PREFIX, dir = SHM_DIR)
+        os.close(fd)
+
+        return cls(path, size, create = True)
+
+    # opens a channel created by the other end, as long as it's one of ours
+    @classmethod
+    def open(cls, path, size):
+
+        path = os.path.realpath(path)
+        if os.path.dirname(path) != SHM_DIR or not os.path.basename(path).startswith(SHM_PREFIX):
+            raise ValueError('not a shared memory file : %s' % (path))
+
+        return cls(path, size)
+
+    def unlink(self):
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def close(self):
+        self.mm.close()
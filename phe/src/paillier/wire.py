@@ -0,0 +1,304 @@
+import json # for the app level protocol
+import struct
+import binascii
+
+# wire formats for message bodies. both are carried in the same
+# '<body length>\r\n<body>' frames, and both endpoints agree on the format
+# at key registration. control messages (register, terminate, errors,
+# etc.) are always json : binary bodies never start w/ '{', so the
+# receiving end can tell them apart by looking at the 1st byte of the body.
+FORMATS = ['json', 'binary']
+
+# binary message types
+REQUEST, BATCH, RESPONSE, BATCH_RESPONSE, REGISTER_OP = range(1, 6)
+MESSAGE_TYPES = {
+    REQUEST : 'request',
+    BATCH : 'batch',
+    RESPONSE : 'response',
+    BATCH_RESPONSE : 'response',
+    REGISTER_OP : 'register_op'
+}
+# message types which may be sent in binary
+BINARY_TYPES = ['request', 'batch', 'response', 'register_op']
+
+MODES = ['unencrypted', 'encrypted']
+# scalar operations, followed by vector and packed operations (see 
+# operations.py)
+OPERATIONS = ['x*', '+', '+*', 'sum', 'dot', 'mean', 'p+', 'px*', 'p+*']
+VECTOR_OPERATIONS = ['sum', 'dot', 'mean']
+PACKED_OPERATIONS = ['p+', 'px*', 'p+*']
+
+# binary header : message type, mode, operation (single requests and
+# responses only), ciphertext width (in bytes), request id (0 if none), key
+# id (raw bytes of the key fingerprint) and nr. of operations (or results)
+# in the message
+HEADER = struct.Struct('!BBBHI8sH')
+# encrypted values are sent as exponent + fixed-width big-endian ciphertext
+EXPONENT = struct.Struct('!i')
+# non encrypted values are sent as doubles
+SCALAR = struct.Struct('!d')
+# operands of vector operations are sent as the nr. of values, followed by 
+# the values
+VECTOR_LENGTH = struct.Struct('!I')
+
+NULL_KEY_ID = '\x00' * 8
+
+# operations on server-side registers (see registers.py). in binary, the 
+# operation goes in the header's operation field, the nr. of operations 
+# field carries the flags below, and the body carries the register name 
+# (length + utf-8 bytes), followed by the operand, if any.
+REGISTER_OPS = ['add_to', 'scale', 'read', 'delete']
+REGISTER_NAME_LENGTH = struct.Struct('!B')
+REGISTER_REPLY, REGISTER_ENCRYPTED, REGISTER_OPERAND = 0x01, 0x02, 0x04
+
+# nr. of bytes needed to hold any ciphertext of a given public key, i.e.
+# any integer < n^2
+def ciphertext_width(public_key):
+    return (public_key.nsquare.bit_length() + 7) // 8
+
+def is_encrypted(mode, operation, operand):
+
+    if mode != 'encrypted':
+        return False
+
+    # operand 1 is always encrypted, operand 2 only for plain additions. 
+    # operand 2 of packed operations is sent as an encrypted value too, 
+    # since it's a large integer (the plaintext or multiplier).
+    return operand == 1 or operation == '+' or operation in PACKED_OPERATIONS
+
+def stringify_operand(operation, value):
+
+    if operation in VECTOR_OPERATIONS:
+        return [ (str(c), e) for c, e in value ]
+
+    return (str(value[0]), value[1])
+
+def encode_vector(values, encrypted, width):
+    return VECTOR_LENGTH.pack(len(values)) + ''.join(encode_value(value, encrypted, width) for value in values)
+
+def decode_vector(body, offset, encrypted, width):
+
+    length = VECTOR_LENGTH.unpack_from(body, offset)[0]
+    offset += VECTOR_LENGTH.size
+
+    values = []
+    for i in xrange(length):
+        value, offset = decode_value(body, offset, encrypted, width)
+        values.append(value)
+
+    return values, offset
+
+def encode_operand(operation, value, encrypted, width):
+
+    if operation in VECTOR_OPERATIONS:
+        return encode_vector(value, encrypted, width)
+
+    return encode_value(value, encrypted, width)
+
+def decode_operand(operation, body, offset, encrypted, width):
+
+    if operation in VECTOR_OPERATIONS:
+        return decode_vector(body, offset, encrypted, width)
+
+    return decode_value(body, offset, encrypted, width)
+
+def encode_value(value, encrypted, width):
+
+    if encrypted:
+        ciphertext, exponent = value
+        return EXPONENT.pack(int(exponent)) + binascii.unhexlify('%0*x' % (2 * width, int(ciphertext)))
+    else:
+        return SCALAR.pack(float(value))
+
+def decode_value(body, offset, encrypted, width):
+
+    if encrypted:
+        exponent = EXPONENT.unpack_from(body, offset)[0]
+        offset += EXPONENT.size
+        ciphertext = int(binascii.hexlify(body[offset:offset + width]), 16)
+        return (ciphertext, exponent), offset + width
+    else:
+        return SCALAR.unpack_from(body, offset)[0], offset + SCALAR.size
+
+def encode_binary(message, width):
+
+    mode = message['mode']
+    encrypted = (mode == 'encrypted')
+
+    if 'key_id' in message:
+        key_id = binascii.unhexlify(message['key_id'])
+    else:
+        key_id = NULL_KEY_ID
+
+    items = []
+
+    if message['type'] == 'register_op':
+
+        msg_type = REGISTER_OP
+        operation = None
+        name = message['register'].encode('utf-8')
+        items.append(REGISTER_NAME_LENGTH.pack(len(name)) + name)
+
+        count = REGISTER_REPLY if message.get('reply', True) else 0
+        if 'operand' in message:
+            count |= REGISTER_OPERAND
+            if message.get('encrypted'):
+                count |= REGISTER_ENCRYPTED
+            items.append(encode_value(message['operand'], message.get('encrypted'), width))
+
+    elif message['type'] == 'request':
+
+        msg_type = REQUEST
+        operation = message['operation']
+        items.append(encode_operand(operation, message['operand_1'], is_encrypted(mode, operation, 1), width))
+        items.append(encode_operand(operation, message['operand_2'], is_encrypted(mode, operation, 2), width))
+        count = 1
+
+    elif message['type'] == 'batch':
+
+        msg_type = BATCH
+        operation = None
+        for op in message['ops']:
+            items.append(chr(OPERATIONS.index(op['operation'])))
+            items.append(encode_operand(op['operation'], op['operand_1'], is_encrypted(mode, op['operation'], 1), width))
+            items.append(encode_operand(op['operation'], op['operand_2'], is_encrypted(mode, op['operation'], 2), width))
+        count = len(message['ops'])
+
+    elif 'results' in message:
+
+        msg_type = BATCH_RESPONSE
+        operation = None
+        for result in message['results']:
+            items.append(encode_value(result, encrypted, width))
+        count = len(message['results'])
+
+    else:
+
+        msg_type = RESPONSE
+        operation = message['operation']
+        items.append(encode_value(message['result'], encrypted, width))
+        count = 1
+
+    if msg_type == REGISTER_OP:
+        op_code = REGISTER_OPS.index(message['op'])
+    elif operation is None:
+        op_code = 0
+    else:
+        op_code = OPERATIONS.index(operation)
+
+    header = HEADER.pack(msg_type, MODES.index(mode), op_code, width, message.get('id', 0), key_id, count)
+
+    return header + ''.join(items)
+
+def decode_binary(body):
+
+    msg_type, mode, op_code, width, request_id, key_id, count = HEADER.unpack_from(body, 0)
+    offset = HEADER.size
+
+    message = {}
+    message['type'] = MESSAGE_TYPES[msg_type]
+    message['mode'] = mode = MODES[mode]
+    encrypted = (mode == 'encrypted')
+
+    if request_id != 0:
+        message['id'] = request_id
+
+    if key_id != NULL_KEY_ID:
+        message['key_id'] = binascii.hexlify(key_id)
+
+    if msg_type == REGISTER_OP:
+
+        message['op'] = REGISTER_OPS[op_code]
+        length = REGISTER_NAME_LENGTH.unpack_from(body, offset)[0]
+        offset += REGISTER_NAME_LENGTH.size
+        message['register'] = body[offset:offset + length].decode('utf-8')
+        offset += length
+
+        message['reply'] = bool(count & REGISTER_REPLY)
+        if count & REGISTER_OPERAND:
+            message['encrypted'] = bool(count & REGISTER_ENCRYPTED)
+            message['operand'], offset = decode_value(body, offset, message['encrypted'], width)
+
+    elif msg_type == REQUEST:
+
+        message['operation'] = operation = OPERATIONS[op_code]
+        message['operand_1'], offset = decode_operand(operation, body, offset, is_encrypted(mode, operation, 1), width)
+        message['operand_2'], offset = decode_operand(operation, body, offset, is_encrypted(mode, operation, 2), width)
+
+    elif msg_type == BATCH:
+
+        message['ops'] = []
+        for i in xrange(count):
+            op = {}
+            op['operation'] = operation = OPERATIONS[ord(body[offset])]
+            op['operand_1'], offset = decode_operand(operation, body, offset + 1, is_encrypted(mode, operation, 1), width)
+            op['operand_2'], offset = decode_operand(operation, body, offset, is_encrypted(mode, operation, 2), width)
+            message['ops'].append(op)
+
+    elif msg_type == BATCH_RESPONSE:
+
+        message['results'] = []
+        for i in xrange(count):
+            result, offset = decode_value(body, offset, encrypted, width)
+            message['results'].append(result)
+
+    else:
+
+        message['operation'] = OPERATIONS[op_code]
+        message['result'], offset = decode_value(body, offset, encrypted, width)
+
+    return message
+
+# in json, ciphertexts travel as decimal strings
+def stringify_ciphertexts(message):
+
+    if message.get('mode') != 'encrypted' or message['type'] not in BINARY_TYPES:
+        return message
+
+    message = dict(message)
+    mode = message['mode']
+
+    if message['type'] == 'register_op':
+        if message.get('encrypted'):
+            message['operand'] = (str(message['operand'][0]), message['operand'][1])
+
+    elif message['type'] == 'request':
+        if is_encrypted(mode, message['operation'], 2):
+            message['operand_2'] = stringify_operand(message['operation'], message['operand_2'])
+        message['operand_1'] = stringify_operand(message['operation'], message['operand_1'])
+
+    elif message['type'] == 'batch':
+
+        ops = []
+        for op in message['ops']:
+            op = dict(op)
+            if is_encrypted(mode, op['operation'], 2):
+                op['operand_2'] = stringify_operand(op['operation'], op['operand_2'])
+            op['operand_1'] = stringify_operand(op['operation'], op['operand_1'])
+            ops.append(op)
+
+        message['ops'] = ops
+
+    elif 'results' in message:
+        message['results'] = [ (str(c), e) for c, e in message['results'] ]
+
+    else:
+        message['result'] = (str(message['result'][0]), message['result'][1])
+
+    return message
+
+# encodes a message body in the given format. control messages are always
+# encoded in json.
+def encode(message, fmt = 'json', width = 0):
+
+    if fmt == 'binary' and message['type'] in BINARY_TYPES:
+        return encode_binary(message, width)
+
+    return json.dumps(stringify_ciphertexts(message))
+
+def decode(body):
+
+    if body[:1] == '{':
+        return json.loads(body)
+
+    return decode_binary(body)
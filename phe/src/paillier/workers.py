@@ -0,0 +1,71 @@
+import os
+import signal
+import multiprocessing
+
+from phe import paillier # for hpe operations
+
+# custom imports
+import operations
+
+# a pool of worker processes which evaluate operations, so that the server 
+# isn't limited to a single core by the GIL. operations are handed to the 
+# workers in chunks, along w/ the key they were encrypted with.
+
+# per worker process : key id -> paillier.PaillierPublicKey, so that each 
+# worker builds a key object only once
+worker_keys = {}
+
+def init_worker():
+    # SIGINT is handled by the server process (see server.py)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def get_worker_key(key):
+
+    if key is None:
+        return None
+
+    key_id, g, n = key
+    if key_id not in worker_keys:
+        worker_keys[key_id] = paillier.PaillierPublicKey(g = g, n = n)
+
+    return worker_keys[key_id]
+
+# runs on a worker process
+def evaluate_chunk(task):
+
+    key, mode, ops, exponent = task
+    return operations.process_operations(mode, ops, get_worker_key(key), exponent)
+
+class WorkerPool:
+
+    def __init__(self, nr_workers = None, chunk_size = 8):
+
+        if nr_workers is None:
+            nr_workers = multiprocessing.cpu_count()
+
+        self.nr_workers = nr_workers
+        self.chunk_size = chunk_size
+        self.pool = multiprocessing.Pool(nr_workers, initializer = init_worker)
+
+    # same as operations.process_operations(), but spread across the worker 
+    # processes. blocks until all chunks are evaluated. safe to call from 
+    # several threads at once.
+    def process_operations(self, mode, ops, public_key_rec = None, key_id = None, exponent = None):
+
+        key = None
+        if public_key_rec is not None:
+            key = (key_id, public_key_rec.g, public_key_rec.n)
+
+        tasks = []
+        for i in xrange(0, len(ops), self.chunk_size):
+            tasks.append((key, mode, ops[i:i + self.chunk_size], exponent))
+
+        results = []
+        for chunk_results in self.pool.map(evaluate_chunk, tasks, chunksize = 1):
+            results.extend(chunk_results)
+
+        return results
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
@@ -0,0 +1,116 @@
+import threading
+import time
+
+from collections import deque
+
+# custom imports
+import histogram
+
+# a bounded queue of jobs, between the threads which read requests off the
+# sockets and a fixed nr. of threads which evaluate them (the compute
+# stage). once the queue holds max_depth jobs, it stops taking new ones :
+# submitters either wait for room (i.e. stop reading from their sockets, so
+# that clients are held back by TCP flow control), or get turned away (so
+# that clients can be told the server is busy). either way, the amount of
+# queued work (and so, the time a request waits before it's evaluated)
+# stays bounded under overload.
+
+class WorkQueue:
+
+    def __init__(self, nr_threads = 8, max_depth = 256):
+
+        self.max_depth = max_depth
+
+        # (func, args, callback, time of submission)
+        self.jobs = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+
+        # time jobs wait in the queue, and queue depth seen by each job on
+        # submission
+        self.wait_times = histogram.Histogram()
+        self.depths = histogram.Histogram()
+        self.rejected = 0
+
+        self.threads = []
+        for i in xrange(nr_threads):
+            thread = threading.Thread(target = self.run)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def full(self):
+        return len(self.jobs) >= self.max_depth
+
+    def depth(self):
+        return len(self.jobs)
+
+    # queues func(*args), to be run on one of the queue's threads, followed
+    # by callback(result), if any. returns False if the queue is full and
+    # block is False (or if the queue is closed), True otherwise.
+    def submit(self, func, args, callback = None, block = True):
+
+        with self.cond:
+
+            while self.full() and block and not self.closed:
+                self.cond.wait()
+
+            if self.full() or self.closed:
+                self.rejected += 1
+                return False
+
+            self.depths.record(len(self.jobs))
+            self.jobs.append((func, args, callback, time.time()))
+            self.cond.notify_all()
+
+        return True
+
+    def run(self):
+
+        while True:
+
+            with self.cond:
+
+                while not self.jobs and not self.closed:
+                    self.cond.wait()
+
+                if not self.jobs:
+                    return
+
+                func, args, callback, submit_time = self.jobs.popleft()
+                # there's room for submitters waiting on a full queue
+                self.cond.notify_all()
+
+            self.wait_times.record(time.time() - submit_time)
+
+            try:
+                result = func(*args)
+            except Exception, e:
+                print('workqueue::run() : error occurred: %s' % (e))
+                continue
+
+            if callback is not None:
+                callback(result)
+
+    def summary(self):
+
+        summary = {}
+        summary['depth'] = len(self.jobs)
+        summary['max_depth'] = self.max_depth
+        summary['rejected'] = self.rejected
+        summary['wait'] = self.wait_times.summary()
+        summary['depths'] = self.depths.summary()
+
+        return summary
+
+    # lets the queued jobs finish, and stops the threads
+    def close(self):
+
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def join(self):
+
+        for thread in self.threads:
+            thread.join()